@@ -0,0 +1,64 @@
+import os
+from pathlib import Path
+import json
+import urllib.request
+from concurrent.futures import Future
+from telemetry import configure_logging
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+# Configure logging
+configure_logging()
+
+# Base URL of a running api_server.py; when unset the UI queries the corpus in-process
+API_URL = os.getenv("KAVACH_API_URL", "")
+API_TIMEOUT_SECONDS = float(os.getenv("KAVACH_API_TIMEOUT", 120))
+
+def _post(api_url, path, payload):
+    request = urllib.request.Request(
+        f"{api_url.rstrip('/')}{path}",
+        data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST'
+    )
+    return urllib.request.urlopen(request, timeout=API_TIMEOUT_SECONDS)
+
+def health(api_url=API_URL):
+    with urllib.request.urlopen(f"{api_url.rstrip('/')}/health", timeout=API_TIMEOUT_SECONDS) as response:
+        return json.load(response)
+
+def query(query, api_url=API_URL):
+    """
+    Returns {'answer', 'pages', 'highlights', 'images'} for one query.
+    """
+    with _post(api_url, '/query', {'query': query}) as response:
+        return json.load(response)
+
+def batch_query(queries, api_url=API_URL):
+    with _post(api_url, '/batch', {'queries': queries}) as response:
+        return json.load(response)['results']
+
+def get_kavach_decision_stream(query, api_url=API_URL):
+    """
+    Same return shape as chatbot.get_kavach_decision_stream, served by the API: (stream, pages, images_future, highlights).
+    Image paths resolve against the app directory, which the UI and API share.
+    """
+    response = _post(api_url, '/query/stream', {'query': query})
+    context = json.loads(response.readline())
+    images_future = Future()
+
+    def stream():
+        try:
+            for line in response:
+                event = json.loads(line)
+                if 'text' in event:
+                    yield event['text']
+                elif 'images' in event:
+                    images_future.set_result([BASE_DIR / path for path in event['images']])
+        finally:
+            response.close()
+            if not images_future.done():
+                images_future.set_result([])
+
+    return stream(), context['pages'], images_future, context['highlights']
@@ -0,0 +1,260 @@
+"""
+Headless HTTP/JSON API for Kavach queries, for load tests and other tools.
+
+The corpus is loaded once at startup and requests are served from a bounded worker pool.
+
+    python api_server.py --host 0.0.0.0 --port 8502
+
+Endpoints:
+    GET  /health         corpus, pool and cache status
+    GET  /metrics        stage latency histograms and cache counters in the Prometheus text format
+    POST /query          {"query": "..."} -> {"answer", "pages", "highlights", "images"}
+    POST /query/stream   same request; JSON lines: the context, then {"text": ...} as the answer grows, then the images
+    POST /batch          {"queries": ["...", ...]} -> {"results": [...]} in request order
+
+Pages are document-qualified IDs such as 'kavach:12'; image paths are relative to the app directory.
+"""
+import os
+from pathlib import Path
+import argparse
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from telemetry import configure_logging, metrics
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+# Configure logging
+configure_logging()
+
+API_HOST = os.getenv("KAVACH_API_HOST", "127.0.0.1")
+API_PORT = int(os.getenv("KAVACH_API_PORT", 8502))
+# Connections handled concurrently, and Gemini calls of one batch request run concurrently
+API_WORKERS = int(os.getenv("KAVACH_API_WORKERS", 8))
+MAX_BATCH_SIZE = int(os.getenv("KAVACH_API_MAX_BATCH", 64))
+MAX_BODY_BYTES = 1 << 20
+
+def _relative_path(path):
+    try:
+        return str(Path(path).relative_to(BASE_DIR))
+    except ValueError:
+        return str(path)
+
+class QueryService:
+    """
+    Holds the corpus loaded at startup and answers queries against it.
+    """
+
+    def __init__(self, corpus, batch_workers=API_WORKERS):
+        self.corpus = corpus
+        self.workers = batch_workers
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.served = 0
+        self.failed = 0
+
+    def _track(self, delta, failed=False):
+        with self._lock:
+            self.in_flight += delta
+            if delta < 0:
+                self.served += 1
+                self.failed += int(failed)
+
+    def stream(self, query):
+        """
+        Yields the response context (pages and highlights), then the answer as it grows, then the images.
+        """
+        from chatbot import get_kavach_decision_stream
+        self._track(1)
+        failed = True
+        try:
+            stream, pages, images_future, highlights = get_kavach_decision_stream(self.corpus, query)
+            yield {'pages': pages, 'highlights': highlights}
+            for text in stream:
+                yield {'text': text}
+            yield {'images': [_relative_path(path) for path in images_future.result()]}
+            failed = False
+        finally:
+            self._track(-1, failed)
+
+    def answer(self, query):
+        result = {'query': query, 'answer': ''}
+        for event in self.stream(query):
+            if 'text' in event:
+                result['answer'] = event['text']
+            else:
+                result.update(event)
+        return result
+
+    def answer_batch(self, queries):
+        """
+        Answers the queries with one embedding call, one search and one image scoring pass per document,
+        and returns the results in request order. A failed query gets an error answer of its own.
+        """
+        from chatbot import get_kavach_decision_batch
+        results = [None] * len(queries)
+        for _ in queries:
+            self._track(1)
+        try:
+            for position, decision, pages, images, highlights in get_kavach_decision_batch(self.corpus, queries, max_concurrency=self.workers):
+                results[position] = {
+                    'query': queries[position],
+                    'answer': decision,
+                    'pages': pages,
+                    'highlights': highlights,
+                    'images': [_relative_path(path) for path in images],
+                }
+                self._track(-1)
+        finally:
+            # Queries never answered because the batch itself failed
+            for result in results:
+                if result is None:
+                    self._track(-1, failed=True)
+        return results
+
+    def health(self):
+        from chatbot import response_cache
+        from embedding_handler import get_embedding_stats
+        from query_cache import query_cache
+        with self._lock:
+            requests = {'in_flight': self.in_flight, 'served': self.served, 'failed': self.failed}
+        return {
+            'status': 'ok',
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'documents': [
+                {'id': shard.doc_id, 'title': shard.document['title'], 'chunks': shard.vectorstore.index.ntotal}
+                for shard in self.corpus.shards.values()
+            ],
+            'workers': self.workers,
+            'requests': requests,
+            'response_cache': response_cache.stats(),
+            'query_cache': query_cache.stats(),
+            'models': get_embedding_stats(),
+        }
+
+class PooledHTTPServer(HTTPServer):
+    """
+    HTTPServer that handles each connection on a bounded thread pool instead of a thread per request.
+    """
+
+    def __init__(self, server_address, handler_class, service, workers=API_WORKERS):
+        super().__init__(server_address, handler_class)
+        self.service = service
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='kavach-api')
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._handle, request, client_address)
+
+    def _handle(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+
+class QueryHandler(BaseHTTPRequestHandler):
+    server_version = 'KavachAPI/1.0'
+
+    def log_message(self, format, *args):
+        logging.info(f"{self.address_string()} - {format % args}")
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0 or length > MAX_BODY_BYTES:
+            raise ValueError("Request body must be a JSON object of at most 1 MB.")
+        payload = json.loads(self.rfile.read(length))
+        if not isinstance(payload, dict):
+            raise ValueError("Request body must be a JSON object.")
+        return payload
+
+    def _read_query(self, payload):
+        query = payload.get('query')
+        if not isinstance(query, str) or not query.strip():
+            raise ValueError("'query' must be a non-empty string.")
+        return query
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, self.server.service.health())
+        elif self.path == '/metrics':
+            body = metrics.render_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {'error': f"Unknown path '{self.path}'."})
+
+    def do_POST(self):
+        service = self.server.service
+        try:
+            payload = self._read_json()
+            if self.path == '/query':
+                self._send_json(200, service.answer(self._read_query(payload)))
+            elif self.path == '/query/stream':
+                query = self._read_query(payload)
+                # No Content-Length: the body is JSON lines until the connection closes
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.end_headers()
+                for event in service.stream(query):
+                    self.wfile.write(json.dumps(event).encode('utf-8') + b"\n")
+                    self.wfile.flush()
+            elif self.path == '/batch':
+                queries = payload.get('queries')
+                if not isinstance(queries, list) or not all(isinstance(query, str) and query.strip() for query in queries):
+                    raise ValueError("'queries' must be a list of non-empty strings.")
+                if len(queries) > MAX_BATCH_SIZE:
+                    raise ValueError(f"At most {MAX_BATCH_SIZE} queries per batch.")
+                self._send_json(200, {'results': service.answer_batch(queries)})
+            else:
+                self._send_json(404, {'error': f"Unknown path '{self.path}'."})
+        except (ValueError, json.JSONDecodeError) as e:
+            self._send_json(400, {'error': str(e)})
+        except Exception as e:
+            logging.error(f"Error handling {self.path}: {e}")
+            self._send_json(500, {'error': str(e)})
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve Kavach queries over HTTP/JSON.")
+    parser.add_argument('--host', default=API_HOST)
+    parser.add_argument('--port', type=int, default=API_PORT)
+    parser.add_argument('--workers', type=int, default=API_WORKERS)
+    args = parser.parse_args()
+
+    from embeddings import create_or_load_corpus
+    start = time.perf_counter()
+    corpus = create_or_load_corpus()
+    logging.info(f"Loaded {len(corpus)} document(s) in {time.perf_counter() - start:.1f}s.")
+
+    server = PooledHTTPServer((args.host, args.port), QueryHandler, QueryService(corpus, args.workers), args.workers)
+    logging.info(f"Serving on http://{args.host}:{args.port} with {args.workers} worker(s).")
+    print(f"Serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
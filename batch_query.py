@@ -0,0 +1,84 @@
+"""
+Answers a JSONL file of queries in one batched pass and streams the answers to a JSONL file.
+
+Each input line needs a 'query' field ('title' is accepted too, so requests.jsonl works as-is) and
+may carry an 'id' or 'request_id' that is copied to the output. Output lines are written as answers
+complete, so they are not in input order; 'line' gives each query's input line number.
+
+    python batch_query.py questions.jsonl answers.jsonl --concurrency 4
+"""
+import os
+from pathlib import Path
+import argparse
+import json
+import logging
+import time
+from telemetry import configure_logging
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+# Configure logging
+configure_logging()
+
+# Gemini calls in flight at once; the shared client's rate limiter still applies
+BATCH_CONCURRENCY = int(os.getenv("KAVACH_BATCH_CONCURRENCY", 4))
+
+def read_queries(queries_file):
+    """
+    Returns a list of {'line', 'id', 'query'} for the non-empty lines of a JSONL file.
+    """
+    records = []
+    with open(queries_file, 'r') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            query = record.get('query') or record.get('title')
+            if not query:
+                logging.warning(f"Skipping line {line_number} of '{queries_file}': no 'query' or 'title'.")
+                continue
+            records.append({'line': line_number, 'id': record.get('id') or record.get('request_id'), 'query': query})
+    return records
+
+def run_batch(corpus, records, output_file, concurrency=BATCH_CONCURRENCY):
+    """
+    Answers `records` against the corpus, appending one JSON line per answer to `output_file` as it completes.
+    """
+    from chatbot import get_kavach_decision_batch
+    start = time.perf_counter()
+    answered = 0
+    with open(output_file, 'w') as f:
+        results = get_kavach_decision_batch(corpus, [record['query'] for record in records], max_concurrency=concurrency)
+        for position, decision, pages, images, highlights in results:
+            record = records[position]
+            f.write(json.dumps({
+                'line': record['line'],
+                'id': record['id'],
+                'query': record['query'],
+                'answer': decision,
+                'pages': pages,
+                'highlights': highlights,
+                'images': [str(Path(image).relative_to(BASE_DIR)) for image in images],
+            }) + "\n")
+            f.flush()
+            answered += 1
+    elapsed = time.perf_counter() - start
+    logging.info(f"Answered {answered} queries in {elapsed:.1f}s ({answered / max(elapsed, 1e-9):.2f} queries/s).")
+    return answered
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of Kavach queries in one batch.")
+    parser.add_argument('queries', help="JSONL file with a 'query' or 'title' field per line")
+    parser.add_argument('output', help="JSONL file the answers are written to")
+    parser.add_argument('--concurrency', type=int, default=BATCH_CONCURRENCY)
+    args = parser.parse_args()
+
+    from embeddings import create_or_load_corpus
+    records = read_queries(args.queries)
+    corpus = create_or_load_corpus()
+    answered = run_batch(corpus, records, args.output, args.concurrency)
+    print(f"Wrote {answered} answer(s) to {args.output}")
+
+if __name__ == '__main__':
+    main()
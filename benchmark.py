@@ -0,0 +1,347 @@
+"""
+End-to-end benchmark and load test for the Kavach query path.
+
+Gemini and googletrans are replaced by deterministic offline stubs (see offline_stubs.py) unless
+--live is given, and the response cache is disabled, so every run measures the same work.
+
+Suites:
+    cold_start   create_or_load_vectorstore building into a scratch directory, then loading what it built
+    ingest       text extraction (pages/s) and image OCR + embedding (images/s) into a scratch directory
+    retrieval    per-query embedding, hybrid search and re-ranking
+    images       image scoring for the pages each query retrieved
+    highlight    chunk highlight rendering, first and repeated
+    end_to_end   get_kavach_decision with the stub LLM
+    load         concurrent simulated users: translate, answer, translate back
+
+    python benchmark.py --suites retrieval images highlight load --users 8 --output results.json
+    python benchmark.py --save-baseline benchmark_baseline.json
+    python benchmark.py --baseline benchmark_baseline.json    # exits 1 on a regression
+
+Latencies are reported as p50/p95/p99 in milliseconds.
+"""
+import os
+from pathlib import Path
+import argparse
+import json
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+ALL_SUITES = ['cold_start', 'ingest', 'retrieval', 'images', 'highlight', 'end_to_end', 'load']
+DEFAULT_SUITES = ['retrieval', 'images', 'highlight', 'end_to_end', 'load']
+DEFAULT_QUERIES = [
+    "What is the role of RFID tags in Kavach?",
+    "How does Kavach prevent signal passing at danger?",
+    "What happens when the loco pilot does not acknowledge a warning?",
+    "Explain the SoS message handling in Kavach.",
+    "What is the maximum permitted speed in shunt mode?",
+    "How does the stationary Kavach unit communicate with the loco unit?",
+    "What are the requirements for level crossing gate protection?",
+    "Describe the brake interface unit and its functions.",
+]
+# A metric regresses when it is this much worse than the baseline
+DEFAULT_TOLERANCE = 0.2
+
+def _configure_environment(live):
+    """
+    Must run before the app modules are imported, as they read these settings at import time.
+    """
+    os.environ.setdefault("KAVACH_RESPONSE_CACHE", "none")
+    # Queries repeat across iterations, so cached retrieval or translation would hide the pipeline's real cost
+    os.environ.setdefault("KAVACH_QUERY_CACHE_SIZE", "0")
+    os.environ.setdefault("KAVACH_TRANSLATION_CACHE_MAX_ENTRIES", "0")
+    if not live:
+        os.environ.setdefault("GOOGLE_GEMINI_PRO_API_KEY", "offline-benchmark")
+        # The stub has no quota, so the client's rate limiter should not throttle the load test
+        os.environ.setdefault("KAVACH_GEMINI_RPM", "1000000")
+
+def summarize(latencies):
+    """
+    Returns count, mean and p50/p95/p99 in milliseconds for a list of durations in seconds.
+    """
+    if not latencies:
+        return {'count': 0}
+    values = np.asarray(latencies) * 1000
+    return {
+        'count': len(values),
+        'mean_ms': float(values.mean()),
+        'p50_ms': float(np.percentile(values, 50)),
+        'p95_ms': float(np.percentile(values, 95)),
+        'p99_ms': float(np.percentile(values, 99)),
+    }
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+def _load_queries(queries_file):
+    if queries_file is None:
+        return list(DEFAULT_QUERIES)
+    queries = []
+    with open(queries_file, 'r') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                queries.append(record.get('query') or record.get('title'))
+    return [query for query in queries if query]
+
+def bench_cold_start(document, scratch_dir):
+    from embeddings import create_or_load_vectorstore
+    from embedding_handler import get_embedding_stats
+    kwargs = dict(
+        images_dir=str(scratch_dir / 'images'),
+        metadata_file=str(scratch_dir / 'image_metadata.json'),
+        layout_dir=str(scratch_dir / 'page_layout'),
+        doc_id=document['id'],
+    )
+    pdf_path = BASE_DIR / document['pdf']
+    vectorstore_path = scratch_dir / 'vectorstore'
+
+    create_or_load_vectorstore.clear()
+    (vectorstore, _), build_seconds = _timed(create_or_load_vectorstore, pdf_path, vectorstore_path, **kwargs)
+    create_or_load_vectorstore.clear()
+    _, load_seconds = _timed(create_or_load_vectorstore, pdf_path, vectorstore_path, **kwargs)
+    create_or_load_vectorstore.clear()
+    return {
+        'build_seconds': build_seconds,
+        'load_seconds': load_seconds,
+        'chunks': int(vectorstore.index.ntotal),
+        'model_load_seconds': sum(stats['load_seconds'] for stats in get_embedding_stats().values()),
+    }
+
+def bench_ingest(document, scratch_dir):
+    import fitz
+    from image_extractor import extract_images
+    from ingest import read_page_texts
+    pdf_path = BASE_DIR / document['pdf']
+    with fitz.open(str(pdf_path)) as doc:
+        page_count = len(doc)
+    page_texts, text_seconds = _timed(read_page_texts, pdf_path, page_count)
+    image_store, image_seconds = _timed(
+        extract_images, pdf_path, str(scratch_dir / 'images'), str(scratch_dir / 'image_metadata.json')
+    )
+    image_count = len(image_store)
+    return {
+        'pages': page_count,
+        'text_seconds': text_seconds,
+        'pages_per_second': page_count / text_seconds if text_seconds else 0.0,
+        'images': image_count,
+        'image_seconds': image_seconds,
+        'images_per_second': image_count / image_seconds if image_seconds else 0.0,
+    }
+
+def bench_retrieval(corpus, queries):
+    """
+    Returns the latency summaries and, for the following suites, each query's embedding and retrieved chunks.
+    """
+    from embedding_handler import get_huggingface_embeddings
+    from pipeline import StageTimer
+    from retrieval import retrieve
+    embeddings = get_huggingface_embeddings()
+    embed_latencies, search_latencies, rerank_latencies, total_latencies = [], [], [], []
+    retrieved = []
+    for query in queries:
+        timer = StageTimer()
+        query_embedding, embed_seconds = _timed(embeddings.embed_query, query)
+        docs, retrieve_seconds = _timed(retrieve, corpus, query, query_embedding, timer=timer)
+        durations = timer.durations()
+        embed_latencies.append(embed_seconds)
+        search_latencies.append(durations.get('retrieve', 0.0))
+        rerank_latencies.append(durations.get('rerank', 0.0))
+        total_latencies.append(embed_seconds + retrieve_seconds)
+        retrieved.append((query_embedding, docs))
+    return {
+        'embed': summarize(embed_latencies),
+        'search': summarize(search_latencies),
+        'rerank': summarize(rerank_latencies),
+        'total': summarize(total_latencies),
+    }, retrieved
+
+def _page_ids(docs):
+    from corpus import qualify_page
+    return sorted({qualify_page(doc.metadata['doc_id'], doc.metadata['page']) for doc in docs if doc.metadata.get('page')})
+
+def bench_images(corpus, retrieved):
+    latencies = []
+    found = 0
+    for query_embedding, docs in retrieved:
+        images, seconds = _timed(corpus.score_images, query_embedding, _page_ids(docs))
+        latencies.append(seconds)
+        found += len(images)
+    return {'score': summarize(latencies), 'images_found': found}
+
+def bench_highlight(corpus, retrieved):
+    from corpus import parse_page_id
+    from page_renderer import render_chunk_highlights
+    first, repeat = [], []
+    for _, docs in retrieved:
+        spans = {}
+        for doc in docs:
+            if doc.metadata.get('page') and doc.metadata.get('word_span'):
+                spans.setdefault(f"{doc.metadata['doc_id']}:{doc.metadata['page']}", []).append(doc.metadata['word_span'])
+        for page_id, word_spans in spans.items():
+            doc_id, page = parse_page_id(page_id)
+            layout_dir = corpus.shard(doc_id).layout_dir
+            first.append(_timed(render_chunk_highlights, page, word_spans, layout_dir=layout_dir)[1])
+            repeat.append(_timed(render_chunk_highlights, page, word_spans, layout_dir=layout_dir)[1])
+    return {'first': summarize(first), 'repeat': summarize(repeat)}
+
+def bench_end_to_end(corpus, queries):
+    from chatbot import get_kavach_decision
+    latencies = [_timed(get_kavach_decision, corpus, query)[1] for query in queries]
+    return {'decision': summarize(latencies)}
+
+def bench_load(corpus, queries, users, requests_per_user, translator, language='hi'):
+    """
+    Runs `users` threads, each sending `requests_per_user` queries back to back through the same
+    path as the UI: translate to English, answer, translate the answer back.
+    """
+    from chatbot import get_kavach_decision
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def user(user_number):
+        for i in range(requests_per_user):
+            query = queries[(user_number + i) % len(queries)]
+            start = time.perf_counter()
+            try:
+                english_query = translator.translate(query, dest='en')
+                decision, _, _ = get_kavach_decision(corpus, english_query)
+                translator.translate(decision, dest=language)
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                with lock:
+                    errors.append(str(e))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=user, args=(n,)) for n in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.perf_counter() - start
+    return {
+        'users': users,
+        'request': summarize(latencies),
+        'requests_per_second': len(latencies) / wall_seconds if wall_seconds else 0.0,
+        'errors': len(errors),
+    }
+
+def flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+def find_regressions(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    """
+    Compares timing and throughput metrics with the baseline. Returns (metric, baseline, current) tuples
+    for metrics that got worse by more than `tolerance`.
+    """
+    current = flatten(results)
+    regressions = []
+    for name, base_value in flatten(baseline).items():
+        value = current.get(name)
+        if value is None or not base_value:
+            continue
+        if name.endswith(('_ms', '_seconds')) and value > base_value * (1 + tolerance):
+            regressions.append((name, base_value, value))
+        elif name.endswith('_per_second') and value < base_value * (1 - tolerance):
+            regressions.append((name, base_value, value))
+    return regressions
+
+def print_report(results):
+    for suite, metrics in results.items():
+        print(f"\n[{suite}]")
+        for name, value in flatten(metrics).items():
+            print(f"  {name:<32} {value:>12.3f}" if isinstance(value, float) else f"  {name:<32} {value:>12}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark and load-test the Kavach query path.")
+    parser.add_argument('--suites', nargs='+', choices=ALL_SUITES, default=DEFAULT_SUITES)
+    parser.add_argument('--queries', help="JSONL file with a 'query' or 'title' field per line")
+    parser.add_argument('--users', type=int, default=8, help="Concurrent users in the load suite")
+    parser.add_argument('--requests-per-user', type=int, default=5)
+    parser.add_argument('--llm-latency-ms', type=float, default=800, help="Stub Gemini time to first token")
+    parser.add_argument('--translate-latency-ms', type=float, default=200, help="Stub translation latency")
+    parser.add_argument('--live', action='store_true', help="Call the real Gemini and Google Translate APIs")
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    parser.add_argument('--baseline', help="Compare with results saved by --save-baseline; exit 1 on regression")
+    parser.add_argument('--save-baseline', help="Write results to this file as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE)
+    args = parser.parse_args()
+
+    _configure_environment(args.live)
+    from corpus import load_manifest
+    from offline_stubs import StubGeminiModel, StubTranslator, install_gemini_stub
+    from translation import StubBackend, TranslationCache, TranslationService, get_translation_service
+    if args.live:
+        translator = get_translation_service('googletrans')
+    else:
+        install_gemini_stub(StubGeminiModel(first_token_seconds=args.llm_latency_ms / 1000))
+        translator = TranslationService(
+            StubBackend(StubTranslator(latency_seconds=args.translate_latency_ms / 1000)),
+            TranslationCache(path=None)
+        )
+
+    queries = _load_queries(args.queries)
+    document = load_manifest()[0]
+    results = {}
+
+    for suite in ('cold_start', 'ingest'):
+        if suite in args.suites:
+            scratch_dir = Path(tempfile.mkdtemp(prefix=f'kavach-{suite}-'))
+            try:
+                bench = bench_cold_start if suite == 'cold_start' else bench_ingest
+                results[suite] = bench(document, scratch_dir)
+            finally:
+                shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    query_suites = [suite for suite in args.suites if suite not in ('cold_start', 'ingest')]
+    if query_suites:
+        from embeddings import create_or_load_corpus
+        corpus, load_seconds = _timed(create_or_load_corpus)
+        results['corpus'] = {'load_seconds': load_seconds, 'documents': len(corpus)}
+        retrieval_results, retrieved = bench_retrieval(corpus, queries)
+        if 'retrieval' in args.suites:
+            results['retrieval'] = retrieval_results
+        if 'images' in args.suites:
+            results['images'] = bench_images(corpus, retrieved)
+        if 'highlight' in args.suites:
+            results['highlight'] = bench_highlight(corpus, retrieved)
+        if 'end_to_end' in args.suites:
+            results['end_to_end'] = bench_end_to_end(corpus, queries)
+        if 'load' in args.suites:
+            results['load'] = bench_load(corpus, queries, args.users, args.requests_per_user, translator)
+
+    print_report(results)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for name, base_value, value in regressions:
+            print(f"REGRESSION {name}: {base_value:.3f} -> {value:.3f}")
+        if regressions:
+            sys.exit(1)
+        print(f"\nNo regressions against '{args.baseline}' (tolerance {args.tolerance:.0%}).")
+
+if __name__ == '__main__':
+    main()
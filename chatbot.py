@@ -1,37 +1,35 @@
-import os
 from pathlib import Path
-import google.generativeai as genai
 import logging
-import pickle
 import numpy as np
 from embedding_handler import get_huggingface_embeddings
-from sklearn.metrics.pairwise import cosine_similarity
+import gemini_client
+from image_index import ImageIndex
+from image_store import ImageStore
+from corpus import Corpus, CorpusShard, DEFAULT_DOCUMENT, qualify_page, parse_page_id
+from pipeline import StageTimer
+from retrieval import retrieve, retrieve_batch
+from prompt_builder import build_prompt
+from response_cache import get_response_cache, make_cache_key, chunk_id
+from query_cache import query_cache
 from bs4 import BeautifulSoup
-import time
+import hashlib
+from contextlib import nullcontext
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from telemetry import configure_logging, metrics
 
 # Set Base Directory
 BASE_DIR = Path(__file__).parent
 
 # Configure logging
-log_file = BASE_DIR / 'chatbot.log'
-logging.basicConfig(
-    filename=log_file,
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
-
-# Initialize HuggingFace Embeddings
-embeddings = get_huggingface_embeddings()
-
-# Set up Google Gemini API
-api_key = os.getenv("GOOGLE_GEMINI_PRO_API_KEY")
-if not api_key:
-    raise ValueError("Please set the GOOGLE_GEMINI_PRO_API_KEY environment variable.")
-genai.configure(api_key=api_key)
-
-# Simple cache for responses
-response_cache = {}
+configure_logging()
+
+# The embedding model and the Gemini client are loaded on first use, not at import
+
+# Bounded, persistent cache for responses
+response_cache = get_response_cache()
+
+NO_RESULTS_MESSAGE = "I'm sorry, I couldn't find relevant information to answer your question."
+ERROR_MESSAGE = "Error generating response: Resource has been exhausted or an unexpected error occurred. Please try again later."
 
 def sanitize_response(response):
     """
@@ -40,108 +38,390 @@ def sanitize_response(response):
     soup = BeautifulSoup(response, "html.parser")
     return soup.get_text()
 
-def generate_kavach_response(prompt, max_retries=3):
+class IncrementalSanitizer:
+    """
+    Sanitizes a streamed response chunk by chunk. Text after an unclosed '<' or '&' is held back
+    until the tag or entity is complete, so markup split across chunks is still removed.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pending = ""
+
+    def feed(self, chunk):
+        """
+        Adds a raw chunk and returns the sanitized text accumulated so far.
+        """
+        self._pending += chunk
+        cut = len(self._pending)
+        last_open = self._pending.rfind("<")
+        if last_open != -1 and ">" not in self._pending[last_open:]:
+            cut = last_open
+        last_amp = self._pending.rfind("&", 0, cut)
+        if last_amp != -1 and ";" not in self._pending[last_amp:cut] and cut - last_amp < 10:
+            cut = last_amp
+        self.text += sanitize_response(self._pending[:cut])
+        self._pending = self._pending[cut:]
+        return self.text
+
+    def finish(self):
+        """
+        Flushes any held-back text and returns the complete sanitized response.
+        """
+        self.text += sanitize_response(self._pending)
+        self._pending = ""
+        return self.text
+
+def generate_kavach_response(prompt, max_retries=3, cache_key=None, chunk_key=None, query_embedding=None):
     """
     Generates a response using the Google Gemini API, with retry logic and caching.
+    `cache_key`/`chunk_key` come from make_cache_key; without them the prompt itself is the key.
     """
+    if cache_key is None:
+        cache_key = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
     # Check if response is cached
-    if prompt in response_cache:
-        logging.info("Returning cached response.")
-        return response_cache[prompt]
+    cached_response = response_cache.get(cache_key, chunk_key=chunk_key, query_embedding=query_embedding)
+    if cached_response is not None:
+        logging.info(f"Returning cached response. Cache stats: {response_cache.stats()}")
+        return cached_response
 
-    # Implement exponential backoff
-    wait_time = 2  # Initial wait time in seconds
-    for attempt in range(max_retries):
-        try:
-            model = genai.GenerativeModel('gemini-1.5-pro-002')
-            response = model.generate_content(prompt)
-            logging.info("Successfully generated response from Gemini Pro API.")
-            response_text = response.text
-            # Cache the response
-            response_cache[prompt] = response_text
-            return response_text
-        except Exception as e:
-            logging.error(f"API call error: {e}")
-            if attempt < max_retries - 1:
-                logging.info(f"Retrying in {wait_time} seconds (attempt {attempt + 1}/{max_retries})...")
-                time.sleep(wait_time)
-                wait_time *= 2  # Double the wait time for each retry
-            else:
-                return "Error generating response: Resource has been exhausted or an unexpected error occurred. Please try again later."
+    # The shared client handles quota, jittered backoff of retryable errors and the request deadline
+    try:
+        response_text = gemini_client.generate(prompt, max_retries=max_retries)
+        logging.info("Successfully generated response from Gemini Pro API.")
+        # Cache the response
+        response_cache.set(cache_key, response_text, chunk_key=chunk_key, query_embedding=query_embedding)
+        return response_text
+    except Exception as e:
+        logging.error(f"API call error: {e}")
+        return ERROR_MESSAGE
 
-def get_kavach_decision(vectorstore, query, page_images):
+def stream_kavach_response(prompt, max_retries=3, cache_key=None, chunk_key=None, query_embedding=None, timer=None):
     """
-    Retrieves relevant documents and images based on the user's query and generates an appropriate response.
+    Streams a response from the Google Gemini API, yielding the sanitized text accumulated so far.
+    A retry after a partial stream starts again from empty text, so callers should always render
+    the latest value rather than appending. The full response is cached once a stream completes.
+    Time spent sanitizing chunks is recorded on `timer` as the 'sanitize' stage.
     """
+    if cache_key is None:
+        cache_key = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+    def sanitize_stage():
+        return timer.stage('sanitize', nested=True, cumulative=True) if timer else nullcontext()
+
+    # Check if response is cached
+    cached_response = response_cache.get(cache_key, chunk_key=chunk_key, query_embedding=query_embedding)
+    if cached_response is not None:
+        logging.info(f"Returning cached response. Cache stats: {response_cache.stats()}")
+        with sanitize_stage():
+            text = sanitize_response(cached_response)
+        yield text
+        return
+
+    sanitizer = IncrementalSanitizer()
+    raw_chunks = []
     try:
-        logging.info(f"Received query: {query}")
-
-        # Retrieve relevant chunks from the vector store
-        retriever = vectorstore.as_retriever(search_kwargs={"k": 10})  # Increased `k` to get more relevant context.
-        relevant_docs = retriever.invoke(query)
-        logging.info(f"Number of relevant documents retrieved: {len(relevant_docs)}")
-
-        if not relevant_docs:
-            logging.warning("No relevant documents found for the query.")
-            return "I'm sorry, I couldn't find relevant information to answer your question.", [], []
-
-        # Extract unique page numbers from the relevant documents
-        pages = set()
-        combined_texts = []
-        for doc in relevant_docs:
-            page = doc.metadata.get('page')
-            if page:
-                pages.add(page)
-            combined_texts.append(doc.page_content)
-
-        combined_text = "\n".join(combined_texts)
-        logging.debug(f"Combined text for prompt: {combined_text[:500]}...")
-
-        # Embed the query to compare with image embeddings
-        query_embedding = embeddings.embed_query(query)
-        relevant_images = []
-
-        # Compare query embedding with OCR embeddings of images on the relevant pages
-        for page in pages:
-            if str(page) in page_images:
-                for image_data in page_images[str(page)]:
-                    embedding_path = Path(image_data.get('embedding_path'))
-                    image_path = Path(image_data['path'])
-
-                    if embedding_path is None or not embedding_path.exists():
-                        logging.warning(f"Embedding file '{embedding_path}' not found or missing. Skipping image '{image_path}'.")
-                        continue
+        for chunk in gemini_client.stream(prompt, max_retries=max_retries):
+            if chunk is gemini_client.RESTART:
+                # A partial stream failed and is being retried from the beginning
+                sanitizer = IncrementalSanitizer()
+                raw_chunks = []
+                yield ""
+                continue
+            raw_chunks.append(chunk)
+            with sanitize_stage():
+                text = sanitizer.feed(chunk)
+            yield text
+        with sanitize_stage():
+            text = sanitizer.finish()
+        yield text
+        logging.info("Successfully streamed response from Gemini Pro API.")
+    except Exception as e:
+        logging.error(f"API streaming error: {e}")
+        yield ERROR_MESSAGE
+        return
 
-                    try:
-                        with embedding_path.open('rb') as f:
-                            image_embedding = pickle.load(f)
+    # Cache the response only once the stream has completed
+    response_cache.set(cache_key, "".join(raw_chunks), chunk_key=chunk_key, query_embedding=query_embedding)
 
-                        # Compute cosine similarity
-                        similarity = cosine_similarity([query_embedding], [image_embedding])[0][0]
-                        logging.info(f"Similarity score for image '{image_path}': {similarity}")
+def _as_corpus(vectorstore, page_images, image_index):
+    """
+    Accepts either a Corpus or a single vector store with its image data, which becomes a one-document corpus.
+    `page_images` may be an ImageStore or image metadata in the older JSON layout.
+    """
+    if isinstance(vectorstore, Corpus):
+        return vectorstore
+    if image_index is None and isinstance(page_images, ImageStore):
+        image_index = page_images.image_index()
+    elif image_index is None:
+        logging.warning("No prebuilt image index supplied. Building one in memory from image metadata.")
+        image_index = ImageIndex.from_page_images(page_images or {})
+    return Corpus([CorpusShard(DEFAULT_DOCUMENT, vectorstore, page_images, image_index)])
 
-                        # Lowering the similarity threshold to include more relevant images 
-                        if similarity > 0.22:  # .22 is a placeholder threshold
-                            relevant_images.append(str(image_path))
-                    except Exception as e:
-                        logging.error(f"Error loading embedding from '{embedding_path}': {e}")
-                        continue
+def _score_images(corpus, query_embedding, page_ids):
+    """
+    Returns the paths of images on `page_ids` that are relevant to the query.
+    """
+    # Score every image on the relevant pages against the query in one matrix-vector product per document
+    relevant_images = corpus.score_images(query_embedding, page_ids, threshold=0.22)  # .22 is a placeholder threshold
+    logging.info(f"Number of relevant images found: {len(relevant_images)}")
+    return relevant_images
+
+def _pages_and_highlights(relevant_docs):
+    """
+    Returns the sorted document-qualified page IDs of the chunks, and the word spans of the chunks on each page.
+    """
+    # Extract unique document-qualified page IDs from the relevant documents
+    pages = set()
+    # Word ranges of the supporting chunks, stored at ingest, let the UI highlight exactly what was used
+    highlights = {}
+    for doc in relevant_docs:
+        page = doc.metadata.get('page')
+        if page:
+            page_id = qualify_page(doc.metadata['doc_id'], page)
+            pages.add(page_id)
+            if doc.metadata.get('word_span'):
+                highlights.setdefault(page_id, []).append(doc.metadata['word_span'])
+    return sorted(pages, key=parse_page_id), highlights
+
+def _prepare_decision(corpus, query, timer):
+    """
+    Retrieves relevant chunks and builds the prompt, and starts image scoring in the background so it
+    overlaps with generation. Returns None if nothing relevant was found.
+    """
+    logging.info(f"Received query: {query}")
+
+    # Embed the query once; it drives both retrieval and image scoring. Repeated queries reuse the vector
+    with timer.stage('embed_query'):
+        query_embedding = query_cache.embed(query, lambda text: get_huggingface_embeddings().embed_query(text))
+
+    # Hybrid BM25 + dense retrieval across every document shard, re-ranked down to the best few chunks,
+    # unless the same query was already answered against this version of the indexes
+    index_version = corpus.index_version
+    relevant_docs = query_cache.get_hits(query, index_version)
+    if relevant_docs is None:
+        relevant_docs = retrieve(corpus, query, query_embedding, timer=timer)
+        query_cache.set_hits(query, index_version, relevant_docs)
+    else:
+        timer.annotate(retrieval_cached=True)
+    logging.info(f"Number of relevant documents retrieved: {len(relevant_docs)}")
+
+    if not relevant_docs:
+        logging.warning("No relevant documents found for the query.")
+        timer.annotate(no_results=True)
+        return None
+
+    pages, highlights = _pages_and_highlights(relevant_docs)
+
+    # Image scoring is independent of generation, so it runs alongside it
+    images_future = timer.submit('image_scoring', _score_images, corpus, query_embedding, pages)
+
+    # Merge overlapping chunks, order them by page and trim the context to the token budget
+    with timer.stage('prompt_build'):
+        prompt, prompt_stats = build_prompt(query, relevant_docs)
+    logging.debug(f"Prompt context: {prompt[:500]}...")
+    timer.annotate(pages=len(pages), **prompt_stats)
 
-        # Formulate the final prompt for the Gemini model with clear instructions
-        prompt = (
-            f"Based on the following Kavach guidelines:\n\n{combined_text}\n\n"
-            f"Answer the query: {query}\n\n"
-            "Please provide a clear and concise answer in plain text without any HTML or markdown tags."
-        )
+    cache_key, chunk_key = make_cache_key(query, [chunk_id(doc) for doc in relevant_docs])
+    return {
+        'prompt': prompt,
+        'pages': pages,
+        'highlights': highlights,
+        'images_future': images_future,
+        'cache_key': cache_key,
+        'chunk_key': chunk_key,
+        'query_embedding': query_embedding,
+        'prompt_stats': prompt_stats,
+    }
+
+def _record_error(timer, error, report):
+    logging.error(f"[trace {timer.trace_id}] Error processing decision: {error}")
+    metrics.increment('kavach_query_errors_total', help_text="Queries that failed with an error.")
+    timer.annotate(error=str(error))
+    if report:
+        timer.report()
+
+def get_kavach_decision(vectorstore, query, page_images=None, image_index=None, timer=None):
+    """
+    Retrieves relevant documents and images based on the user's query and generates an appropriate response.
+    `vectorstore` may be a Corpus, in which case `page_images` and `image_index` are ignored.
+    Pages are returned as document-qualified IDs such as 'kavach:12'. Stages are recorded on `timer`
+    when given, and the caller reports it; otherwise the query gets its own trace.
+    """
+    owns_timer = timer is None
+    timer = timer or StageTimer()
+    try:
+        context = _prepare_decision(_as_corpus(vectorstore, page_images, image_index), query, timer)
+        if context is None:
+            if owns_timer:
+                timer.report()
+            return NO_RESULTS_MESSAGE, [], []
 
         # Generate the decision using the Gemini model
-        decision = generate_kavach_response(prompt)
+        with timer.stage('generate'):
+            decision = generate_kavach_response(
+                context['prompt'],
+                cache_key=context['cache_key'],
+                chunk_key=context['chunk_key'],
+                query_embedding=context['query_embedding']
+            )
         logging.info(f"Generated decision: {decision}")
 
         # Sanitize the decision to remove any HTML tags
-        decision = sanitize_response(decision)
+        with timer.stage('sanitize'):
+            decision = sanitize_response(decision)
+
+        relevant_images = context['images_future'].result()
+        if owns_timer:
+            timer.report()
+        return decision, context['pages'], relevant_images
+    except Exception as e:
+        _record_error(timer, e, owns_timer)
+        return f"Error processing your request: {e}", [], []
+
+def _timed_stream(stream, timer, report):
+    # The trace is reported however the stream ends, including when the caller stops reading early
+    try:
+        with timer.stage('generate'):
+            yield from stream
+    except GeneratorExit:
+        timer.annotate(cancelled=True)
+        raise
+    finally:
+        if report:
+            timer.report()
 
-        return decision, sorted(pages), relevant_images
+def get_kavach_decision_stream(vectorstore, query, page_images=None, image_index=None, timer=None):
+    """
+    Like get_kavach_decision, but returns (stream, pages, images_future, highlights). `stream` yields the
+    sanitized answer text accumulated so far as Gemini generates it; `images_future` resolves to the
+    relevant image paths, which are scored while the answer streams; `highlights` maps each page to the
+    word spans of the chunks used as context.
+    """
+    owns_timer = timer is None
+    timer = timer or StageTimer()
+    try:
+        context = _prepare_decision(_as_corpus(vectorstore, page_images, image_index), query, timer)
     except Exception as e:
-        logging.error(f"Error processing decision: {e}")
-        return f"Error processing your request: {e}", [], []
\ No newline at end of file
+        _record_error(timer, e, owns_timer)
+        return iter([f"Error processing your request: {e}"]), [], _completed([]), {}
+
+    if context is None:
+        if owns_timer:
+            timer.report()
+        return iter([NO_RESULTS_MESSAGE]), [], _completed([]), {}
+
+    stream = stream_kavach_response(
+        context['prompt'],
+        cache_key=context['cache_key'],
+        chunk_key=context['chunk_key'],
+        query_embedding=context['query_embedding'],
+        timer=timer
+    )
+    return _timed_stream(stream, timer, owns_timer), context['pages'], context['images_future'], context['highlights']
+
+def _batch_error(timer, position, error):
+    """
+    Returns the batch result of a query that failed, shaped like get_kavach_decision's error response.
+    """
+    logging.error(f"[trace {timer.trace_id}] Error processing batch query {position}: {error}")
+    metrics.increment('kavach_query_errors_total', help_text="Queries that failed with an error.")
+    return position, f"Error processing your request: {error}", [], [], {}
+
+def _retrieve_each(corpus, queries, query_matrix, timer):
+    """
+    Retrieves the queries one at a time after a batched retrieval failed, so a bad query fails alone.
+    Returns one list of chunks, or the exception raised, per query.
+    """
+    results = []
+    for position, query in enumerate(queries):
+        try:
+            results.append(retrieve(corpus, query, query_matrix[position], timer=timer))
+        except Exception as e:
+            results.append(e)
+    return results
+
+def get_kavach_decision_batch(vectorstore, queries, page_images=None, image_index=None, max_concurrency=4):
+    """
+    Answers many queries in one pass: a single embedding call for all of them, one batched search per
+    document, one image scoring product per document, then Gemini calls from at most `max_concurrency`
+    threads. Yields (position, decision, pages, images, highlights) as each answer completes, so results
+    arrive out of input order; `position` is the query's index in `queries`. A query that fails yields
+    an error message with no pages, images or highlights, and the rest of the batch is still answered.
+    """
+    corpus = _as_corpus(vectorstore, page_images, image_index)
+    timer = StageTimer(kind='batch')
+    timer.annotate(queries=len(queries))
+    try:
+        try:
+            with timer.stage('embed_query'):
+                query_matrix = np.asarray(get_huggingface_embeddings().embed_documents(list(queries)), dtype=np.float32)
+        except Exception as e:
+            timer.annotate(error=str(e))
+            for position in range(len(queries)):
+                yield _batch_error(timer, position, e)
+            return
+
+        try:
+            relevant_docs_per_query = retrieve_batch(corpus, queries, query_matrix, timer=timer)
+        except Exception as e:
+            logging.error(f"[trace {timer.trace_id}] Batched retrieval failed, retrieving queries one at a time: {e}")
+            relevant_docs_per_query = _retrieve_each(corpus, queries, query_matrix, timer)
+
+        # Each entry is (prompt, pages, highlights, cache keys), or the exception that query failed with
+        contexts = []
+        with timer.stage('prompt_build'):
+            for query, relevant_docs in zip(queries, relevant_docs_per_query):
+                if isinstance(relevant_docs, Exception):
+                    contexts.append(relevant_docs)
+                    continue
+                try:
+                    pages, highlights = _pages_and_highlights(relevant_docs)
+                    prompt = build_prompt(query, relevant_docs)[0] if relevant_docs else None
+                    contexts.append((prompt, pages, highlights, make_cache_key(query, [chunk_id(doc) for doc in relevant_docs])))
+                except Exception as e:
+                    contexts.append(e)
+
+        with timer.stage('image_scoring'):
+            pages_per_query = [[] if isinstance(context, Exception) else context[1] for context in contexts]
+            try:
+                images_per_query = corpus.score_images_batch(query_matrix, pages_per_query, threshold=0.22)
+            except Exception as e:
+                # Answers are still useful without images
+                logging.error(f"[trace {timer.trace_id}] Error scoring images for the batch: {e}")
+                images_per_query = [[] for _ in queries]
+
+        with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='kavach-batch-llm') as llm_pool:
+            futures = {}
+            for position, context in enumerate(contexts):
+                if isinstance(context, Exception):
+                    yield _batch_error(timer, position, context)
+                    continue
+                prompt, pages, highlights, (cache_key, chunk_key) = context
+                if prompt is None:
+                    yield position, NO_RESULTS_MESSAGE, [], [], {}
+                    continue
+                future = llm_pool.submit(
+                    generate_kavach_response, prompt,
+                    cache_key=cache_key, chunk_key=chunk_key, query_embedding=query_matrix[position]
+                )
+                futures[future] = position
+
+            with timer.stage('generate'):
+                for future in as_completed(futures):
+                    position = futures[future]
+                    _, pages, highlights, _ = contexts[position]
+                    try:
+                        decision = sanitize_response(future.result())
+                    except Exception as e:
+                        yield _batch_error(timer, position, e)
+                        continue
+                    yield position, decision, pages, images_per_query[position], highlights
+    finally:
+        timer.report()
+
+def _completed(result):
+    future = Future()
+    future.set_result(result)
+    return future
@@ -0,0 +1,202 @@
+import os
+from pathlib import Path
+import json
+import logging
+import numpy as np
+from telemetry import configure_logging
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+# Configure logging
+configure_logging()
+
+MANIFEST_FILE = Path(os.getenv("KAVACH_CORPUS_MANIFEST", BASE_DIR / 'corpus.json'))
+
+# The original single-document layout, used when there is no manifest and as the entry for 'kavach'
+DEFAULT_DOCUMENT = {
+    'id': 'kavach',
+    'title': 'Kavach Guidelines',
+    'pdf': 'kavach_guidelines.pdf',
+    'vectorstore': 'kavach_vectorstore',
+    'images_dir': 'extracted_images',
+    # The image store, page hashes and OCR journal are named after this; the .json itself is the pre-store layout
+    'metadata_file': 'image_metadata.json',
+    'layout_dir': 'page_layout',
+}
+
+def _document_defaults(doc_id):
+    """
+    Every other document gets its own shard directory, so file names never collide across documents.
+    """
+    if doc_id == DEFAULT_DOCUMENT['id']:
+        return dict(DEFAULT_DOCUMENT)
+    shard_dir = f"shards/{doc_id}"
+    return {
+        'id': doc_id,
+        'title': doc_id,
+        'vectorstore': f"{shard_dir}/vectorstore",
+        'images_dir': f"{shard_dir}/images",
+        'metadata_file': f"{shard_dir}/image_metadata.json",
+        'layout_dir': f"{shard_dir}/page_layout",
+    }
+
+def load_manifest(manifest_file=MANIFEST_FILE):
+    """
+    Returns the documents listed in the corpus manifest, e.g.
+    {"documents": [{"id": "kavach", "pdf": "kavach_guidelines.pdf"}, {"id": "gr-2020", "pdf": "manuals/gr_2020.pdf"}]}
+    Paths are relative to the app directory. Without a manifest the corpus is the Kavach guidelines alone.
+    """
+    manifest_file = Path(manifest_file)
+    if not manifest_file.exists():
+        return [dict(DEFAULT_DOCUMENT)]
+
+    with manifest_file.open('r') as f:
+        entries = json.load(f)['documents']
+
+    documents = []
+    seen = set()
+    for entry in entries:
+        doc_id = entry['id']
+        if ':' in doc_id or '/' in doc_id:
+            raise ValueError(f"Document id '{doc_id}' may not contain ':' or '/'.")
+        if doc_id in seen:
+            raise ValueError(f"Duplicate document id '{doc_id}' in '{manifest_file}'.")
+        seen.add(doc_id)
+        documents.append({**_document_defaults(doc_id), **entry})
+    logging.info(f"Loaded corpus manifest with {len(documents)} document(s).")
+    return documents
+
+def qualify_page(doc_id, page):
+    """
+    Returns the document-qualified page ID, e.g. 'kavach:12'.
+    """
+    return f"{doc_id}:{page}"
+
+def parse_page_id(page_id):
+    """
+    Splits a qualified page ID into (doc_id, page_number).
+    """
+    doc_id, page = str(page_id).rsplit(':', 1)
+    return doc_id, int(page)
+
+class CorpusShard:
+    """
+    One document's vector store, BM25 index, image store and image index.
+    """
+
+    def __init__(self, document, vectorstore, image_store, image_index, bm25=None):
+        self.document = document
+        self.doc_id = document['id']
+        self.vectorstore = vectorstore
+        self.image_store = image_store
+        self.image_index = image_index
+        self.bm25 = bm25
+        self.index_version = self._read_index_version()
+
+    @property
+    def pdf_path(self):
+        return BASE_DIR / self.document['pdf']
+
+    @property
+    def layout_dir(self):
+        return self.document['layout_dir']
+
+    def _read_index_version(self):
+        """
+        Identifies the state of the shard's index: its size plus the modification time of the saved
+        index, which is rewritten on every rebuild or incremental update. None without a local index.
+        Read once, when the shard is built; indexes are only updated before that, while loading.
+        """
+        if self.vectorstore is None:
+            return None
+        index_file = BASE_DIR / self.document['vectorstore'] / 'index.faiss'
+        mtime = index_file.stat().st_mtime_ns if index_file.exists() else None
+        return (self.vectorstore.index.ntotal, mtime)
+
+    def search(self, query_embedding, k):
+        results = self.vectorstore.similarity_search_with_score_by_vector(query_embedding, k=k)
+        for doc, _ in results:
+            # Indexes built before multi-document support have no doc_id in their metadata
+            doc.metadata.setdefault('doc_id', self.doc_id)
+        return results
+
+    def search_batch(self, query_matrix, k):
+        """
+        Searches the shard for every row of `query_matrix` in one FAISS call.
+        Returns one list of (Document, distance) per query.
+        """
+        distances, ids = self.vectorstore.index.search(np.asarray(query_matrix, dtype=np.float32), k)
+        results = []
+        for row_distances, row_ids in zip(distances, ids):
+            hits = []
+            for distance, i in zip(row_distances, row_ids):
+                if i == -1:
+                    continue
+                doc = self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[i])
+                doc.metadata.setdefault('doc_id', self.doc_id)
+                hits.append((doc, float(distance)))
+            results.append(hits)
+        return results
+
+class Corpus:
+    """
+    A set of document shards searched in parallel with a merged top-k.
+    """
+
+    def __init__(self, shards):
+        self.shards = {shard.doc_id: shard for shard in shards}
+
+    def __len__(self):
+        return len(self.shards)
+
+    def shard(self, doc_id):
+        return self.shards[doc_id]
+
+    @property
+    def index_version(self):
+        """
+        Changes whenever any shard's index changes, so results cached against it can be discarded.
+        """
+        return tuple((doc_id, shard.index_version) for doc_id, shard in self.shards.items())
+
+    def score_images(self, query_embedding, page_ids, threshold=0.22):
+        """
+        Returns the paths of images on the given qualified pages whose similarity exceeds `threshold`.
+        """
+        pages_by_doc = {}
+        for page_id in page_ids:
+            doc_id, page = parse_page_id(page_id)
+            pages_by_doc.setdefault(doc_id, []).append(page)
+
+        relevant_images = []
+        for doc_id, pages in pages_by_doc.items():
+            shard = self.shards.get(doc_id)
+            if shard is not None and shard.image_index is not None:
+                relevant_images.extend(shard.image_index.relevant_images(query_embedding, pages, threshold))
+        return relevant_images
+
+    def score_images_batch(self, query_matrix, page_ids_per_query, threshold=0.22):
+        """
+        score_images() for many queries, with one matrix product per document. Returns one path list per query.
+        """
+        relevant_images = [[] for _ in page_ids_per_query]
+        for doc_id, shard in self.shards.items():
+            if shard.image_index is None:
+                continue
+            pages_per_query = [
+                [page for page_doc_id, page in map(parse_page_id, page_ids) if page_doc_id == doc_id]
+                for page_ids in page_ids_per_query
+            ]
+            for position, paths in enumerate(shard.image_index.relevant_images_batch(query_matrix, pages_per_query, threshold)):
+                relevant_images[position].extend(paths)
+        return relevant_images
+
+    def page_label(self, page_id):
+        """
+        Returns 'Page N', prefixed with the document title when the corpus has several documents.
+        """
+        doc_id, page = parse_page_id(page_id)
+        if len(self.shards) == 1:
+            return f"Page {page}"
+        return f"{self.shards[doc_id].document['title']}, Page {page}"
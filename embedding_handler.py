@@ -1,5 +1,131 @@
-from langchain.embeddings import HuggingFaceEmbeddings
-from pathlib import Path
+import os
+import logging
+import threading
+import time
+from langchain.embeddings.base import Embeddings
+from telemetry import process_rss_bytes
 
-def get_huggingface_embeddings(model_name='sentence-transformers/all-MiniLM-L6-v2'):
-    return HuggingFaceEmbeddings(model_name=model_name)
\ No newline at end of file
+DEFAULT_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+DEFAULT_RERANKER_MODEL_NAME = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+
+# Inference backend for the embedding model:
+#   torch       full-precision PyTorch (the vectors the saved indexes were built with)
+#   torch-int8  PyTorch with dynamically int8-quantized linear layers
+#   onnx        ONNX Runtime export of the same weights
+#   onnx-int8   ONNX Runtime with int8-quantized weights
+# Run embedding_parity.py before switching a deployment with existing indexes to another backend.
+EMBEDDING_BACKEND = os.getenv("KAVACH_EMBEDDING_BACKEND", "torch")
+EMBEDDING_BACKENDS = ('torch', 'torch-int8', 'onnx', 'onnx-int8')
+# Quantized ONNX file in the model repository; pick the variant matching the CPU (avx2, avx512, avx512_vnni, arm64)
+ONNX_INT8_FILE = os.getenv("KAVACH_ONNX_INT8_FILE", "onnx/model_qint8_avx2.onnx")
+
+# Process-wide registry so every module shares the same model weights.
+# torch, sentence-transformers and langchain are imported by the loaders, on first use.
+_models = {}
+_model_stats = {}
+_registry_lock = threading.Lock()
+
+def _parameter_bytes(model):
+    """
+    Returns the size of the model weights in bytes, or None if it cannot be determined.
+    """
+    try:
+        # HuggingFaceEmbeddings wraps the torch module as `client`, CrossEncoder as `model`
+        module = getattr(model, 'client', None) or model.model
+        # ONNX sessions and int8-packed layers hold weights outside torch parameters; RSS delta still covers them
+        return sum(p.numel() * p.element_size() for p in module.parameters()) or None
+    except Exception:
+        return None
+
+def _get_or_load(registry_key, loader):
+    """
+    Returns the registered model for `registry_key`, calling `loader()` at most once per process.
+    """
+    model = _models.get(registry_key)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        # Another thread may have finished loading while we waited for the lock
+        model = _models.get(registry_key)
+        if model is not None:
+            return model
+
+        rss_before = process_rss_bytes()
+        start = time.perf_counter()
+        model = loader()
+        load_seconds = time.perf_counter() - start
+        rss_after = process_rss_bytes()
+
+        stats = {
+            'load_seconds': load_seconds,
+            'parameter_bytes': _parameter_bytes(model),
+            'rss_delta_bytes': rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+        }
+        _models[registry_key] = model
+        _model_stats[registry_key] = stats
+        logging.info(
+            f"Loaded model '{registry_key}' in {load_seconds:.2f}s "
+            f"(weights: {stats['parameter_bytes']} bytes, RSS delta: {stats['rss_delta_bytes']} bytes)."
+        )
+        return model
+
+def _load_embeddings(model_name, backend):
+    from langchain.embeddings import HuggingFaceEmbeddings
+    if backend == 'torch':
+        return HuggingFaceEmbeddings(model_name=model_name)
+    if backend == 'torch-int8':
+        import torch
+        embeddings = HuggingFaceEmbeddings(model_name=model_name)
+        embeddings.client = torch.quantization.quantize_dynamic(embeddings.client, {torch.nn.Linear}, dtype=torch.qint8)
+        return embeddings
+    if backend == 'onnx':
+        # sentence-transformers >= 3.2 with optimum[onnxruntime]; exports the model on first load if the repo has no ONNX file
+        return HuggingFaceEmbeddings(model_name=model_name, model_kwargs={'backend': 'onnx'})
+    if backend == 'onnx-int8':
+        return HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={'backend': 'onnx', 'model_kwargs': {'file_name': ONNX_INT8_FILE}}
+        )
+    raise ValueError(f"Unknown embedding backend '{backend}'. Choose one of {', '.join(EMBEDDING_BACKENDS)}.")
+
+def get_huggingface_embeddings(model_name=DEFAULT_MODEL_NAME, backend=None):
+    """
+    Returns the shared HuggingFaceEmbeddings for `model_name` on `backend` (EMBEDDING_BACKEND by default),
+    loading it at most once per process.
+    """
+    backend = backend or EMBEDDING_BACKEND
+    registry_key = model_name if backend == 'torch' else f"{model_name}@{backend}"
+    return _get_or_load(registry_key, lambda: _load_embeddings(model_name, backend))
+
+class LazyEmbeddings(Embeddings):
+    """
+    Embeddings that load the shared model on the first embed call, so a saved vector store can be
+    loaded, and searched by vector, without loading the model.
+    """
+
+    def __init__(self, model_name=DEFAULT_MODEL_NAME, backend=None):
+        self.model_name = model_name
+        self.backend = backend
+
+    def embed_documents(self, texts):
+        return get_huggingface_embeddings(self.model_name, self.backend).embed_documents(texts)
+
+    def embed_query(self, text):
+        return get_huggingface_embeddings(self.model_name, self.backend).embed_query(text)
+
+def get_cross_encoder(model_name=DEFAULT_RERANKER_MODEL_NAME):
+    """
+    Returns the shared sentence-transformers CrossEncoder used to re-rank retrieved chunks.
+    """
+    def load():
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(model_name, device='cpu')
+    return _get_or_load(f"cross-encoder:{model_name}", load)
+
+def get_embedding_stats():
+    """
+    Returns load time and memory footprint for every model loaded in this process.
+    """
+    with _registry_lock:
+        return {name: dict(stats) for name, stats in _model_stats.items()}
@@ -0,0 +1,129 @@
+"""
+Checks alternative embedding backends against the full-precision PyTorch model the indexes were built with.
+
+For each backend it reports:
+    cosine      agreement with the reference vectors on a sample of indexed chunks (mean, p5 and min)
+    overlap@k   share of the reference top-k chunks that the backend's query vectors also retrieve
+                from the saved index, averaged over the queries
+    latency     single-query embedding time and batched chunk throughput
+    memory      model load time and RSS growth
+A backend passes when its mean cosine and overlap@k both reach the thresholds; the command exits 1
+if any backend fails.
+
+    python embedding_parity.py --backends torch-int8 onnx onnx-int8 --k 10
+"""
+from pathlib import Path
+import argparse
+import json
+import sys
+import time
+import numpy as np
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+MIN_MEAN_COSINE = 0.99
+MIN_OVERLAP = 0.9
+
+def _load_queries(queries_file):
+    if queries_file is None:
+        from benchmark import DEFAULT_QUERIES
+        return list(DEFAULT_QUERIES)
+    queries = []
+    with open(queries_file, 'r') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                queries.append(record.get('query') or record.get('title'))
+    return [query for query in queries if query]
+
+def _embed(backend, texts, single=False):
+    """
+    Returns (matrix, seconds) for `texts`, embedded one at a time as queries or in one batch as documents.
+    """
+    from embedding_handler import get_huggingface_embeddings
+    embeddings = get_huggingface_embeddings(backend=backend)
+    start = time.perf_counter()
+    if single:
+        vectors = [embeddings.embed_query(text) for text in texts]
+    else:
+        vectors = embeddings.embed_documents(texts)
+    return np.asarray(vectors, dtype=np.float32), time.perf_counter() - start
+
+def _cosines(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return np.sum(a * b, axis=1)
+
+def check_backend(backend, reference, chunk_texts, queries, index, k):
+    from embedding_handler import get_embedding_stats, DEFAULT_MODEL_NAME
+    chunk_vectors, batch_seconds = _embed(backend, chunk_texts)
+    query_vectors, query_seconds = _embed(backend, queries, single=True)
+    cosines = _cosines(reference['chunks'], chunk_vectors)
+
+    _, ids = index.search(query_vectors, k)
+    overlaps = [len(set(row) & set(truth)) / k for row, truth in zip(ids, reference['ids'])]
+
+    registry_key = DEFAULT_MODEL_NAME if backend == 'torch' else f"{DEFAULT_MODEL_NAME}@{backend}"
+    stats = get_embedding_stats().get(registry_key, {})
+    result = {
+        'backend': backend,
+        'cosine_mean': float(cosines.mean()),
+        'cosine_p5': float(np.percentile(cosines, 5)),
+        'cosine_min': float(cosines.min()),
+        f'overlap@{k}': float(np.mean(overlaps)),
+        'query_ms': query_seconds / len(queries) * 1000,
+        'chunks_per_second': len(chunk_texts) / batch_seconds if batch_seconds else 0.0,
+        'load_seconds': stats.get('load_seconds'),
+        'rss_delta_mb': stats['rss_delta_bytes'] / 1e6 if stats.get('rss_delta_bytes') is not None else None,
+    }
+    result['passed'] = result['cosine_mean'] >= MIN_MEAN_COSINE and result[f'overlap@{k}'] >= MIN_OVERLAP
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Check embedding backends for parity with the PyTorch model.")
+    parser.add_argument('--backends', nargs='+', default=['torch-int8', 'onnx', 'onnx-int8'])
+    parser.add_argument('--vectorstore', default=str(BASE_DIR / 'kavach_vectorstore'))
+    parser.add_argument('--queries', help="JSONL file with a 'query' or 'title' field per line")
+    parser.add_argument('--sample', type=int, default=500, help="Indexed chunks compared for cosine agreement")
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    from langchain.vectorstores import FAISS
+    from embedding_handler import LazyEmbeddings
+    from index_spec import apply_search_params, load_index_spec
+    vectorstore = FAISS.load_local(args.vectorstore, LazyEmbeddings(backend='torch'), allow_dangerous_deserialization=True)
+    apply_search_params(vectorstore.index, load_index_spec(args.vectorstore))
+
+    docstore_ids = list(vectorstore.index_to_docstore_id.values())
+    rows = np.random.default_rng(0).choice(len(docstore_ids), min(args.sample, len(docstore_ids)), replace=False)
+    chunk_texts = [vectorstore.docstore.search(docstore_ids[row]).page_content for row in rows]
+    queries = _load_queries(args.queries)
+
+    # Reference: the full-precision model, searched against the same saved index
+    reference_queries, _ = _embed('torch', queries, single=True)
+    _, reference_ids = vectorstore.index.search(reference_queries, args.k)
+    reference = {'chunks': _embed('torch', chunk_texts)[0], 'ids': reference_ids}
+
+    results = [check_backend(backend, reference, chunk_texts, queries, vectorstore.index, args.k) for backend in ['torch'] + args.backends]
+
+    print(f"{len(chunk_texts)} chunks, {len(queries)} queries, k={args.k}; pass: mean cosine >= {MIN_MEAN_COSINE}, overlap >= {MIN_OVERLAP}")
+    print(f"{'backend':<11} {'cos mean':>8} {'cos p5':>8} {'cos min':>8} {'overlap':>8} {'query ms':>9} {'chunks/s':>9} {'load s':>7} {'+MB':>7}  result")
+    for result in results:
+        load_seconds = f"{result['load_seconds']:>7.2f}" if result['load_seconds'] is not None else f"{'-':>7}"
+        rss = f"{result['rss_delta_mb']:>7.0f}" if result['rss_delta_mb'] is not None else f"{'-':>7}"
+        print(
+            f"{result['backend']:<11} {result['cosine_mean']:>8.4f} {result['cosine_p5']:>8.4f} {result['cosine_min']:>8.4f} "
+            f"{result[f'overlap@{args.k}']:>8.3f} {result['query_ms']:>9.2f} {result['chunks_per_second']:>9.1f} "
+            f"{load_seconds} {rss}  {'PASS' if result['passed'] else 'FAIL'}"
+        )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if not all(result['passed'] for result in results):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,42 +1,158 @@
 import os
 from pathlib import Path
-from PyPDF2 import PdfReader
+import fitz  # PyMuPDF
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.vectorstores import FAISS
-from embedding_handler import get_huggingface_embeddings
+from embedding_handler import LazyEmbeddings
 from image_extractor import extract_images
+from page_layout import build_page_layout, load_page_layout, align_chunk
+from ingest import iter_page_texts, read_page_texts, add_chunks_in_batches, pdf_fingerprint, load_pdf_fingerprint, save_pdf_fingerprint
+from corpus import Corpus, CorpusShard, load_manifest, MANIFEST_FILE
+from retrieval import save_bm25_index, load_bm25_index
+from index_spec import INDEX_SPEC, apply_index_spec, apply_search_params, load_index_spec, save_index_spec, supports_removal, to_flat
 import logging
 import streamlit as st
 import json
+import hashlib
+from telemetry import configure_logging
 
 # Set Base Directory
 BASE_DIR = Path(__file__).parent
 
 # Configure logging
-log_file = BASE_DIR / 'embeddings.log'
-logging.basicConfig(
-    filename=log_file,
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+configure_logging()
+
+PAGE_HASHES_FILENAME = 'page_hashes.json'
+PDF_FINGERPRINT_FILENAME = 'pdf_fingerprint.json'
+
+def _hash_page_texts(page_texts):
+    return {str(page): hashlib.sha256(text.encode('utf-8')).hexdigest() for page, text in page_texts.items()}
+
+def _split_pages(page_texts, layout_dir='page_layout', doc_id='kavach'):
+    """
+    Splits page texts into chunks tagged with their source page, character offsets within the page
+    text and, where the chunk can be located in the page layout, the range of words it covers.
+    """
+    # Updated Text Splitting Strategy
+    chunk_size = 500  # Reduced chunk size to maintain better control over context.
+    chunk_overlap = 150  # Increased overlap to maintain continuity between chunks.
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True)
+    kavach_chunks = []
+    aligned = 0
+
+    for page, text in page_texts.items():
+        layout = load_page_layout(page, layout_dir)
+        word_hint = 0
+        for doc in text_splitter.create_documents([text]):
+            start_index = doc.metadata['start_index']
+            chunk = {
+                'text': doc.page_content,
+                'source': f'{doc_id}_source',
+                'doc_id': doc_id,
+                'page': page,
+                'start_index': start_index,
+                'end_index': start_index + len(doc.page_content)
+            }
+            word_span = align_chunk(layout['words'], doc.page_content, word_hint) if layout else None
+            if word_span:
+                chunk['word_span'] = word_span
+                word_hint = word_span[0]
+                aligned += 1
+            kavach_chunks.append(chunk)
+
+    logging.info(f"Total text chunks created: {len(kavach_chunks)} ({aligned} located in the page layout)")
+    return kavach_chunks
+
+def _chunk_metadata(chunk):
+    return {key: value for key, value in chunk.items() if key != 'text'}
+
+def _load_page_hashes(vectorstore_path):
+    hashes_file = vectorstore_path / PAGE_HASHES_FILENAME
+    if not hashes_file.exists():
+        return None
+    with hashes_file.open('r') as f:
+        return json.load(f)
+
+def _save_vectorstore(vectorstore, vectorstore_path, page_hashes, resolved_spec, fingerprint):
+    try:
+        vectorstore_path.mkdir(parents=True, exist_ok=True)
+        vectorstore.save_local(str(vectorstore_path))
+        save_index_spec(vectorstore_path, resolved_spec)
+        # The sparse index is derived from the docstore, so it is rebuilt whenever the store changes
+        save_bm25_index(vectorstore, vectorstore_path)
+        with (vectorstore_path / PAGE_HASHES_FILENAME).open('w') as f:
+            json.dump(page_hashes, f)
+        # Written last: a matching fingerprint means everything above reflects this PDF
+        save_pdf_fingerprint(vectorstore_path / PDF_FINGERPRINT_FILENAME, fingerprint)
+        logging.info("Vector store saved successfully.")
+    except Exception as e:
+        logging.error(f"Error saving vector store: {e}")
+        raise e
+
+def _update_changed_pages(vectorstore, pdf_path, doc, page_texts, page_hashes, stored_hashes, resolved_spec, layout_dir, doc_id):
+    """
+    Removes the vectors of changed or deleted pages and re-embeds changed or added pages.
+    Returns the number of pages updated and the resolved spec of the index afterwards, which differs
+    from `resolved_spec` when the index was rebuilt, e.g. as flat after it shrank.
+    """
+    stale_pages = {page for page in page_hashes.keys() | stored_hashes.keys() if page_hashes.get(page) != stored_hashes.get(page)}
+    if not stale_pages:
+        return 0, resolved_spec
+
+    logging.info(f"Text changed on {len(stale_pages)} page(s): {sorted(stale_pages, key=int)}. Re-indexing those pages.")
+    stale_ids = [
+        docstore_id for docstore_id in vectorstore.index_to_docstore_id.values()
+        if str(vectorstore.docstore.search(docstore_id).metadata.get('page')) in stale_pages
+    ]
+    if stale_ids:
+        if not supports_removal(resolved_spec):
+            # HNSW and IVF indexes are edited as an exact flat copy and rebuilt to their spec afterwards
+            to_flat(vectorstore)
+        vectorstore.delete(stale_ids)
+        logging.info(f"Removed {len(stale_ids)} vector(s) of stale pages.")
+
+    build_page_layout(pdf_path, layout_dir=layout_dir, pages=stale_pages, doc=doc)
+    kavach_chunks = _split_pages({page: text for page, text in page_texts.items() if str(page) in stale_pages}, layout_dir, doc_id)
+    add_chunks_in_batches(vectorstore, kavach_chunks, vectorstore.embedding_function, _chunk_metadata)
+    logging.info(f"Added {len(kavach_chunks)} vector(s) for changed pages.")
+    if stale_ids and not supports_removal(resolved_spec):
+        resolved_spec = apply_index_spec(vectorstore, resolved_spec['name'])
+    return len(stale_pages), resolved_spec
 
 @st.cache_resource(show_spinner=False)
-def create_or_load_vectorstore(pdf_path, vectorstore_path, images_dir='extracted_images', metadata_file='image_metadata.json'):
+def create_or_load_vectorstore(pdf_path, vectorstore_path, images_dir='extracted_images', metadata_file='image_metadata.json', index_spec=None,
+                               layout_dir='page_layout', doc_id='kavach'):
     pdf_path = Path(pdf_path)
     vectorstore_path = Path(vectorstore_path)
+    index_spec = index_spec or INDEX_SPEC
     images_dir = BASE_DIR / images_dir
     metadata_file = BASE_DIR / metadata_file
 
-    embeddings = get_huggingface_embeddings()
-    logging.info("Initialized HuggingFaceEmbeddings.")
+    # The model itself is only loaded if something needs embedding: a new store, changed pages or a query
+    embeddings = LazyEmbeddings()
+
+    # An unchanged PDF skips page text extraction, hashing and the layout check on a warm start
+    fingerprint = pdf_fingerprint(pdf_path)
+    pdf_unchanged = vectorstore_path.exists() and load_pdf_fingerprint(vectorstore_path / PDF_FINGERPRINT_FILENAME) == fingerprint
+
+    # One PyMuPDF handle serves image extraction and page layout; text extraction workers open their own
+    try:
+        doc = fitz.open(str(pdf_path))
+        logging.info(f"Opened PDF file '{pdf_path}' for reading.")
+    except Exception as e:
+        logging.error(f"Error reading PDF: {e}")
+        raise e
+
+    # Extract images and map them to pages, re-processing only pages whose images changed
+    logging.info("Starting image extraction or opening the image store.")
+    image_store = extract_images(pdf_path, images_dir, metadata_file=metadata_file, doc=doc, fingerprint=fingerprint)
+    logging.info(f"Image store holds {len(image_store)} image(s).")
+
+    # Word boxes and base page images let the UI highlight retrieved chunks without searching the PDF
+    if not pdf_unchanged or not (BASE_DIR / layout_dir).exists():
+        build_page_layout(pdf_path, layout_dir=layout_dir, doc=doc)
 
-    # Extract images and map them to pages if metadata is not already saved
-    logging.info("Starting image extraction or loading metadata.")
-    page_images = extract_images(pdf_path, images_dir, metadata_file=metadata_file)
-    logging.info(f"Extracted images from {len(page_images)} pages.")
-    
-    # Load vectorstore if it exists
+    # Load vectorstore if it exists, then bring changed pages up to date
     if vectorstore_path.exists():
         logging.info("Loading existing vector store.")
         try:
@@ -45,52 +161,86 @@ def create_or_load_vectorstore(pdf_path, vectorstore_path, images_dir='extracted
         except Exception as e:
             logging.error(f"Error loading vector store: {e}")
             raise e
+
+        resolved_spec = load_index_spec(vectorstore_path)
+        apply_search_params(vectorstore.index, resolved_spec)
+        rebuild_index = resolved_spec['name'] != index_spec
+        if rebuild_index:
+            # Vectors are reconstructed from the current index, which is lossy if it was PQ-compressed
+            logging.info(f"Index spec changed from '{resolved_spec['name']}' to '{index_spec}'. Rebuilding the index.")
+            if 'PQ' in resolved_spec['factory']:
+                logging.warning("Rebuilding from a PQ index; delete the vector store for a full re-embed instead.")
+            resolved_spec = apply_index_spec(vectorstore, index_spec)
+
+        stored_hashes = _load_page_hashes(vectorstore_path)
+        if pdf_unchanged and stored_hashes is not None:
+            logging.info("PDF unchanged since the vector store was saved. Skipping the page check.")
+            if rebuild_index:
+                _save_vectorstore(vectorstore, vectorstore_path, stored_hashes, resolved_spec, fingerprint)
+        else:
+            page_texts = read_page_texts(pdf_path, len(doc))
+            page_hashes = _hash_page_texts(page_texts)
+            if stored_hashes is None:
+                logging.info("No page hashes found. Recording hashes for the existing vector store.")
+                _save_vectorstore(vectorstore, vectorstore_path, page_hashes, resolved_spec, fingerprint)
+            else:
+                updated_pages, resolved_spec = _update_changed_pages(
+                    vectorstore, pdf_path, doc, page_texts, page_hashes, stored_hashes, resolved_spec, layout_dir, doc_id
+                )
+                if updated_pages or rebuild_index:
+                    _save_vectorstore(vectorstore, vectorstore_path, page_hashes, resolved_spec, fingerprint)
+                else:
+                    # Touched but with the same text; record the new fingerprint so the next start is fast
+                    save_pdf_fingerprint(vectorstore_path / PDF_FINGERPRINT_FILENAME, fingerprint)
     else:
         logging.info("Vector store not found. Creating a new one.")
-        try:
-            pdf_reader = PdfReader(str(pdf_path))
-            logging.info(f"Opened PDF file '{pdf_path}' for reading.")
-        except Exception as e:
-            logging.error(f"Error reading PDF: {e}")
-            raise e
-
         page_texts = {}
-        for page_num, page in enumerate(pdf_reader.pages, start=1):
-            page_text = page.extract_text()
-            if page_text:
-                page_texts[page_num] = page_text
-
-        # Updated Text Splitting Strategy
-        chunk_size = 500  # Reduced chunk size to maintain better control over context.
-        chunk_overlap = 150  # Increased overlap to maintain continuity between chunks.
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-        kavach_chunks = []
-
-        for page, text in page_texts.items():
-            chunks = text_splitter.split_text(text)
-            for chunk in chunks:
-                kavach_chunks.append({'text': chunk, 'source': 'kavach_source', 'page': page})
 
-        logging.info(f"Total text chunks created: {len(kavach_chunks)}")
+        def stream_chunks():
+            # Pages are split as soon as their range is extracted, so embedding starts before extraction ends
+            for part in iter_page_texts(pdf_path, len(doc)):
+                page_texts.update(part)
+                yield from _split_pages(part, layout_dir, doc_id)
 
         try:
-            vectorstore = FAISS.from_texts(
-                texts=[chunk['text'] for chunk in kavach_chunks],
-                embedding=embeddings,
-                metadatas=[{'source': chunk['source'], 'page': chunk['page']} for chunk in kavach_chunks]
-            )
-            logging.info("Vector store created successfully.")
+            vectorstore = add_chunks_in_batches(None, stream_chunks(), embeddings, _chunk_metadata)
+            if vectorstore is None:
+                raise ValueError(f"No text extracted from '{pdf_path}' to create vector store.")
+            # Vectors are streamed into a flat index, then trained into the requested index type
+            resolved_spec = apply_index_spec(vectorstore, index_spec)
+            logging.info(f"Vector store created successfully with index '{resolved_spec['factory']}'.")
         except Exception as e:
             logging.error(f"Error creating vector store: {e}")
             raise e
 
         # Save the vectorstore
-        try:
-            vectorstore_path.mkdir(parents=True, exist_ok=True)
-            vectorstore.save_local(str(vectorstore_path))
-            logging.info("Vector store saved successfully.")
-        except Exception as e:
-            logging.error(f"Error saving vector store: {e}")
-            raise e
-    
-    return vectorstore, page_images
\ No newline at end of file
+        _save_vectorstore(vectorstore, vectorstore_path, _hash_page_texts(page_texts), resolved_spec, fingerprint)
+
+    doc.close()
+    return vectorstore, image_store
+
+@st.cache_resource(show_spinner=False)
+def create_or_load_bm25_index(_vectorstore, vectorstore_path):
+    # `_vectorstore` is excluded from Streamlit's hashing; the vectorstore path identifies it
+    return load_bm25_index(_vectorstore, vectorstore_path)
+
+def create_or_load_corpus(manifest_file=MANIFEST_FILE):
+    """
+    Loads one shard per document in the corpus manifest. Each shard keeps its own index, page hashes
+    and image data, so adding or changing one document never rebuilds the others.
+    """
+    shards = []
+    for document in load_manifest(manifest_file):
+        vectorstore, image_store = create_or_load_vectorstore(
+            BASE_DIR / document['pdf'],
+            BASE_DIR / document['vectorstore'],
+            images_dir=document['images_dir'],
+            metadata_file=document['metadata_file'],
+            layout_dir=document['layout_dir'],
+            doc_id=document['id']
+        )
+        # Image vectors are scored straight from the memory-mapped store; nothing is loaded up front
+        image_index = image_store.image_index()
+        bm25 = create_or_load_bm25_index(vectorstore, BASE_DIR / document['vectorstore'])
+        shards.append(CorpusShard(document, vectorstore, image_store, image_index, bm25))
+    return Corpus(shards)
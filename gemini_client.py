@@ -0,0 +1,203 @@
+import os
+from pathlib import Path
+import asyncio
+import logging
+import random
+import threading
+import time
+from google.api_core import exceptions as google_exceptions
+from telemetry import configure_logging, metrics
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+# Configure logging
+configure_logging()
+
+MODEL_NAME = os.getenv("KAVACH_GEMINI_MODEL", 'gemini-1.5-pro-002')
+# Process-wide request quota shared by every session; set to the provider's requests-per-minute limit
+REQUESTS_PER_MINUTE = float(os.getenv("KAVACH_GEMINI_RPM", 60))
+REQUEST_DEADLINE_SECONDS = float(os.getenv("KAVACH_GEMINI_DEADLINE", 60))
+BACKOFF_BASE_SECONDS = 2
+BACKOFF_CAP_SECONDS = 20
+
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.GatewayTimeout,
+    ConnectionError,
+    TimeoutError,
+)
+
+# Marker yielded by stream_async when a partial stream failed and generation restarts from scratch
+RESTART = object()
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when a request cannot complete, or wait for quota, within its deadline.
+    """
+
+class AsyncTokenBucket:
+    """
+    Token bucket shared by every request on the client's event loop.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(1.0, rate_per_minute / 6)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, deadline):
+        while True:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            wait = (1 - self.tokens) / self.rate
+            if time.monotonic() + wait > deadline:
+                raise DeadlineExceeded("Timed out waiting for Gemini quota.")
+            await asyncio.sleep(wait)
+
+    def drain(self):
+        """
+        Empties the bucket after a quota error so every waiting request backs off together.
+        """
+        self._refill()
+        self.tokens = min(self.tokens, 0)
+
+_model = None
+_model_lock = threading.Lock()
+_bucket = AsyncTokenBucket(REQUESTS_PER_MINUTE)
+_loop = None
+_loop_lock = threading.Lock()
+
+def get_model():
+    """
+    Returns the process-wide GenerativeModel. The SDK is imported and configured on first use,
+    so the API key is only required once a query reaches Gemini.
+    """
+    global _model
+    with _model_lock:
+        if _model is None:
+            api_key = os.getenv("GOOGLE_GEMINI_PRO_API_KEY")
+            if not api_key:
+                raise ValueError("Please set the GOOGLE_GEMINI_PRO_API_KEY environment variable.")
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            _model = genai.GenerativeModel(MODEL_NAME)
+            logging.info(f"Created Gemini client for '{MODEL_NAME}'.")
+        return _model
+
+def _get_loop():
+    """
+    Returns the background event loop that runs all Gemini requests and backoff waits.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='gemini-client-loop', daemon=True).start()
+        return _loop
+
+def is_retryable(error):
+    return isinstance(error, RETRYABLE_ERRORS)
+
+async def _backoff(attempt, deadline, error):
+    """
+    Sleeps for a fully jittered exponential delay, so concurrent failures do not retry in lockstep.
+    """
+    if isinstance(error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)):
+        _bucket.drain()
+    metrics.increment('kavach_llm_retries_total', help_text="Gemini requests retried, by error type.", error=type(error).__name__)
+    delay = random.uniform(0, min(BACKOFF_CAP_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+    if time.monotonic() + delay > deadline:
+        raise DeadlineExceeded(f"Deadline reached while retrying Gemini request: {error}") from error
+    logging.info(f"Retrying Gemini request in {delay:.2f} seconds (attempt {attempt + 1}) after: {error}")
+    await asyncio.sleep(delay)
+
+async def generate_async(prompt, max_retries=3, deadline_seconds=REQUEST_DEADLINE_SECONDS):
+    """
+    Returns the full response text, retrying only retryable errors within the deadline.
+    """
+    deadline = time.monotonic() + deadline_seconds
+    for attempt in range(max_retries):
+        await _bucket.acquire(deadline)
+        try:
+            response = await asyncio.wait_for(
+                get_model().generate_content_async(prompt),
+                timeout=max(0.0, deadline - time.monotonic())
+            )
+            return response.text
+        except asyncio.TimeoutError as e:
+            raise DeadlineExceeded("Gemini request exceeded its deadline.") from e
+        except Exception as e:
+            logging.error(f"API call error: {e}")
+            if not is_retryable(e) or attempt == max_retries - 1:
+                raise
+            await _backoff(attempt, deadline, e)
+
+async def stream_async(prompt, max_retries=3, deadline_seconds=REQUEST_DEADLINE_SECONDS):
+    """
+    Yields response text chunks. If a stream fails partway and is retried, yields RESTART first.
+    """
+    deadline = time.monotonic() + deadline_seconds
+    for attempt in range(max_retries):
+        await _bucket.acquire(deadline)
+        received = 0
+        try:
+            # Opening the stream and waiting for each chunk are both bounded by the deadline
+            response = await asyncio.wait_for(
+                get_model().generate_content_async(prompt, stream=True),
+                timeout=max(0.0, deadline - time.monotonic())
+            )
+            chunks = response.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(0.0, deadline - time.monotonic()))
+                except StopAsyncIteration:
+                    return
+                received += 1
+                yield chunk.text
+        except asyncio.TimeoutError as e:
+            raise DeadlineExceeded("Gemini stream exceeded its deadline.") from e
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            logging.error(f"API streaming error after {received} chunk(s): {e}")
+            if not is_retryable(e) or attempt == max_retries - 1:
+                raise
+            await _backoff(attempt, deadline, e)
+            if received:
+                yield RESTART
+
+def generate(prompt, max_retries=3, deadline_seconds=REQUEST_DEADLINE_SECONDS):
+    """
+    Blocking wrapper around generate_async for synchronous callers. Backoff waits run on the
+    client's event loop, not on a thread of their own.
+    """
+    future = asyncio.run_coroutine_threadsafe(generate_async(prompt, max_retries, deadline_seconds), _get_loop())
+    return future.result()
+
+def stream(prompt, max_retries=3, deadline_seconds=REQUEST_DEADLINE_SECONDS):
+    """
+    Synchronous generator over stream_async. Closing it early also closes the underlying stream.
+    """
+    loop = _get_loop()
+    chunks = stream_async(prompt, max_retries, deadline_seconds)
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(chunks.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(chunks.aclose(), loop).result()
@@ -3,56 +3,110 @@ from pathlib import Path
 import fitz  # PyMuPDF
 import logging
 import json
-from ocr import extract_text_and_embeddings, save_embeddings
+import hashlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from ocr import read_image_text, embed_texts, init_ocr_worker
+from image_store import STORE_SUFFIX, ImageStore, _legacy_vector, migrate_metadata, write_image_store
+from ingest import pdf_fingerprint, load_pdf_fingerprint, save_pdf_fingerprint
+from telemetry import configure_logging
 
 # Set Base Directory
 BASE_DIR = Path(__file__).parent
 
 # Configure logging
-log_file = BASE_DIR / 'image_extractor.log'
-logging.basicConfig(
-    filename=log_file,
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
-
-def extract_images(pdf_path, images_dir='extracted_images', embeddings_dir='image_embeddings', metadata_file='image_metadata.json'):
-    pdf_path = Path(pdf_path)
-    images_dir = BASE_DIR / images_dir
-    embeddings_dir = BASE_DIR / embeddings_dir
-    metadata_file = BASE_DIR / metadata_file
+configure_logging()
 
-    # If metadata file exists, load it and return
-    if metadata_file.exists():
-        logging.info(f"Loading image metadata from '{metadata_file}'.")
-        with metadata_file.open('r') as f:
-            page_images = json.load(f)
-        return page_images
+# Number of OCR worker processes. Each loads its own EasyOCR model, so keep the default small
+OCR_WORKERS = int(os.getenv("KAVACH_OCR_WORKERS", min(4, max(1, (os.cpu_count() or 1) // 2))))
 
-    # Otherwise, extract images and save metadata
-    if not images_dir.exists():
-        images_dir.mkdir(parents=True)
-        logging.info(f"Created images directory at '{images_dir}'.")
+# Number of OCR texts embedded per model call
+EMBEDDING_BATCH_SIZE = int(os.getenv("KAVACH_EMBEDDING_BATCH_SIZE", 32))
 
-    if not embeddings_dir.exists():
-        embeddings_dir.mkdir(parents=True)
-        logging.info(f"Created embeddings directory at '{embeddings_dir}'.")
+def _load_journal(journal_file, fingerprint):
+    """
+    Loads completed per-image records from the OCR journal, keyed by image path.
+    A partially written last line from an interrupted run is ignored, and a journal written for a
+    different version of the PDF is discarded.
+    """
+    records = {}
+    if not journal_file.exists():
+        return records
+    with journal_file.open('r') as f:
+        # The first line records the fingerprint of the PDF the journal was written for
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            header = None
+        current = isinstance(header, dict) and header.get('fingerprint') == fingerprint
+        for line in f if current else ():
+            try:
+                record = json.loads(line)
+                if 'vector' not in record:
+                    # Journaled before vectors were kept inline; the vector is in a joblib file
+                    record['vector'] = _legacy_vector(record)
+                records[record['path']] = record
+            except (ValueError, KeyError):
+                logging.warning(f"Ignoring incomplete journal line in '{journal_file}'.")
+    if not current:
+        logging.info(f"Discarding journal '{journal_file}' written for a different version of the PDF.")
+        journal_file.unlink()
+        return records
+    logging.info(f"Resuming from journal '{journal_file}' with {len(records)} completed image(s).")
+    return records
 
-    try:
-        doc = fitz.open(str(pdf_path))
-        logging.info(f"Opened PDF file '{pdf_path}'.")
-    except Exception as e:
-        logging.error(f"Error opening PDF file '{pdf_path}': {e}")
-        raise e
+def _write_journal(journal, record):
+    journal.write(json.dumps(record) + "\n")
+    journal.flush()
+    os.fsync(journal.fileno())
+
+def compute_image_page_hashes(doc):
+    """
+    Returns {page: sha256} over the raw streams of each page's images, for pages that have images.
+    """
+    page_hashes = {}
+    for page_num in range(len(doc)):
+        images = doc.load_page(page_num).get_images(full=True)
+        if not images:
+            continue
+        digest = hashlib.sha256()
+        for img in images:
+            try:
+                digest.update(doc.xref_stream_raw(img[0]) or b"")
+            except Exception as e:
+                logging.warning(f"Could not read image stream {img[0]} on page {page_num + 1}: {e}")
+        page_hashes[str(page_num + 1)] = digest.hexdigest()
+    return page_hashes
+
+def _load_page_hashes(hashes_file):
+    if not hashes_file.exists():
+        return None
+    with hashes_file.open('r') as f:
+        return json.load(f)
 
-    page_images = {}
-    total_images = 0
+def _save_page_hashes(hashes_file, page_hashes):
+    with hashes_file.open('w') as f:
+        json.dump(page_hashes, f)
+    logging.info(f"Saved image page hashes to '{hashes_file}'.")
 
+def _remove_image_files(records):
+    """
+    Deletes the extracted image files recorded for stale pages.
+    """
+    for record in records:
+        if record.get('path'):
+            Path(record['path']).unlink(missing_ok=True)
+
+def _save_images(doc, images_dir, pages=None):
+    """
+    Writes the embedded images of `pages` (all pages if None) to `images_dir` and returns (page_num, image_path) pairs in document order.
+    """
+    tasks = []
     for page_num in range(len(doc)):
+        if pages is not None and str(page_num + 1) not in pages:
+            continue
         page = doc.load_page(page_num)
         images = page.get_images(full=True)
-        image_data = []
 
         if images:
             logging.info(f"Found {len(images)} image(s) on page {page_num + 1}.")
@@ -82,39 +136,152 @@ def extract_images(pdf_path, images_dir='extracted_images', embeddings_dir='imag
                     logging.error(f"Error saving image {img_index + 1} on page {page_num + 1}: {e}")
                     continue
 
-            # Extract OCR text and generate embeddings
-            try:
-                ocr_text, ocr_embedding = extract_text_and_embeddings(str(image_path))
-
-                if ocr_embedding is not None:
-                    embedding_filename = f"page_{page_num + 1}_img_{img_index + 1}_embedding.joblib"
-                    embedding_path = embeddings_dir / embedding_filename
-                    if not embedding_path.exists():
-                        save_embeddings(ocr_embedding, str(embedding_path))
-                        logging.info(f"Saved embedding for '{image_filename}' to '{embedding_path}'.")
+            tasks.append((page_num + 1, image_path))
+    return tasks
+
+def _flush_embedding_batch(batch, journal, records, failed_pages):
+    """
+    Embeds a batch of (page_num, image_path, ocr_text) in one call and journals the results with their vectors.
+    Images whose embedding failed are not journaled, and their pages are added to `failed_pages`.
+    """
+    if not batch:
+        return
+    try:
+        vectors = embed_texts([ocr_text for _, _, ocr_text in batch])
+    except Exception as e:
+        logging.error(f"Error generating embeddings for a batch of {len(batch)} image(s): {e}")
+        vectors = [None] * len(batch)
+
+    for (page_num, image_path, ocr_text), vector in zip(batch, vectors):
+        record = {
+            'page': page_num,
+            'path': str(image_path),
+            'ocr_text': ocr_text if vector is not None else "",
+            'vector': [float(value) for value in vector] if vector is not None else None
+        }
+        if vector is not None:
+            _write_journal(journal, record)
+        else:
+            failed_pages.add(str(page_num))
+        records[record['path']] = record
+    batch.clear()
+
+def extract_images(pdf_path, images_dir='extracted_images', metadata_file='image_metadata.json', max_workers=None, batch_size=None, doc=None,
+                   fingerprint=None):
+    """
+    Extracts, OCRs and embeds the PDF's images into the image store next to `metadata_file`, redoing only
+    pages whose images changed, and returns the opened ImageStore. A JSON metadata file from the older
+    layout is migrated into the store first. While the PDF's `fingerprint` matches the one recorded with
+    the store, the store is opened without reading any image streams.
+    """
+    pdf_path = Path(pdf_path)
+    images_dir = BASE_DIR / images_dir
+    metadata_file = BASE_DIR / metadata_file
+    store_file = metadata_file.with_suffix(STORE_SUFFIX)
+    journal_file = metadata_file.with_suffix('.journal.jsonl')
+    hashes_file = metadata_file.with_suffix('.hashes.json')
+    fingerprint_file = metadata_file.with_suffix('.fingerprint.json')
+    fingerprint = fingerprint or pdf_fingerprint(pdf_path)
+    max_workers = max_workers or OCR_WORKERS
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+
+    if not images_dir.exists():
+        images_dir.mkdir(parents=True)
+        logging.info(f"Created images directory at '{images_dir}'.")
+
+    if store_file.exists() and hashes_file.exists() and load_pdf_fingerprint(fingerprint_file) == fingerprint:
+        logging.info("PDF unchanged since the image store was written. Skipping the image check.")
+        return ImageStore(store_file)
+
+    # Reuse the caller's PyMuPDF handle when the PDF is already open
+    if doc is None:
+        try:
+            doc = fitz.open(str(pdf_path))
+            logging.info(f"Opened PDF file '{pdf_path}'.")
+        except Exception as e:
+            logging.error(f"Error opening PDF file '{pdf_path}': {e}")
+            raise e
+
+    page_hashes = compute_image_page_hashes(doc)
+    kept_records = []
+    pages_to_process = None
+
+    if not store_file.exists() and metadata_file.exists():
+        logging.info(f"Migrating image metadata from '{metadata_file}' to an image store.")
+        migrate_metadata(metadata_file, store_file)
+
+    # If the store exists, open it and only re-process pages whose images changed
+    if store_file.exists():
+        image_store = ImageStore(store_file)
+
+        stored_hashes = _load_page_hashes(hashes_file)
+        if stored_hashes is None:
+            logging.info("No image page hashes found. Recording hashes for the existing image store.")
+            _save_page_hashes(hashes_file, page_hashes)
+            save_pdf_fingerprint(fingerprint_file, fingerprint)
+            return image_store
+
+        stale_pages = {page for page in page_hashes.keys() | stored_hashes.keys() if page_hashes.get(page) != stored_hashes.get(page)}
+        if not stale_pages:
+            save_pdf_fingerprint(fingerprint_file, fingerprint)
+            return image_store
+
+        logging.info(f"Images changed on {len(stale_pages)} page(s): {sorted(stale_pages, key=int)}. Re-extracting those pages.")
+        kept_records = [record for record in image_store.records() if str(record['page']) not in stale_pages]
+        _remove_image_files(image_store.records(pages=stale_pages))
+        pages_to_process = stale_pages & page_hashes.keys()
+
+    tasks = _save_images(doc, images_dir, pages=pages_to_process)
+    records = _load_journal(journal_file, fingerprint)
+    pending = [(page_num, image_path) for page_num, image_path in tasks if str(image_path) not in records]
+    logging.info(f"{len(pending)} of {len(tasks)} image(s) need OCR, using {max_workers} worker(s).")
+
+    # OCR runs in worker processes; embedding is batched in this process as results arrive
+    failed_pages = set()
+    with journal_file.open('a') as journal:
+        if journal.tell() == 0:
+            _write_journal(journal, {'fingerprint': fingerprint})
+        batch = []
+        # Spawned workers do not inherit the parent's torch or model state; each uses a single torch thread
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"), initializer=init_ocr_worker) as executor:
+            futures = {executor.submit(read_image_text, str(image_path)): (page_num, image_path) for page_num, image_path in pending}
+            for future in as_completed(futures):
+                page_num, image_path = futures[future]
+                try:
+                    ocr_text = future.result()
+                except Exception as e:
+                    # Not journaled, so the image is retried
+                    logging.error(f"Error during OCR for '{image_path.name}': {e}")
+                    records[str(image_path)] = {'page': page_num, 'path': str(image_path), 'ocr_text': "", 'vector': None}
+                    failed_pages.add(str(page_num))
+                    continue
+
+                if ocr_text:
+                    batch.append((page_num, image_path, ocr_text))
+                    if len(batch) >= batch_size:
+                        _flush_embedding_batch(batch, journal, records, failed_pages)
                 else:
-                    logging.warning(f"No embedding generated for '{image_filename}'. OCR text might be empty or invalid.")
-                    embedding_path = None
-            except Exception as e:
-                logging.error(f"Error during OCR or embedding generation for '{image_filename}': {e}")
-                embedding_path = None
+                    logging.warning(f"No text found in '{image_path.name}'; it is stored without an embedding.")
+                    record = {'page': page_num, 'path': str(image_path), 'ocr_text': "", 'vector': None}
+                    _write_journal(journal, record)
+                    records[record['path']] = record
+        _flush_embedding_batch(batch, journal, records, failed_pages)
 
-            # Append image details to the image data
-            image_data.append({
-                'path': str(image_path),
-                'ocr_text': ocr_text,
-                'embedding_path': str(embedding_path) if ocr_embedding is not None else None
-            })
-            total_images += 1
+    logging.info(f"Total images extracted: {len(tasks)}")
 
-        if image_data:
-            page_images[str(page_num + 1)] = image_data
+    # Merge the newly processed pages with the unchanged ones; the store keeps them in page order
+    new_records = [records[str(image_path)] for _, image_path in tasks]
+    write_image_store(store_file, kept_records + new_records)
+    if failed_pages:
+        # Pages without a recorded hash count as changed, so the next run retries them; the journal keeps the rest
+        logging.warning(f"OCR or embedding failed for images on {len(failed_pages)} page(s): {sorted(failed_pages, key=int)}. They will be retried on the next run.")
+        _save_page_hashes(hashes_file, {page: digest for page, digest in page_hashes.items() if page not in failed_pages})
+        return ImageStore(store_file)
 
-    logging.info(f"Total images extracted: {total_images}")
+    _save_page_hashes(hashes_file, page_hashes)
+    save_pdf_fingerprint(fingerprint_file, fingerprint)
 
-    # Save metadata to JSON file
-    with metadata_file.open('w') as f:
-        json.dump(page_images, f)
-    logging.info(f"Saved image metadata to '{metadata_file}'.")
+    # The journal is only needed to resume an interrupted run
+    journal_file.unlink()
 
-    return page_images
\ No newline at end of file
+    return ImageStore(store_file)
@@ -0,0 +1,106 @@
+from pathlib import Path
+import logging
+import joblib
+import numpy as np
+from telemetry import configure_logging
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+# Configure logging
+configure_logging()
+
+class ImageIndex:
+    """
+    L2-normalized matrix of OCR image embeddings with a page -> row-range lookup. The image store
+    backs it with its memory-mapped vector block; from_page_images() builds one in memory.
+    """
+
+    def __init__(self, matrix, page_ranges, paths):
+        self.matrix = matrix
+        self.page_ranges = page_ranges
+        self.paths = paths
+
+    def __len__(self):
+        return len(self.paths)
+
+    def rows_for_pages(self, pages):
+        """
+        Returns the matrix row numbers belonging to the given pages.
+        """
+        rows = []
+        for page in pages:
+            row_range = self.page_ranges.get(str(page))
+            if row_range:
+                rows.extend(range(row_range[0], row_range[1]))
+        return np.asarray(rows, dtype=np.int64)
+
+    def score(self, query_embedding, pages):
+        """
+        Returns (image_path, cosine_similarity) for every image on the given pages in one matrix-vector product.
+        """
+        rows = self.rows_for_pages(pages)
+        if rows.size == 0:
+            return []
+        query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+        similarities = self.matrix[rows] @ query
+        return [(self.paths[row], float(sim)) for row, sim in zip(rows, similarities)]
+
+    def relevant_images(self, query_embedding, pages, threshold=0.22):
+        """
+        Returns the paths of images on the given pages whose similarity exceeds `threshold`.
+        """
+        return [path for path, similarity in self.score(query_embedding, pages) if similarity > threshold]
+
+    def relevant_images_batch(self, query_matrix, pages_per_query, threshold=0.22):
+        """
+        relevant_images() for many queries: every image on any of the queries' pages is scored against
+        every query in a single matrix product. Returns one path list per query.
+        """
+        rows_per_query = [self.rows_for_pages(pages) for pages in pages_per_query]
+        rows = np.unique(np.concatenate(rows_per_query)) if rows_per_query else np.zeros(0, dtype=np.int64)
+        if rows.size == 0:
+            return [[] for _ in pages_per_query]
+        queries = _normalize(np.asarray(query_matrix, dtype=np.float32))
+        similarities = self.matrix[rows] @ queries.T
+        position = {row: i for i, row in enumerate(rows.tolist())}
+        return [
+            [self.paths[row] for row in query_rows.tolist() if similarities[position[row], q] > threshold]
+            for q, query_rows in enumerate(rows_per_query)
+        ]
+
+    @classmethod
+    def from_page_images(cls, page_images):
+        """
+        Builds an in-memory index from image metadata in the pre-store layout by loading each image's embedding file.
+        """
+        vectors = []
+        page_ranges = {}
+        paths = []
+        for page, images in page_images.items():
+            start = len(paths)
+            for image_data in images:
+                embedding_path = image_data.get('embedding_path')
+                if not embedding_path or not Path(embedding_path).exists():
+                    continue
+                try:
+                    vectors.append(np.asarray(joblib.load(embedding_path), dtype=np.float32))
+                    paths.append(image_data['path'])
+                except Exception as e:
+                    logging.error(f"Error loading embedding from '{embedding_path}': {e}")
+            if len(paths) > start:
+                page_ranges[str(page)] = [start, len(paths)]
+
+        if vectors:
+            matrix = _normalize(np.vstack(vectors))
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        return cls(matrix, page_ranges, paths)
+
+def _normalize(vectors):
+    """
+    L2-normalizes a vector or each row of a matrix, leaving zero vectors untouched.
+    """
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
@@ -0,0 +1,264 @@
+"""
+Single-file, memory-mapped store for extracted images: their page, path, OCR text and embedding.
+
+Layout (little-endian):
+    8 bytes     magic, b'KVIMGST1'
+    8 bytes     header length
+    header      JSON: row count, vector dimension and each column's dtype, shape and offset
+    columns     each aligned to 64 bytes, at its offset from the end of the padded header:
+        page          int32[n]        page number; rows are sorted by page
+        embedded      uint8[n]        1 if the image has a vector; these rows come first within a page
+        path_offsets  int64[n + 1]    byte offsets into `paths`
+        text_offsets  int64[n + 1]    byte offsets into `texts`
+        vectors       float32[n, d]   L2-normalized OCR text embeddings, zero for images without one
+        paths         uint8[...]      UTF-8 image paths, relative to the app directory where possible
+        texts         uint8[...]      UTF-8 OCR text
+
+The row number is the image ID. Opening the store maps the file without reading it, so only the
+pages of the columns a query touches are loaded.
+"""
+from pathlib import Path
+import json
+import logging
+import mmap
+import os
+import struct
+import numpy as np
+from image_index import ImageIndex, _normalize
+from telemetry import configure_logging
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+# Configure logging
+configure_logging()
+
+STORE_SUFFIX = '.store'
+MAGIC = b'KVIMGST1'
+ALIGNMENT = 64
+_PREAMBLE = struct.Struct('<8sQ')
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def _relative_path(path):
+    path = Path(path)
+    try:
+        return str(path.relative_to(BASE_DIR))
+    except ValueError:
+        return str(path)
+
+def _pack(strings):
+    """
+    Returns the UTF-8 strings concatenated, and the n + 1 offsets delimiting them.
+    """
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        offsets[1:] = np.cumsum([len(data) for data in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+def write_image_store(store_file, records):
+    """
+    Writes image records, dicts with 'page', 'path', 'ocr_text' and 'vector' (None for images without
+    an embedding), to `store_file`. The file is replaced atomically, so readers never see a partial store.
+    """
+    store_file = Path(store_file)
+    # Stable sort: images keep their document order within a page, with embedded images first
+    records = sorted(records, key=lambda record: (int(record['page']), record.get('vector') is None))
+    dim = next((len(record['vector']) for record in records if record.get('vector') is not None), 0)
+
+    vectors = np.zeros((len(records), dim), dtype=np.float32)
+    embedded = np.zeros(len(records), dtype=np.uint8)
+    for row, record in enumerate(records):
+        if record.get('vector') is not None:
+            vectors[row] = record['vector']
+            embedded[row] = 1
+    paths, path_offsets = _pack([_relative_path(record['path']) for record in records])
+    texts, text_offsets = _pack([record.get('ocr_text') or "" for record in records])
+
+    columns = {
+        'page': np.asarray([int(record['page']) for record in records], dtype=np.int32),
+        'embedded': embedded,
+        'path_offsets': path_offsets,
+        'text_offsets': text_offsets,
+        'vectors': _normalize(vectors) if len(records) else vectors,
+        'paths': paths,
+        'texts': texts,
+    }
+    layout = {}
+    offset = 0
+    for name, column in columns.items():
+        layout[name] = {'dtype': column.dtype.str, 'shape': list(column.shape), 'offset': offset}
+        offset = _align(offset + column.nbytes)
+    header = json.dumps({
+        'count': len(records),
+        'dim': dim,
+        'embedded': int(embedded.sum()),
+        'columns': layout,
+    }).encode('utf-8')
+    data_start = _align(_PREAMBLE.size + len(header))
+
+    store_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = store_file.with_name(store_file.name + '.tmp')
+    with tmp_file.open('wb') as f:
+        f.write(_PREAMBLE.pack(MAGIC, len(header)))
+        f.write(header)
+        for name, column in columns.items():
+            f.seek(data_start + layout[name]['offset'])
+            f.write(np.ascontiguousarray(column).tobytes())
+        # Pads the last column, and keeps empty columns at the end inside the file
+        f.truncate(data_start + offset)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_file, store_file)
+    logging.info(f"Wrote image store with {len(records)} image(s), {int(embedded.sum())} embedded, to '{store_file}'.")
+
+class _PageRanges:
+    """
+    Page -> [start, end) rows of the embedded images on that page, found by binary search on the page column.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def get(self, page, default=None):
+        start, end = self.store.page_rows(int(page))
+        end = start + int(self.store.embedded[start:end].sum())
+        return [start, end] if end > start else default
+
+class _Paths:
+    """
+    Sequence view of the path column, decoding only the rows that are read.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return self.store.embedded_count
+
+    def __getitem__(self, row):
+        return self.store.path(row)
+
+class ImageStore:
+    """
+    Read-only view of an image store file, memory-mapped so opening it costs next to nothing.
+    """
+
+    def __init__(self, store_file):
+        self.store_file = Path(store_file)
+        with self.store_file.open('rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_length = _PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"'{self.store_file}' is not an image store.")
+        header = json.loads(self._mmap[_PREAMBLE.size:_PREAMBLE.size + header_length])
+        data_start = _align(_PREAMBLE.size + header_length)
+
+        self.count = header['count']
+        self.dim = header['dim']
+        self.embedded_count = header['embedded']
+        columns = {}
+        for name, spec in header['columns'].items():
+            dtype = np.dtype(spec['dtype'])
+            columns[name] = np.frombuffer(
+                self._mmap, dtype=dtype, count=int(np.prod(spec['shape'])), offset=data_start + spec['offset']
+            ).reshape(spec['shape'])
+        self.pages = columns['page']
+        self.embedded = columns['embedded']
+        self.vectors = columns['vectors']
+        self._path_offsets = columns['path_offsets']
+        self._text_offsets = columns['text_offsets']
+        self._paths = columns['paths']
+        self._texts = columns['texts']
+        logging.info(f"Opened image store '{self.store_file}' with {self.count} image(s).")
+
+    def __len__(self):
+        return self.count
+
+    def page_rows(self, page):
+        """
+        Returns the [start, end) rows of the images on `page`.
+        """
+        start = int(np.searchsorted(self.pages, page, side='left'))
+        end = int(np.searchsorted(self.pages, page, side='right'))
+        return start, end
+
+    def path(self, row):
+        """
+        Returns the absolute path of the image in `row`.
+        """
+        start, end = self._path_offsets[row], self._path_offsets[row + 1]
+        return str(BASE_DIR / self._paths[start:end].tobytes().decode('utf-8'))
+
+    def ocr_text(self, row):
+        start, end = self._text_offsets[row], self._text_offsets[row + 1]
+        return self._texts[start:end].tobytes().decode('utf-8')
+
+    def page_numbers(self):
+        return np.unique(self.pages).tolist()
+
+    def records(self, pages=None):
+        """
+        Yields every image, or those on `pages`, as a dict accepted by write_image_store().
+        """
+        if pages is None:
+            row_ranges = [(0, self.count)]
+        else:
+            row_ranges = [self.page_rows(int(page)) for page in sorted(pages, key=int)]
+        for start, end in row_ranges:
+            for row in range(start, end):
+                yield {
+                    'page': int(self.pages[row]),
+                    'path': self.path(row),
+                    'ocr_text': self.ocr_text(row),
+                    'vector': self.vectors[row].tolist() if self.embedded[row] else None,
+                }
+
+    def page_images(self):
+        """
+        Returns the whole store in the old image_metadata.json shape, {page: [{'path', 'ocr_text'}, ...]}.
+        This reads every row, so it is meant for tools and older callers, not the query path.
+        """
+        page_images = {}
+        for record in self.records():
+            page_images.setdefault(str(record['page']), []).append({'path': record['path'], 'ocr_text': record['ocr_text']})
+        return page_images
+
+    def image_index(self):
+        """
+        Returns an ImageIndex that scores directly against the mapped vector block.
+        """
+        return ImageIndex(self.vectors, _PageRanges(self), _Paths(self))
+
+def _legacy_vector(image_data):
+    """
+    Loads the vector an older layout kept in a separate joblib file, or returns the inline one.
+    """
+    if image_data.get('vector') is not None:
+        return image_data['vector']
+    embedding_path = image_data.get('embedding_path')
+    if not embedding_path or not Path(embedding_path).exists():
+        return None
+    from ocr import load_embeddings
+    embedding = load_embeddings(embedding_path)
+    return np.asarray(embedding, dtype=np.float32).tolist() if embedding is not None else None
+
+def migrate_metadata(metadata_file, store_file=None):
+    """
+    Converts image_metadata.json and its per-image joblib embeddings into an image store, leaving the
+    old files in place. Returns the path of the store.
+    """
+    metadata_file = Path(metadata_file)
+    store_file = Path(store_file) if store_file else metadata_file.with_suffix(STORE_SUFFIX)
+    with metadata_file.open('r') as f:
+        page_images = json.load(f)
+    records = [
+        {'page': int(page), 'path': image_data['path'], 'ocr_text': image_data.get('ocr_text', ""), 'vector': _legacy_vector(image_data)}
+        for page, images in page_images.items()
+        for image_data in images
+    ]
+    write_image_store(store_file, records)
+    logging.info(f"Migrated {len(records)} image record(s) from '{metadata_file}' to '{store_file}'.")
+    return store_file
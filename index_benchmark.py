@@ -0,0 +1,97 @@
+"""
+Compares FAISS index specs on the vectors of an existing vector store.
+
+For each spec it reports build time, recall@k against exact flat search, single-query latency
+percentiles and serialized index size. Queries are either a sample of the stored vectors or the
+embedded `query`/`title` fields of a JSONL file.
+
+    python index_benchmark.py --specs flat ivf-flat hnsw ivf-pq --k 10
+"""
+import argparse
+import json
+from pathlib import Path
+import time
+import faiss
+import numpy as np
+from index_spec import build_index, index_vectors, resolve_spec
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+def _load_queries(queries_file, vectors, num_queries):
+    if queries_file is None:
+        rows = np.random.default_rng(0).choice(len(vectors), min(num_queries, len(vectors)), replace=False)
+        return vectors[rows]
+
+    from embedding_handler import get_huggingface_embeddings
+    texts = []
+    with open(queries_file, 'r') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                texts.append(record.get('query') or record.get('title'))
+    return np.asarray(get_huggingface_embeddings().embed_documents(texts[:num_queries]), dtype=np.float32)
+
+def benchmark_spec(spec, vectors, queries, ground_truth, k):
+    resolved_spec = resolve_spec(spec, len(vectors), vectors.shape[1])
+    start = time.perf_counter()
+    if resolved_spec['factory'] == 'Flat':
+        index = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(vectors)
+    else:
+        index = build_index(vectors, resolved_spec)
+    build_seconds = time.perf_counter() - start
+
+    latencies = []
+    hits = 0
+    for query, truth in zip(queries, ground_truth):
+        start = time.perf_counter()
+        _, ids = index.search(query[np.newaxis, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(set(ids[0]) & set(truth))
+
+    return {
+        'spec': spec,
+        'factory': resolved_spec['factory'],
+        'build_seconds': build_seconds,
+        f'recall@{k}': hits / (len(queries) * k),
+        'latency_ms_p50': float(np.percentile(latencies, 50)),
+        'latency_ms_p95': float(np.percentile(latencies, 95)),
+        'latency_ms_p99': float(np.percentile(latencies, 99)),
+        'index_bytes': int(faiss.serialize_index(index).size),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FAISS index specs against exact search.")
+    parser.add_argument('--vectorstore', default=str(BASE_DIR / 'kavach_vectorstore'))
+    parser.add_argument('--specs', nargs='+', default=['flat', 'ivf-flat', 'hnsw', 'ivf-pq'])
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', help="JSONL file with a 'query' or 'title' field per line")
+    parser.add_argument('--num-queries', type=int, default=200)
+    parser.add_argument('--output', help="Write results as JSON to this file")
+    args = parser.parse_args()
+
+    # Ground truth is exact search over the stored vectors, which are only approximate if the store is PQ
+    vectors = np.ascontiguousarray(index_vectors(faiss.read_index(str(Path(args.vectorstore) / 'index.faiss'))), dtype=np.float32)
+    queries = _load_queries(args.queries, vectors, args.num_queries)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, args.k)
+
+    results = [benchmark_spec(spec, vectors, queries, ground_truth, args.k) for spec in args.specs]
+
+    print(f"{len(vectors)} vectors, {len(queries)} queries, k={args.k}")
+    print(f"{'spec':<10} {'factory':<18} {'build s':>8} {'recall':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'size MB':>8}")
+    for result in results:
+        print(
+            f"{result['spec']:<10} {result['factory']:<18} {result['build_seconds']:>8.2f} "
+            f"{result[f'recall@{args.k}']:>7.3f} {result['latency_ms_p50']:>8.3f} {result['latency_ms_p95']:>8.3f} "
+            f"{result['latency_ms_p99']:>8.3f} {result['index_bytes'] / 1e6:>8.2f}"
+        )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+import os
+from pathlib import Path
+import json
+import logging
+import math
+import faiss
+import numpy as np
+from telemetry import configure_logging
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+# Configure logging
+configure_logging()
+
+INDEX_SPEC_FILENAME = 'index_spec.json'
+
+# Index type used for new builds: a preset name below or any FAISS index_factory string
+INDEX_SPEC = os.getenv("KAVACH_INDEX_SPEC", "flat")
+
+# Presets; {nlist} and {pq_m} are filled in from the corpus size and vector dimension at build time
+PRESETS = {
+    'flat': {'factory': 'Flat', 'search': {}},
+    'ivf-flat': {'factory': 'IVF{nlist},Flat', 'search': {'nprobe': 16}},
+    'hnsw': {'factory': 'HNSW32', 'search': {'efSearch': 64}},
+    'ivf-pq': {'factory': 'IVF{nlist},PQ{pq_m}', 'search': {'nprobe': 16}},
+}
+
+# Upper bound on vectors used to train IVF/PQ quantizers
+MAX_TRAINING_VECTORS = 100_000
+# Below this many vectors approximate indexes cannot be trained sensibly and flat search is fast anyway
+MIN_VECTORS_FOR_APPROXIMATE = 1000
+
+def resolve_spec(spec, num_vectors, dimension):
+    """
+    Turns a preset name or factory string into {'name', 'factory', 'search'} for a corpus of the given size.
+    """
+    preset = PRESETS.get(spec.lower(), {'factory': spec, 'search': {}})
+    if preset['factory'] != 'Flat' and num_vectors < MIN_VECTORS_FOR_APPROXIMATE:
+        logging.info(f"Only {num_vectors} vector(s); using a flat index instead of '{spec}'.")
+        return {'name': spec, 'factory': 'Flat', 'search': {}}
+    # Roughly 4 * sqrt(n) lists, with at least 39 training points per list as FAISS recommends
+    nlist = max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+    pq_m = next(m for m in (48, 32, 24, 16, 12, 8, 4, 2, 1) if dimension % m == 0)
+    return {
+        'name': spec,
+        'factory': preset['factory'].format(nlist=nlist, pq_m=pq_m),
+        'search': dict(preset['search']),
+    }
+
+def is_flat(resolved_spec):
+    return resolved_spec['factory'] == 'Flat'
+
+def supports_removal(resolved_spec):
+    """
+    Only flat indexes remove vectors in place safely. HNSW graphs cannot remove at all, and IVF
+    indexes keep the original labels after remove_ids, which breaks the positional docstore mapping
+    LangChain rebuilds on delete and later reconstruct_n() rebuilds.
+    """
+    return is_flat(resolved_spec)
+
+def apply_search_params(index, resolved_spec):
+    parameter_space = faiss.ParameterSpace()
+    for name, value in resolved_spec['search'].items():
+        parameter_space.set_index_parameter(index, name, value)
+
+def build_index(vectors, resolved_spec):
+    """
+    Creates, trains and fills a FAISS index for `vectors` (float32, one row per vector) in the original order.
+    """
+    index = faiss.index_factory(vectors.shape[1], resolved_spec['factory'], faiss.METRIC_L2)
+    if not index.is_trained:
+        training = vectors
+        if len(vectors) > MAX_TRAINING_VECTORS:
+            rows = np.random.default_rng(0).choice(len(vectors), MAX_TRAINING_VECTORS, replace=False)
+            training = vectors[rows]
+        index.train(training)
+    index.add(vectors)
+    apply_search_params(index, resolved_spec)
+    return index
+
+def index_vectors(index):
+    """
+    Returns every stored vector in insertion order. Exact for Flat and HNSW, approximate for PQ.
+    """
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    if not hasattr(index, 'make_direct_map'):
+        return index.reconstruct_n(0, index.ntotal)
+    # IVF indexes need a direct map to reconstruct; drop it again so the saved index is unchanged
+    index.make_direct_map()
+    try:
+        return index.reconstruct_n(0, index.ntotal)
+    finally:
+        index.make_direct_map(False)
+
+def apply_index_spec(vectorstore, spec):
+    """
+    Replaces the vectorstore's index with one built to `spec`, keeping vector order so the docstore
+    mapping stays valid. Returns the resolved spec.
+    """
+    vectors = index_vectors(vectorstore.index)
+    resolved_spec = resolve_spec(spec, len(vectors), vectorstore.index.d)
+    if not is_flat(resolved_spec):
+        vectorstore.index = build_index(vectors, resolved_spec)
+        logging.info(f"Built '{resolved_spec['factory']}' index over {len(vectors)} vector(s).")
+    elif not isinstance(vectorstore.index, faiss.IndexFlat):
+        to_flat(vectorstore)
+    return resolved_spec
+
+def to_flat(vectorstore):
+    """
+    Swaps the vectorstore's index for an exact flat copy, e.g. before removing vectors from an HNSW or IVF index.
+    """
+    vectors = index_vectors(vectorstore.index)
+    flat = faiss.IndexFlatL2(vectorstore.index.d)
+    flat.add(vectors)
+    vectorstore.index = flat
+
+def save_index_spec(vectorstore_path, resolved_spec):
+    with (Path(vectorstore_path) / INDEX_SPEC_FILENAME).open('w') as f:
+        json.dump(resolved_spec, f)
+
+def load_index_spec(vectorstore_path):
+    """
+    Returns the spec an existing index was built with; indexes built before specs were recorded are flat.
+    """
+    spec_file = Path(vectorstore_path) / INDEX_SPEC_FILENAME
+    if not spec_file.exists():
+        return {'name': 'flat', 'factory': 'Flat', 'search': {}}
+    with spec_file.open('r') as f:
+        return json.load(f)
@@ -0,0 +1,110 @@
+import os
+from pathlib import Path
+import json
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import islice
+import fitz  # PyMuPDF
+from langchain.vectorstores import FAISS
+from telemetry import configure_logging
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+# Configure logging
+configure_logging()
+
+# Number of processes extracting text, and pages handed to each task
+INGEST_WORKERS = int(os.getenv("KAVACH_INGEST_WORKERS", os.cpu_count() or 1))
+PAGES_PER_TASK = int(os.getenv("KAVACH_INGEST_PAGES_PER_TASK", 32))
+# Chunks embedded and added to the index per step; bounds peak memory during a build
+EMBEDDING_BATCH_SIZE = int(os.getenv("KAVACH_INGEST_BATCH_SIZE", 256))
+
+def pdf_fingerprint(pdf_path):
+    """
+    Returns a cheap whole-file fingerprint of the PDF. While it matches the one recorded with an index,
+    the PDF is taken as unchanged and its pages are not re-read or re-hashed.
+    """
+    stat = Path(pdf_path).stat()
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def load_pdf_fingerprint(fingerprint_file):
+    fingerprint_file = Path(fingerprint_file)
+    if not fingerprint_file.exists():
+        return None
+    with fingerprint_file.open('r') as f:
+        return json.load(f)
+
+def save_pdf_fingerprint(fingerprint_file, fingerprint):
+    with Path(fingerprint_file).open('w') as f:
+        json.dump(fingerprint, f)
+
+def _extract_text_range(pdf_path, start, end):
+    """
+    Returns {page_num: text} for zero-based pages [start, end). Runs in a worker process with its own handle.
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        page_texts = {}
+        for page_index in range(start, end):
+            text = doc.load_page(page_index).get_text()
+            if text.strip():
+                page_texts[page_index + 1] = text
+        return page_texts
+    finally:
+        doc.close()
+
+def iter_page_texts(pdf_path, page_count, max_workers=None):
+    """
+    Extracts text across a process pool split by page ranges, yielding {page_num: text} per range as it completes.
+    """
+    max_workers = max_workers or INGEST_WORKERS
+    ranges = [(start, min(start + PAGES_PER_TASK, page_count)) for start in range(0, page_count, PAGES_PER_TASK)]
+    start_time = time.perf_counter()
+    pages_done = 0
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_extract_text_range, str(pdf_path), start, end) for start, end in ranges]
+        for future in as_completed(futures):
+            page_texts = future.result()
+            pages_done += len(page_texts)
+            yield page_texts
+
+    elapsed = time.perf_counter() - start_time
+    logging.info(f"Extracted text from {pages_done} page(s) in {elapsed:.2f}s ({pages_done / elapsed if elapsed else 0:.1f} pages/s, {max_workers} worker(s)).")
+
+def read_page_texts(pdf_path, page_count, max_workers=None):
+    """
+    Returns {page_num: text} for every page with text, in page order.
+    """
+    page_texts = {}
+    for part in iter_page_texts(pdf_path, page_count, max_workers):
+        page_texts.update(part)
+    return dict(sorted(page_texts.items()))
+
+def add_chunks_in_batches(vectorstore, chunks, embeddings, metadata_fn, batch_size=None):
+    """
+    Embeds `chunks` (any iterable) in fixed-size batches and adds each batch to `vectorstore` as it
+    completes, creating the store from the first batch if it is None. Returns the vectorstore.
+    """
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    chunks = iter(chunks)
+    start_time = time.perf_counter()
+    total = 0
+
+    while True:
+        batch = list(islice(chunks, batch_size))
+        if not batch:
+            break
+        texts = [chunk['text'] for chunk in batch]
+        metadatas = [metadata_fn(chunk) for chunk in batch]
+        if vectorstore is None:
+            vectorstore = FAISS.from_texts(texts=texts, embedding=embeddings, metadatas=metadatas)
+        else:
+            vectorstore.add_texts(texts=texts, metadatas=metadatas)
+        total += len(batch)
+
+    elapsed = time.perf_counter() - start_time
+    logging.info(f"Embedded and indexed {total} chunk(s) in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.1f} chunks/s, batch size {batch_size}).")
+    return vectorstore
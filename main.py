@@ -1,24 +1,24 @@
 import os
 from pathlib import Path
+import io
 import streamlit as st
-from embeddings import create_or_load_vectorstore
-from chatbot import get_kavach_decision
+from corpus import Corpus, CorpusShard, DEFAULT_DOCUMENT, load_manifest, parse_page_id, qualify_page
+import api_client
+from pipeline import StageTimer, executor
+from page_renderer import extract_highlighted_page, render_chunk_highlights
+from session_history import SessionHistory
 import logging
-import fitz  # PyMuPDF for PDF rendering and highlighting
 from urllib.parse import urlencode
-from googletrans import Translator  # Import googletrans for testing multilingual support
+from telemetry import configure_logging, start_metrics_server
 
 # Set Base Directory
 BASE_DIR = Path(__file__).parent
 
 # Configure logging
-log_file = BASE_DIR / 'main.log'
-logging.basicConfig(
-    filename=log_file,
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+configure_logging()
+
+# Expose /metrics when KAVACH_METRICS_PORT is set; only the first run of the script starts it
+start_metrics_server()
 
 # Set Page Configuration
 st.set_page_config(
@@ -44,101 +44,129 @@ load_css("styles.css")
 # Title
 st.markdown("<h1 style='text-align: center; color: #4B8BBE;'>Kavach Chatbot</h1>", unsafe_allow_html=True)
 
-# Paths
-pdf_path = BASE_DIR / 'kavach_guidelines.pdf'
-vectorstore_path = BASE_DIR / 'kavach_vectorstore'
-
-# Initialize or load the vectorstore
+# Initialize or load one vectorstore shard per document in the corpus manifest
 with st.spinner("Initializing vector store..."):
     try:
-        vectorstore, page_images = create_or_load_vectorstore(pdf_path, vectorstore_path)
-        logging.info("Vector store and images initialized successfully.")
+        if api_client.API_URL:
+            # Queries go to the API service; only page files are needed locally, for labels and highlighting
+            corpus = Corpus([CorpusShard(document, None, None, None) for document in load_manifest()])
+        else:
+            from embeddings import create_or_load_corpus
+            from retrieval import preload_models
+            corpus = create_or_load_corpus()
+            # Query-time models load in the background so the page renders without waiting for them
+            executor.submit(preload_models)
+        logging.info(f"Vector stores and images initialized successfully for {len(corpus)} document(s).")
     except Exception as e:
         st.error(f"Initialization failed: {e}")
         logging.error(f"Initialization failed: {e}")
         st.stop()
 
-# Initialize Conversation History in Session State
-if 'messages' not in st.session_state:
-    st.session_state['messages'] = []
+# Rendered related images kept across reruns and sessions, and their longest side in pixels
+THUMBNAIL_CACHE_ENTRIES = int(os.getenv("KAVACH_THUMBNAIL_CACHE_ENTRIES", 256))
+THUMBNAIL_PIXELS = 600
 
-# Initialize the Translator
-translator = Translator()
+def _history_llm(prompt):
+    import gemini_client
+    return gemini_client.generate(prompt)
 
-# Function to extract a highlighted page image from a PDF
-def extract_highlighted_page(pdf_path, page_number, text_to_highlight):
-    try:
-        doc = fitz.open(pdf_path)
-        page = doc.load_page(page_number - 1)  # Pages are zero-indexed in PyMuPDF
-
-        # Search for the text and highlight it
-        text_instances = page.search_for(text_to_highlight)
-        for inst in text_instances:
-            page.draw_rect(inst, color=(1, 0, 0), fill=(1, 0.8, 0.8, 0.4))
-
-        # Save page as an image
-        image_filename = f"highlighted_page_{page_number}.png"
-        image_path = BASE_DIR / image_filename
-        pix = page.get_pixmap()
-        pix.save(str(image_path))
-        logging.info(f"Extracted highlighted page {page_number} as '{image_path}'.")
-
-        return image_path
-    except Exception as e:
-        logging.error(f"Error extracting highlighted page: {e}")
-        return None
+# Initialize Conversation History in Session State: a bounded window of turns plus a summary of older ones.
+# A thin client has no Gemini access, so it summarizes by listing earlier questions and never condenses
+if 'history' not in st.session_state:
+    st.session_state['history'] = SessionHistory(llm=None if api_client.API_URL else _history_llm)
+
+# The translation service and its backend are created on the first non-English query and shared across sessions
+@st.cache_resource(show_spinner=False)
+def get_translator():
+    from translation import get_translation_service
+    return get_translation_service()
+
+def source_links(pages, highlights, content):
+    """
+    Returns the markdown links to the source pages of an answer. Built once per turn, not on every rerun.
+    """
+    page_links = []
+    for page in pages:
+        spans = highlights.get(page)
+        if spans:
+            # Highlight the exact chunks that supported the answer
+            query_params = urlencode({"page": page, "spans": ",".join(f"{start}-{end}" for start, end in spans)})
+        else:
+            query_params = urlencode({"page": page, "content": content})
+        page_links.append(f"[{corpus.page_label(page)}](/?{query_params})")
+    return ", ".join(page_links)
+
+@st.cache_data(show_spinner=False, max_entries=THUMBNAIL_CACHE_ENTRIES)
+def load_thumbnail(image_path, mtime_ns):
+    """
+    Returns the image scaled down to display size, as bytes. `mtime_ns` is part of the cache key, so a
+    re-extracted image is loaded again.
+    """
+    from PIL import Image
+    with Image.open(image_path) as image:
+        image_format = 'JPEG' if image.format == 'JPEG' else 'PNG'
+        image.thumbnail((THUMBNAIL_PIXELS, THUMBNAIL_PIXELS))
+        if image_format == 'PNG' and image.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+            image = image.convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, format=image_format)
+    return buffer.getvalue()
 
 # Display Conversation History
 def display_chat_history():
-    """Function to display the entire conversation history."""
-    for idx, msg in enumerate(st.session_state['messages']):
-        if msg['role'] == 'user':
-            st.markdown(f"**You:** {msg['content']}")
-        elif msg['role'] == 'assistant':
-            st.markdown(f"**Chatbot:** {msg['content']}")
-            if 'pages' in msg and msg['pages']:
-                # Add clickable links for source pages using markdown links
-                page_links = []
-                for page in msg['pages']:
-                    query_params = urlencode({"page": page, "content": msg['content']})
-                    link = f"[Page {page}](/?{query_params})"
-                    page_links.append(link)
-                source_links = ", ".join(page_links)
-                st.markdown(f"*Source Pages:* {source_links}", unsafe_allow_html=True)
-
-            # Display images related to the response, if any, in a two-column grid
-            if 'images' in msg and msg['images']:
-                st.markdown("**Related Images:**")
-                num_images = len(msg['images'])
-                for i in range(0, num_images, 2):
-                    cols = st.columns(2, gap="small")
-                    for j in range(2):
-                        if i + j < num_images:
-                            img_path = BASE_DIR / msg['images'][i + j]
-                            if img_path.exists():
-                                try:
-                                    cols[j].image(str(img_path), width=300)
-                                    logging.info(f"Displayed related image: {img_path}")
-                                except Exception as e:
-                                    cols[j].error(f"Failed to load image: {img_path}")
-                                    logging.error(f"Failed to load image '{img_path}': {e}")
-                            else:
-                                cols[j].error(f"Image not found: {img_path}")
-                                logging.warning(f"Image not found: {img_path}")
+    """Shows the summary of earlier turns, then the turns in the history window."""
+    history = st.session_state['history']
+    if history.earlier_turns:
+        with st.expander(f"Earlier conversation ({history.earlier_turns} turn(s))"):
+            st.markdown(history.summary_text() or "Summarizing earlier turns...")
+
+    for turn in history.turns:
+        st.markdown(f"**You:** {turn['query']}")
+        st.markdown(f"**Chatbot:** {turn['answer']}")
+        if turn['sources']:
+            # Clickable links for source pages using markdown links
+            st.markdown(f"*Source Pages:* {turn['sources']}", unsafe_allow_html=True)
+
+        # Display images related to the response, if any, in a two-column grid
+        if turn['images']:
+            st.markdown("**Related Images:**")
+            num_images = len(turn['images'])
+            for i in range(0, num_images, 2):
+                cols = st.columns(2, gap="small")
+                for j in range(2):
+                    if i + j < num_images:
+                        img_path = BASE_DIR / turn['images'][i + j]
+                        if img_path.exists():
+                            try:
+                                cols[j].image(load_thumbnail(str(img_path), img_path.stat().st_mtime_ns), width=300)
+                            except Exception as e:
+                                cols[j].error(f"Failed to load image: {img_path}")
+                                logging.error(f"Failed to load image '{img_path}': {e}")
+                        else:
+                            cols[j].error(f"Image not found: {img_path}")
+                            logging.warning(f"Image not found: {img_path}")
 
 # Display the conversation history initially
 display_chat_history()
 
 # Check if there are query parameters to extract highlighted content
 query_params = st.experimental_get_query_params()
-if "page" in query_params and "content" in query_params:
-    page_number = int(query_params["page"][0])
-    content_to_highlight = query_params["content"][0]
+if "page" in query_params and ("spans" in query_params or "content" in query_params):
+    page_id = query_params["page"][0]
+    if ":" not in page_id:
+        # Links created before pages were document-qualified
+        page_id = qualify_page(DEFAULT_DOCUMENT['id'], page_id)
+    doc_id, page_number = parse_page_id(page_id)
+    shard = corpus.shard(doc_id)
 
-    with st.spinner(f"Loading and highlighting page {page_number}..."):
-        highlight_image = extract_highlighted_page(pdf_path, page_number, content_to_highlight)
+    with st.spinner(f"Loading and highlighting {corpus.page_label(page_id)}..."):
+        if "spans" in query_params:
+            word_spans = [span.split("-") for span in query_params["spans"][0].split(",") if "-" in span]
+            highlight_image = render_chunk_highlights(page_number, word_spans, layout_dir=shard.layout_dir)
+        else:
+            highlight_image = extract_highlighted_page(shard.pdf_path, page_number, query_params["content"][0])
         if highlight_image:
-            st.image(str(highlight_image), caption=f"Highlighted Page {page_number}", use_column_width=True)
+            st.image(highlight_image, caption=f"Highlighted {corpus.page_label(page_id)}", use_column_width=True)
 
 # User Input at the Bottom using a form
 with st.form("chat_form", clear_on_submit=True):
@@ -151,56 +179,96 @@ with st.form("chat_form", clear_on_submit=True):
             st.warning("Please enter a valid question.")
             logging.warning("User attempted to send an empty query.")
         else:
+            timer = StageTimer()
+
             # Translate user query to English if needed (only for internal processing)
             user_query_english = user_query
-            user_query_translated = user_query  # Initialize with original query
+            display_translation = None
+            answer_translation = None
             if language != "English":
+                from translation import StreamingTranslation
                 lang_code = {'Hindi': 'hi', 'Tamil': 'ta', 'Telugu': 'te', 'Kannada': 'kn'}
+                translator = get_translator()
+
+                # Translate the original input to selected language for display, alongside the English translation and retrieval
+                display_translation = timer.submit('translate_display', translator.translate, user_query, dest=lang_code[language])
                 try:
-                    user_query_english = translator.translate(user_query, dest='en').text
+                    # Retrieval needs the English query; repeated queries are served from the translation cache
+                    with timer.stage('translate_query'):
+                        user_query_english = translator.translate(user_query, dest='en')
                     logging.info(f"User query translated to English: {user_query_english}")
                 except Exception as e:
                     logging.error(f"Translation error: {e}")
                     st.warning(f"Translation failed: {e}")
 
-                # Translate the original English input to selected language for display
+                # The answer is translated sentence by sentence while it is generated
+                answer_translation = StreamingTranslation(
+                    translator, lang_code[language], lambda fn, *args: timer.submit('translate_answer', fn, *args)
+                )
+
+            # Process the query and stream the assistant's response as it is generated
+            history = st.session_state['history']
+            response_placeholder = st.empty()
+            try:
+                with st.spinner("Processing your query..."):
+                    # A follow-up is rewritten as a standalone question from the recent turns, if enabled
+                    with timer.stage('condense_query'):
+                        retrieval_query = history.condense(user_query_english)
+                    timer.annotate(condensed=retrieval_query != user_query_english)
+                    if api_client.API_URL:
+                        stream, pages, images_future, highlights = api_client.get_kavach_decision_stream(retrieval_query)
+                    else:
+                        # Imported here so a thin client needs neither the Gemini key nor the models
+                        from chatbot import get_kavach_decision_stream
+                        stream, pages, images_future, highlights = get_kavach_decision_stream(corpus, retrieval_query, timer=timer)
+                decision = ""
+                for decision in stream:
+                    # English answers are shown as they arrive; other languages are translated as sentences complete
+                    if answer_translation is None:
+                        response_placeholder.markdown(f"**Chatbot:** {decision}")
+                    else:
+                        answer_translation.feed(decision)
+                images = images_future.result()
+                logging.info(f"Assistant decision: {decision}")
+            except Exception as e:
+                decision = f"An error occurred while processing your request: {e}"
+                pages = []
+                images = []
+                highlights = {}
+                logging.error(f"Error during get_kavach_decision: {e}")
+            response_placeholder.empty()
+
+            user_query_translated = user_query  # Initialize with original query
+            if display_translation is not None:
                 try:
-                    user_query_translated = translator.translate(user_query, dest=lang_code[language]).text
+                    user_query_translated = display_translation.result()
                 except Exception as e:
                     logging.error(f"Translation error: {e}")
                     user_query_translated = user_query  # Fallback to original input
 
-            # Append translated user message to conversation history for display purposes
-            st.session_state['messages'].append({'role': 'user', 'content': user_query_translated})
             logging.info(f"User query in selected language: {user_query_translated}")
 
-            # Process the query and get the assistant's response
-            with st.spinner("Processing your query..."):
-                try:
-                    decision, pages, images = get_kavach_decision(vectorstore, user_query_english, page_images)
-                    logging.info(f"Assistant decision: {decision}")
-                except Exception as e:
-                    decision = f"An error occurred while processing your request: {e}"
-                    pages = []
-                    images = []
-                    logging.error(f"Error during get_kavach_decision: {e}")
-
             # Translate response back to the user's selected language
             decision_translated = decision
-            if language != "English":
+            if answer_translation is not None:
                 try:
-                    decision_translated = translator.translate(decision, dest=lang_code[language]).text
+                    decision_translated = answer_translation.finish(decision)
                     logging.info(f"Assistant decision translated to {language}: {decision_translated}")
                 except Exception as e:
                     logging.error(f"Translation error: {e}")
                     st.warning(f"Translation failed: {e}")
                     decision_translated = decision  # Fallback to original response
+            timer.report()
 
-            # Append assistant message to conversation history
-            st.session_state['messages'].append({
-                'role': 'assistant',
-                'content': decision_translated,
+            # Append the turn to the conversation history; turns beyond the window are summarized in the background
+            history.add_turn({
+                'query': user_query_translated,
+                'answer': decision_translated,
+                'query_english': user_query_english,
+                'answer_english': decision,
                 'pages': pages,
+                'highlights': highlights,
+                'sources': source_links(pages, highlights, decision_translated),
                 'images': [Path(img).relative_to(BASE_DIR) for img in images]  # Ensure paths are relative
             })
 
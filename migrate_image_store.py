@@ -0,0 +1,111 @@
+"""
+Converts each document's image_metadata.json and per-image *_embedding.joblib files into a single
+memory-mapped image store, then checks that the store holds the same images, OCR text and vectors.
+
+    python migrate_image_store.py                  # every document in the corpus manifest
+    python migrate_image_store.py --remove-legacy  # also delete the JSON, joblib files and old image_index/
+
+The app migrates a document on its own the first time it finds metadata without a store; this tool
+does it ahead of time and cleans up the old files.
+"""
+from pathlib import Path
+import argparse
+import json
+import shutil
+import sys
+import numpy as np
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+def verify_store(metadata_file, store_file):
+    """
+    Returns a list of differences between the JSON metadata and the store; empty if they match.
+    """
+    from image_index import _normalize
+    from image_store import ImageStore, _legacy_vector
+    with Path(metadata_file).open('r') as f:
+        page_images = json.load(f)
+    store = ImageStore(store_file)
+    stored = {record['path']: record for record in store.records()}
+
+    problems = []
+    expected_count = sum(len(images) for images in page_images.values())
+    if expected_count != len(store):
+        problems.append(f"{expected_count} image(s) in the metadata, {len(store)} in the store")
+    for page, images in page_images.items():
+        for image_data in images:
+            record = stored.get(str(BASE_DIR / image_data['path']))
+            if record is None:
+                problems.append(f"missing '{image_data['path']}'")
+                continue
+            if record['page'] != int(page) or record['ocr_text'] != image_data.get('ocr_text', ""):
+                problems.append(f"page or OCR text differs for '{image_data['path']}'")
+            vector = _legacy_vector(image_data)
+            if (vector is None) != (record['vector'] is None):
+                problems.append(f"embedding presence differs for '{image_data['path']}'")
+            elif vector is not None and not np.allclose(_normalize(np.asarray(vector, dtype=np.float32)), record['vector'], atol=1e-6):
+                problems.append(f"embedding differs for '{image_data['path']}'")
+    return problems
+
+def remove_legacy_files(metadata_file, document):
+    """
+    Deletes the JSON metadata, the joblib embedding files it references and the old prebuilt image index.
+    """
+    with Path(metadata_file).open('r') as f:
+        page_images = json.load(f)
+    embedding_dirs = set()
+    for images in page_images.values():
+        for image_data in images:
+            if image_data.get('embedding_path'):
+                embedding_path = Path(image_data['embedding_path'])
+                embedding_path.unlink(missing_ok=True)
+                embedding_dirs.add(embedding_path.parent)
+    for directory in embedding_dirs:
+        if directory.exists() and not any(directory.iterdir()):
+            directory.rmdir()
+    image_index_dir = BASE_DIR / document.get('image_index_dir', Path(document['metadata_file']).parent / 'image_index')
+    if (image_index_dir / 'embeddings.npy').exists():
+        shutil.rmtree(image_index_dir)
+    Path(metadata_file).unlink()
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate image metadata and joblib embeddings to the image store.")
+    parser.add_argument('--manifest', help="Corpus manifest; defaults to the app's")
+    parser.add_argument('--remove-legacy', action='store_true', help="Delete the old files once the store is verified")
+    parser.add_argument('--force', action='store_true', help="Rewrite stores that already exist")
+    args = parser.parse_args()
+
+    from corpus import MANIFEST_FILE, load_manifest
+    from image_store import STORE_SUFFIX, migrate_metadata
+    failed = False
+    for document in load_manifest(args.manifest or MANIFEST_FILE):
+        metadata_file = BASE_DIR / document['metadata_file']
+        store_file = metadata_file.with_suffix(STORE_SUFFIX)
+        if not metadata_file.exists():
+            print(f"{document['id']}: no '{document['metadata_file']}', nothing to migrate")
+            continue
+        if store_file.exists() and not args.force:
+            print(f"{document['id']}: store exists, verifying")
+        else:
+            migrate_metadata(metadata_file, store_file)
+
+        problems = verify_store(metadata_file, store_file)
+        if problems:
+            failed = True
+            print(f"{document['id']}: {len(problems)} difference(s), keeping the old files")
+            for problem in problems[:20]:
+                print(f"    {problem}")
+            continue
+
+        legacy_bytes = metadata_file.stat().st_size
+        print(f"{document['id']}: migrated to '{store_file.relative_to(BASE_DIR)}' ({store_file.stat().st_size / 1e6:.1f} MB; JSON was {legacy_bytes / 1e6:.1f} MB)")
+        if args.remove_legacy:
+            remove_legacy_files(metadata_file, document)
+            print(f"{document['id']}: removed the old metadata and embedding files")
+
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
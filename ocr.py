@@ -1,46 +1,78 @@
 import os
 from pathlib import Path
-import easyocr
 import logging
+import threading
 import joblib
 from embedding_handler import get_huggingface_embeddings
+from telemetry import configure_logging
 
 # Set Base Directory
 BASE_DIR = Path(__file__).parent
 
 # Configure logging
-log_file = BASE_DIR / 'ocr.log'
-logging.basicConfig(
-    filename=log_file,
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+configure_logging()
 
-# Initialize EasyOCR Reader
-reader = easyocr.Reader(['en'], gpu=False)
+# The EasyOCR reader is created on first use, once per process, so loading existing image metadata never pays for it
+_reader = None
+_reader_lock = threading.Lock()
 
-# Get HuggingFace Embeddings
-embeddings = get_huggingface_embeddings()
+def get_reader():
+    global _reader
+    with _reader_lock:
+        if _reader is None:
+            import easyocr
+            _reader = easyocr.Reader(['en'], gpu=False)
+            logging.info("Initialized EasyOCR reader.")
+        return _reader
 
-def extract_text_and_embeddings(image_path):
+def init_ocr_worker():
+    """
+    Initializer for OCR worker processes: one torch thread each, so the pool does not oversubscribe the CPU.
+    """
+    import torch
+    torch.set_num_threads(1)
+
+def read_image_text(image_path):
+    """
+    Runs OCR on a single image and returns the recognized text, "" if the image has none.
+    Errors are raised, so OCR worker pools can tell a failed image from one without text.
+    """
     image_path = Path(image_path)
     if not image_path.exists():
-        logging.error(f"Image file '{image_path}' not found.")
-        return "", None
+        raise FileNotFoundError(f"Image file '{image_path}' not found.")
+    results = get_reader().readtext(str(image_path), detail=0)
+    text = ' '.join(results).strip()
+    logging.info(f"Extracted text from '{image_path}': {text[:100]}...")
+    return text
 
+def extract_text(image_path):
+    """
+    Runs OCR on a single image and returns the recognized text, or "" on failure.
+    """
     try:
-        results = reader.readtext(str(image_path), detail=0)
-        text = ' '.join(results).strip()
-        logging.info(f"Extracted text from '{image_path}': {text[:100]}...")
-
-        if text:
-            text_embedding = embeddings.embed_query(text)
-            return text, text_embedding
-        else:
-            return "", None
+        return read_image_text(image_path)
     except Exception as e:
         logging.error(f"Error extracting text from '{image_path}': {e}")
+        return ""
+
+def embed_texts(texts):
+    """
+    Embeds a batch of OCR texts in a single model call.
+    """
+    if not texts:
+        return []
+    return get_huggingface_embeddings().embed_documents(list(texts))
+
+def extract_text_and_embeddings(image_path):
+    text = extract_text(image_path)
+    if not text:
+        return "", None
+
+    try:
+        text_embedding = get_huggingface_embeddings().embed_query(text)
+        return text, text_embedding
+    except Exception as e:
+        logging.error(f"Error embedding text from '{image_path}': {e}")
         return "", None
 
 def save_embeddings(embedding, embedding_path):
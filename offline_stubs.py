@@ -0,0 +1,87 @@
+import asyncio
+from pathlib import Path
+import hashlib
+import logging
+import time
+from telemetry import configure_logging
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+# Configure logging
+configure_logging()
+
+class _StubChunk:
+    def __init__(self, text):
+        self.text = text
+
+class _StubStream:
+    def __init__(self, chunks, chunk_latency):
+        self.chunks = chunks
+        self.chunk_latency = chunk_latency
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(self.chunk_latency)
+            yield _StubChunk(chunk)
+
+class StubGeminiModel:
+    """
+    Offline stand-in for genai.GenerativeModel. The answer is derived from the prompt, so the same
+    prompt always gets the same answer, and latency is simulated with a fixed time to first token
+    plus a fixed delay per streamed chunk.
+    """
+
+    def __init__(self, first_token_seconds=0.8, chunk_seconds=0.05, chunk_words=8):
+        self.first_token_seconds = first_token_seconds
+        self.chunk_seconds = chunk_seconds
+        self.chunk_words = chunk_words
+
+    def answer(self, prompt):
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]
+        context = " ".join(prompt.split()[:60])
+        return f"Offline answer {digest}. Based on the retrieved guidelines: {context}"
+
+    def _chunks(self, text):
+        words = text.split(" ")
+        return [" ".join(words[i:i + self.chunk_words]) + " " for i in range(0, len(words), self.chunk_words)]
+
+    async def generate_content_async(self, prompt, stream=False):
+        await asyncio.sleep(self.first_token_seconds)
+        text = self.answer(prompt)
+        if stream:
+            return _StubStream(self._chunks(text), self.chunk_seconds)
+        await asyncio.sleep(self.chunk_seconds * len(self._chunks(text)))
+        return _StubChunk(text)
+
+class StubTranslation:
+    def __init__(self, text, src, dest):
+        self.text = text
+        self.src = src
+        self.dest = dest
+
+class StubTranslator:
+    """
+    Offline stand-in for googletrans.Translator. English passes through; other languages get a
+    '[xx] ' prefix so translated text is recognizable. Like googletrans, a list of strings is
+    translated in one call with the latency of one request.
+    """
+
+    def __init__(self, latency_seconds=0.2):
+        self.latency_seconds = latency_seconds
+
+    def translate(self, text, dest='en', src='auto'):
+        time.sleep(self.latency_seconds)
+        if isinstance(text, list):
+            return [StubTranslation(item if dest == 'en' else f"[{dest}] {item}", src, dest) for item in text]
+        return StubTranslation(text if dest == 'en' else f"[{dest}] {text}", src, dest)
+
+def install_gemini_stub(model=None):
+    """
+    Routes every Gemini request made through gemini_client to `model` (a StubGeminiModel by default).
+    """
+    import gemini_client
+    model = model or StubGeminiModel()
+    gemini_client.get_model = lambda: model
+    logging.info("Gemini requests are served by the offline stub.")
+    return model
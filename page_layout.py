@@ -0,0 +1,124 @@
+from pathlib import Path
+import json
+import logging
+import re
+from functools import lru_cache
+import fitz  # PyMuPDF
+from telemetry import configure_logging
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+# Configure logging
+configure_logging()
+
+# Scale of the pre-rendered base page images relative to PDF points
+RENDER_ZOOM = 1.5
+
+def _layout_paths(layout_dir, page_number):
+    return layout_dir / f"page_{page_number}.json", layout_dir / f"page_{page_number}.png"
+
+def build_page_layout(pdf_path, layout_dir='page_layout', pages=None, doc=None):
+    """
+    Stores each page's word bounding boxes and a pre-rendered base image in `layout_dir`.
+    Pages whose files are missing are always built; `pages` forces a rebuild of those page numbers.
+    An already open `doc` may be passed to avoid reopening the PDF.
+    """
+    layout_dir = BASE_DIR / layout_dir
+    layout_dir.mkdir(parents=True, exist_ok=True)
+    pages = {int(page) for page in pages} if pages else set()
+
+    owns_doc = doc is None
+    if owns_doc:
+        try:
+            doc = fitz.open(str(pdf_path))
+        except Exception as e:
+            logging.error(f"Error opening PDF file '{pdf_path}': {e}")
+            raise e
+
+    built = 0
+    for page_number in range(1, len(doc) + 1):
+        json_path, png_path = _layout_paths(layout_dir, page_number)
+        if page_number not in pages and json_path.exists() and png_path.exists():
+            continue
+
+        page = doc.load_page(page_number - 1)
+        # Each word is (x0, y0, x1, y1, text, block_no, line_no, word_no)
+        words = page.get_text("words")
+        layout = {
+            'width': page.rect.width,
+            'height': page.rect.height,
+            'zoom': RENDER_ZOOM,
+            'words': [word[4] for word in words],
+            'boxes': [[round(word[0], 2), round(word[1], 2), round(word[2], 2), round(word[3], 2), word[5], word[6]] for word in words],
+        }
+        with json_path.open('w') as f:
+            json.dump(layout, f)
+        page.get_pixmap(matrix=fitz.Matrix(RENDER_ZOOM, RENDER_ZOOM)).save(str(png_path))
+        built += 1
+
+    # Drop layouts of pages that no longer exist
+    for json_path in layout_dir.glob("page_*.json"):
+        page_number = int(json_path.stem.split("_")[1])
+        if page_number > len(doc):
+            for path in _layout_paths(layout_dir, page_number):
+                path.unlink(missing_ok=True)
+
+    logging.info(f"Built layout for {built} of {len(doc)} page(s) in '{layout_dir}'.")
+    if owns_doc:
+        doc.close()
+
+@lru_cache(maxsize=256)
+def _read_layout(json_path, mtime_ns):
+    with open(json_path, 'r') as f:
+        return json.load(f)
+
+def load_page_layout(page_number, layout_dir='page_layout'):
+    """
+    Returns the stored layout of a page, or None if it has not been built.
+    """
+    json_path, _ = _layout_paths(BASE_DIR / layout_dir, page_number)
+    if not json_path.exists():
+        return None
+    return _read_layout(str(json_path), json_path.stat().st_mtime_ns)
+
+def page_image_path(page_number, layout_dir='page_layout'):
+    return _layout_paths(BASE_DIR / layout_dir, page_number)[1]
+
+def _normalize_token(word):
+    return re.sub(r'\W+', '', word.lower())
+
+def align_chunk(words, chunk_text, start_hint=0):
+    """
+    Finds the [start, end) range of `words` covered by `chunk_text`, preferring matches at or after
+    `start_hint`. Returns None if the chunk's opening words cannot be located.
+    """
+    indexed = [(i, token) for i, token in enumerate(_normalize_token(word) for word in words) if token]
+    tokens = [token for _, token in indexed]
+    chunk_tokens = [token for token in (_normalize_token(word) for word in chunk_text.split()) if token]
+    if not chunk_tokens or not tokens:
+        return None
+
+    probe = chunk_tokens[:4]
+    matches = [
+        position for position, token in enumerate(tokens)
+        if token == probe[0] and tokens[position:position + len(probe)] == probe
+    ]
+    if not matches:
+        return None
+    position = next((m for m in matches if indexed[m][0] >= start_hint), matches[0])
+    end = min(position + len(chunk_tokens), len(tokens)) - 1
+    return [indexed[position][0], indexed[end][0] + 1]
+
+def highlight_rects(layout, word_spans):
+    """
+    Returns one rectangle per text line covered by `word_spans`, in PDF points.
+    """
+    lines = {}
+    for start, end in word_spans:
+        for x0, y0, x1, y1, block, line in layout['boxes'][start:end]:
+            rect = lines.get((block, line))
+            lines[(block, line)] = [x0, y0, x1, y1] if rect is None else [
+                min(rect[0], x0), min(rect[1], y0), max(rect[2], x1), max(rect[3], y1)
+            ]
+    return list(lines.values())
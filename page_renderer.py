@@ -0,0 +1,192 @@
+import os
+from pathlib import Path
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+import io
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw
+from page_layout import load_page_layout, page_image_path, highlight_rects
+from telemetry import configure_logging, metrics
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+# Configure logging
+configure_logging()
+
+RENDER_CACHE_DIR = Path(os.getenv("KAVACH_RENDER_CACHE_DIR", BASE_DIR / 'rendered_pages'))
+# Size limits for the in-memory and on-disk caches of rendered PNGs
+MEMORY_CACHE_BYTES = int(os.getenv("KAVACH_RENDER_MEMORY_BYTES", 64 * 1024 * 1024))
+DISK_CACHE_BYTES = int(os.getenv("KAVACH_RENDER_DISK_BYTES", 512 * 1024 * 1024))
+
+_documents = {}
+# PyMuPDF documents are not thread-safe, so all access to open documents goes through this lock
+_document_lock = threading.Lock()
+_memory_cache = OrderedDict()
+_memory_cache_bytes = 0
+_memory_lock = threading.Lock()
+
+def _pdf_identity(pdf_path):
+    stat = os.stat(pdf_path)
+    return f"{Path(pdf_path).resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def _get_document(pdf_path):
+    """
+    Returns a PDF handle kept open for the life of the process, reopening it if the file changed.
+    Must be called with _document_lock held.
+    """
+    key = str(Path(pdf_path).resolve())
+    identity = _pdf_identity(pdf_path)
+    cached = _documents.get(key)
+    if cached is None or cached[0] != identity:
+        if cached is not None:
+            cached[1].close()
+        _documents[key] = (identity, fitz.open(str(pdf_path)))
+        logging.info(f"Opened PDF file '{pdf_path}' for rendering.")
+    return _documents[key][1]
+
+def _cache_key(identity, page_number, highlights):
+    payload = json.dumps([identity, page_number, highlights], sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _memory_get(key):
+    with _memory_lock:
+        png = _memory_cache.get(key)
+        if png is not None:
+            _memory_cache.move_to_end(key)
+        return png
+
+def _memory_put(key, png):
+    global _memory_cache_bytes
+    with _memory_lock:
+        if key in _memory_cache:
+            return
+        _memory_cache[key] = png
+        _memory_cache_bytes += len(png)
+        while _memory_cache_bytes > MEMORY_CACHE_BYTES and len(_memory_cache) > 1:
+            _, evicted = _memory_cache.popitem(last=False)
+            _memory_cache_bytes -= len(evicted)
+
+def _disk_put(key, png):
+    """
+    Writes a rendered page atomically under its content hash and trims the directory to DISK_CACHE_BYTES.
+    """
+    RENDER_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = RENDER_CACHE_DIR / f"{key}.png"
+    tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_bytes(png)
+    os.replace(tmp_path, path)
+
+    files = sorted(RENDER_CACHE_DIR.glob("*.png"), key=lambda p: p.stat().st_mtime)
+    total = sum(p.stat().st_size for p in files)
+    for old in files:
+        if total <= DISK_CACHE_BYTES:
+            break
+        total -= old.stat().st_size
+        old.unlink(missing_ok=True)
+
+def _render(pdf_path, page_number, find_rects):
+    """
+    Rasterizes a page with highlight annotations on the rectangles returned by `find_rects(page)`.
+    The annotations are removed again so the shared document stays clean.
+    """
+    with _document_lock:
+        doc = _get_document(pdf_path)
+        page = doc.load_page(page_number - 1)  # Pages are zero-indexed in PyMuPDF
+        annots = []
+        try:
+            for rect in find_rects(page):
+                annot = page.add_rect_annot(rect)
+                annot.set_colors(stroke=(1, 0, 0), fill=(1, 0.8, 0.8))
+                annot.set_opacity(0.4)
+                annot.update()
+                annots.append(annot)
+            return page.get_pixmap(annots=True).tobytes("png")
+        finally:
+            for annot in annots:
+                page.delete_annot(annot)
+
+def _count_lookup(result):
+    metrics.increment('kavach_cache_lookups_total', help_text="Cache lookups by cache and result.", cache='render', result=result)
+
+def _cached_render(identity, page_number, highlights, render):
+    """
+    Returns the PNG for (identity, page, highlights) from memory, then disk, calling `render()` only on a miss.
+    """
+    key = _cache_key(identity, page_number, highlights)
+
+    png = _memory_get(key)
+    if png is not None:
+        _count_lookup('memory_hit')
+        return png
+
+    disk_path = RENDER_CACHE_DIR / f"{key}.png"
+    if disk_path.exists():
+        png = disk_path.read_bytes()
+        os.utime(disk_path)  # Mark as recently used for eviction
+        _memory_put(key, png)
+        _count_lookup('disk_hit')
+        return png
+
+    _count_lookup('miss')
+    start = time.perf_counter()
+    png = render()
+    metrics.observe('kavach_render_seconds', time.perf_counter() - start, help_text="Page render time on a render cache miss.")
+    _memory_put(key, png)
+    _disk_put(key, png)
+    logging.info(f"Rendered page {page_number} into the render cache as '{key}.png'.")
+    return png
+
+def _draw_highlights(base_image_path, layout, word_spans):
+    """
+    Overlays translucent highlight boxes for `word_spans` on the pre-rendered base page image.
+    """
+    zoom = layout['zoom']
+    with Image.open(base_image_path) as base:
+        image = base.convert("RGBA")
+    overlay = Image.new("RGBA", image.size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    for x0, y0, x1, y1 in highlight_rects(layout, word_spans):
+        draw.rectangle([x0 * zoom, y0 * zoom, x1 * zoom, y1 * zoom], outline=(255, 0, 0, 255), fill=(255, 204, 204, 102))
+    buffer = io.BytesIO()
+    Image.alpha_composite(image, overlay).convert("RGB").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def render_chunk_highlights(page_number, word_spans, layout_dir='page_layout'):
+    """
+    Returns PNG bytes of the pre-rendered page with the given retrieved chunks highlighted, using the
+    word boxes stored at ingest time. Returns None if the page layout has not been built.
+    """
+    try:
+        layout = load_page_layout(page_number, layout_dir)
+        base_image_path = page_image_path(page_number, layout_dir)
+        if layout is None or not base_image_path.exists():
+            logging.warning(f"No stored layout for page {page_number}.")
+            return None
+        identity = f"{base_image_path}:{base_image_path.stat().st_mtime_ns}"
+        spans = sorted([int(start), int(end)] for start, end in word_spans)
+        return _cached_render(
+            identity, page_number, {'spans': spans},
+            lambda: _draw_highlights(base_image_path, layout, spans)
+        )
+    except Exception as e:
+        logging.error(f"Error rendering highlighted page {page_number}: {e}")
+        return None
+
+def extract_highlighted_page(pdf_path, page_number, text_to_highlight):
+    """
+    Returns PNG bytes of the page with every occurrence of `text_to_highlight` highlighted, or None on error.
+    Repeat requests are served from the render cache. Used for answers without stored chunk spans.
+    """
+    try:
+        return _cached_render(
+            _pdf_identity(pdf_path), page_number, {'text': text_to_highlight},
+            lambda: _render(pdf_path, page_number, lambda page: page.search_for(text_to_highlight))
+        )
+    except Exception as e:
+        logging.error(f"Error extracting highlighted page: {e}")
+        return None
@@ -0,0 +1,109 @@
+import os
+from pathlib import Path
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from telemetry import configure_logging, export_trace, metrics
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+# Configure logging
+configure_logging()
+
+# Shared pool for the independent stages of a query (translation, image scoring, generation)
+PIPELINE_WORKERS = int(os.getenv("KAVACH_PIPELINE_WORKERS", 8))
+executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix='kavach-pipeline')
+
+class StageTimer:
+    """
+    Trace of one query: records start and end times of its stages, including stages running on other
+    threads, under a trace ID that appears in the log line, the exported trace and the metrics.
+    """
+
+    def __init__(self, kind='query', trace_id=None):
+        self.kind = kind
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.started_at = time.perf_counter()
+        self.started_at_wall = time.time()
+        self.stages = {}
+        # Stages timed inside another stage; they are left out of the summed stage time
+        self.nested = set()
+        self.attributes = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, nested=False, cumulative=False):
+        """
+        Times the enclosed block. A stage entered several times, e.g. once per shard on parallel
+        threads, spans from its earliest start to its latest end; a `cumulative` one, e.g. once per
+        streamed chunk, adds up the time spent inside it instead. `nested` marks a stage that runs
+        within another, so its time is not counted twice in the summed stage time.
+        """
+        start = time.perf_counter() - self.started_at
+        try:
+            yield
+        finally:
+            end = time.perf_counter() - self.started_at
+            with self._lock:
+                if name in self.stages:
+                    previous_start, previous_end = self.stages[name]
+                    if cumulative:
+                        start, end = previous_start, previous_end + (end - start)
+                    else:
+                        start, end = min(start, previous_start), max(end, previous_end)
+                self.stages[name] = (start, end)
+                if nested:
+                    self.nested.add(name)
+
+    def annotate(self, **attributes):
+        """
+        Attaches values such as prompt size or result counts to the exported trace.
+        """
+        with self._lock:
+            self.attributes.update(attributes)
+
+    def submit(self, name, fn, *args, **kwargs):
+        """
+        Runs `fn` on the shared pipeline executor as a timed stage and returns its Future.
+        """
+        def timed():
+            with self.stage(name):
+                return fn(*args, **kwargs)
+        return executor.submit(timed)
+
+    def durations(self):
+        with self._lock:
+            return {name: end - start for name, (start, end) in self.stages.items()}
+
+    def report(self):
+        """
+        Logs each stage's offset and duration, plus wall time against the summed stage time.
+        The gap between the two is the time saved by overlapping stages. Also records the stage
+        durations in the metrics registry and exports the trace.
+        """
+        wall_time = time.perf_counter() - self.started_at
+        with self._lock:
+            stages = sorted(self.stages.items(), key=lambda item: item[1][0])
+            nested = set(self.nested)
+            attributes = dict(self.attributes)
+        summary = ", ".join(f"{name}: +{start:.3f}s {end - start:.3f}s" for name, (start, end) in stages)
+        total = sum(end - start for name, (start, end) in stages if name not in nested)
+        logging.info(f"[trace {self.trace_id}] Stage timings (offset, duration): {summary}. Wall {wall_time:.3f}s vs summed {total:.3f}s.")
+
+        for name, (start, end) in stages:
+            metrics.observe('kavach_stage_seconds', end - start, help_text="Duration of each query stage.", stage=name, kind=self.kind)
+        metrics.observe('kavach_request_seconds', wall_time, help_text="Wall time of each traced request.", kind=self.kind)
+        metrics.increment('kavach_requests_total', help_text="Traced requests.", kind=self.kind)
+        export_trace({
+            'trace_id': self.trace_id,
+            'kind': self.kind,
+            'timestamp': self.started_at_wall,
+            'wall_seconds': wall_time,
+            'stages': {name: {'offset': start, 'seconds': end - start, 'nested': name in nested} for name, (start, end) in stages},
+            'attributes': attributes,
+        })
+        return {'trace_id': self.trace_id, 'wall_seconds': wall_time, 'summed_seconds': total, 'stages': {name: end - start for name, (start, end) in stages}}
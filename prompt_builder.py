@@ -0,0 +1,143 @@
+import os
+from pathlib import Path
+import logging
+import math
+from telemetry import configure_logging
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+# Configure logging
+configure_logging()
+
+# Upper bound on estimated tokens of retrieved context placed in the prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("KAVACH_CONTEXT_TOKEN_BUDGET", 1500))
+# Chunks on the same page separated by at most this many characters are merged into one section
+MERGE_GAP_CHARS = 2
+
+PROMPT_TEMPLATE = (
+    "Based on the following Kavach guidelines:\n\n{context}\n\n"
+    "Answer the query: {query}\n\n"
+    "Please provide a clear and concise answer in plain text without any HTML or markdown tags."
+)
+
+def estimate_tokens(text):
+    """
+    Approximates the token count at four characters per token, close enough for budgeting English text.
+    """
+    return math.ceil(len(text) / 4)
+
+def _suffix_prefix_overlap(left, right):
+    """
+    Returns the length of the longest suffix of `left` that is also a prefix of `right`.
+    """
+    for size in range(min(len(left), len(right)), 0, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+def _merge_page_chunks(chunks):
+    """
+    Merges one page's chunks, given as (rank, doc), into non-overlapping sections ordered by position.
+    Returns a list of [best_rank, text].
+    """
+    with_offsets = [(rank, doc) for rank, doc in chunks if doc.metadata.get('start_index') is not None]
+    without_offsets = [(rank, doc) for rank, doc in chunks if doc.metadata.get('start_index') is None]
+
+    sections = []
+    end = None
+    for rank, doc in sorted(with_offsets, key=lambda item: item[1].metadata['start_index']):
+        start = doc.metadata['start_index']
+        text = doc.page_content
+        if sections and start <= end + MERGE_GAP_CHARS:
+            # Append only the part of this chunk that extends past the current section
+            if start + len(text) > end:
+                overlap = max(0, end - start)
+                sections[-1][1] += ("" if overlap else " ") + text[overlap:]
+                end = start + len(text)
+            sections[-1][0] = min(sections[-1][0], rank)
+        else:
+            sections.append([rank, text])
+            end = start + len(text)
+
+    # Chunks from indexes built without offsets are de-duplicated by content instead
+    for rank, doc in sorted(without_offsets, key=lambda item: item[0]):
+        text = doc.page_content
+        merged = False
+        for section in sections:
+            if text in section[1]:
+                merged = True
+            else:
+                overlap = _suffix_prefix_overlap(section[1], text)
+                if overlap >= min(50, len(text)):
+                    section[1] += text[overlap:]
+                    merged = True
+            if merged:
+                section[0] = min(section[0], rank)
+                break
+        if not merged:
+            sections.append([rank, text])
+    return sections
+
+def _truncate_to_tokens(text, tokens):
+    cut = text[:tokens * 4]
+    return cut[:cut.rfind(" ")] if " " in cut else cut
+
+def build_context(docs, token_budget=None):
+    """
+    Merges overlapping and adjacent chunks from the same page, removes duplicates, keeps the most
+    relevant sections within `token_budget` and returns them ordered by document and page.
+    `docs` must be in relevance order. Returns (context_text, stats).
+    """
+    token_budget = token_budget or CONTEXT_TOKEN_BUDGET
+    by_page = {}
+    for rank, doc in enumerate(docs):
+        key = (doc.metadata.get('doc_id', ''), doc.metadata.get('page') or 0)
+        by_page.setdefault(key, []).append((rank, doc))
+
+    sections = []
+    for (doc_id, page), chunks in by_page.items():
+        for position, (rank, text) in enumerate(_merge_page_chunks(chunks)):
+            sections.append({'doc_id': doc_id, 'page': page, 'position': position, 'rank': rank, 'text': text})
+
+    # Spend the budget on the most relevant sections first, truncating the last one that fits partly
+    remaining = token_budget
+    kept = []
+    dropped_tokens = 0
+    for section in sorted(sections, key=lambda item: item['rank']):
+        tokens = estimate_tokens(section['text'])
+        if tokens <= remaining:
+            kept.append(section)
+            remaining -= tokens
+        elif remaining > 50:
+            dropped_tokens += tokens - remaining
+            section['text'] = _truncate_to_tokens(section['text'], remaining)
+            kept.append(section)
+            remaining = 0
+        else:
+            dropped_tokens += tokens
+
+    kept.sort(key=lambda item: (item['doc_id'], item['page'], item['position']))
+    context = "\n\n".join(f"[Source: {section['doc_id']}, page {section['page']}]\n{section['text']}" for section in kept)
+    stats = {
+        'chunks': len(docs),
+        'raw_tokens': sum(estimate_tokens(doc.page_content) for doc in docs),
+        'sections': len(kept),
+        'context_tokens': estimate_tokens(context),
+        'dropped_tokens': dropped_tokens,
+    }
+    return context, stats
+
+def build_prompt(query, docs, token_budget=None):
+    """
+    Returns (prompt, stats) for the query and its retrieved chunks, logging the prompt size.
+    """
+    context, stats = build_context(docs, token_budget)
+    prompt = PROMPT_TEMPLATE.format(context=context, query=query)
+    stats['prompt_tokens'] = estimate_tokens(prompt)
+    logging.info(
+        f"Prompt built from {stats['chunks']} chunk(s) in {stats['sections']} section(s): "
+        f"~{stats['prompt_tokens']} tokens (context ~{stats['context_tokens']}, raw chunks ~{stats['raw_tokens']}, "
+        f"dropped ~{stats['dropped_tokens']})."
+    )
+    return prompt, stats
@@ -0,0 +1,95 @@
+import os
+from pathlib import Path
+import logging
+import threading
+from collections import OrderedDict
+from response_cache import normalize_query
+from telemetry import configure_logging, metrics
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+# Configure logging
+configure_logging()
+
+# Distinct normalized queries remembered; 0 disables the cache
+QUERY_CACHE_SIZE = int(os.getenv("KAVACH_QUERY_CACHE_SIZE", 256))
+
+def _count_lookup(cache, result):
+    metrics.increment('kavach_cache_lookups_total', help_text="Cache lookups by cache and result.", cache=cache, result=result)
+
+class QueryCache:
+    """
+    Bounded LRU keyed on the normalized query. Each entry holds the query vector and the chunks
+    retrieved for it, tagged with the corpus version they came from; hits from another version are
+    ignored, so re-indexing invalidates them while the vector, which only depends on the model, is kept.
+    """
+
+    def __init__(self, max_entries=QUERY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _entry(self, query, create=False):
+        """
+        Returns the entry for `query`, marking it recently used. Must be called with the lock held.
+        """
+        key = normalize_query(query)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        elif create:
+            entry = self._entries[key] = {'vector': None, 'version': None, 'hits': None}
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def embed(self, query, embed_fn):
+        """
+        Returns the cached vector for the query, calling `embed_fn(query)` on a miss.
+        """
+        if self.max_entries <= 0:
+            return embed_fn(query)
+        with self._lock:
+            entry = self._entry(query)
+            vector = entry['vector'] if entry is not None else None
+        if vector is not None:
+            _count_lookup('query_vector', 'hit')
+            return vector
+
+        _count_lookup('query_vector', 'miss')
+        vector = embed_fn(query)
+        with self._lock:
+            self._entry(query, create=True)['vector'] = vector
+        return vector
+
+    def get_hits(self, query, version):
+        """
+        Returns the chunks cached for the query at this corpus version, or None.
+        """
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            entry = self._entry(query)
+            hits = entry['hits'] if entry is not None and entry['version'] == version else None
+        _count_lookup('query_hits', 'miss' if hits is None else 'hit')
+        return hits
+
+    def set_hits(self, query, version, hits):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            entry = self._entry(query, create=True)
+            entry['version'] = version
+            entry['hits'] = list(hits)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        logging.info("Cleared the query cache.")
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries}
+
+query_cache = QueryCache()
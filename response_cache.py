@@ -0,0 +1,239 @@
+import os
+from pathlib import Path
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from telemetry import configure_logging, metrics
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+# Configure logging
+configure_logging()
+
+# Cache configuration: backend is 'sqlite', 'memory' or 'none'
+CACHE_BACKEND = os.getenv("KAVACH_RESPONSE_CACHE", "sqlite")
+CACHE_PATH = Path(os.getenv("KAVACH_RESPONSE_CACHE_PATH", BASE_DIR / 'response_cache.sqlite3'))
+CACHE_MAX_ENTRIES = int(os.getenv("KAVACH_RESPONSE_CACHE_MAX_ENTRIES", 1000))
+CACHE_TTL_SECONDS = float(os.getenv("KAVACH_RESPONSE_CACHE_TTL", 7 * 24 * 3600))
+# Cosine similarity above which a different query with the same retrieved chunks reuses an answer; 0 disables
+CACHE_SIMILARITY_THRESHOLD = float(os.getenv("KAVACH_RESPONSE_CACHE_SIMILARITY", 0.95))
+
+def normalize_query(query):
+    """
+    Lowercases the query, collapses whitespace and strips trailing punctuation.
+    """
+    return " ".join(query.lower().split()).rstrip("?.! ")
+
+def chunk_id(doc):
+    """
+    Returns a stable identifier for a retrieved chunk from its document, page and content.
+    """
+    digest = hashlib.sha1(doc.page_content.encode('utf-8')).hexdigest()[:16]
+    return f"{doc.metadata.get('doc_id')}:{doc.metadata.get('page')}:{digest}"
+
+def make_cache_key(query, chunk_ids):
+    """
+    Builds a cache key from the normalized query and the IDs of the chunks used as context.
+    Returns (key, chunk_key) where chunk_key identifies the context alone.
+    """
+    chunk_key = hashlib.sha256("|".join(sorted(chunk_ids)).encode('utf-8')).hexdigest()
+    key = hashlib.sha256(f"{normalize_query(query)}\n{chunk_key}".encode('utf-8')).hexdigest()
+    return key, chunk_key
+
+def _to_vector(query_embedding):
+    if query_embedding is None:
+        return None
+    vector = np.asarray(query_embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def _count_lookup(result):
+    metrics.increment('kavach_cache_lookups_total', help_text="Cache lookups by cache and result.", cache='response', result=result)
+
+class ResponseCache:
+    """
+    Base class for response caches. Subclasses implement _lookup, _similar and _store.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS, similarity_threshold=CACHE_SIMILARITY_THRESHOLD):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, chunk_key=None, query_embedding=None):
+        """
+        Returns the cached response for `key`, falling back to a near-duplicate query with the same context.
+        """
+        with self._lock:
+            response = self._lookup(key)
+            if response is not None:
+                self.hits += 1
+                _count_lookup('hit')
+                return response
+
+            vector = _to_vector(query_embedding)
+            if vector is not None and chunk_key is not None and self.similarity_threshold > 0:
+                response = self._similar(chunk_key, vector)
+                if response is not None:
+                    self.semantic_hits += 1
+                    _count_lookup('semantic_hit')
+                    return response
+
+            self.misses += 1
+            _count_lookup('miss')
+            return None
+
+    def set(self, key, response, chunk_key=None, query_embedding=None):
+        with self._lock:
+            self._store(key, response, chunk_key, _to_vector(query_embedding))
+
+    def stats(self):
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            'hits': self.hits,
+            'semantic_hits': self.semantic_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.semantic_hits) / lookups if lookups else 0.0,
+        }
+
+class NullResponseCache(ResponseCache):
+    """
+    Cache that never stores anything; used when caching is disabled.
+    """
+
+    def _lookup(self, key):
+        return None
+
+    def _similar(self, chunk_key, vector):
+        return None
+
+    def _store(self, key, response, chunk_key, vector):
+        pass
+
+class MemoryResponseCache(ResponseCache):
+    """
+    Per-process LRU cache with TTL expiry.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._entries = OrderedDict()
+
+    def _expired(self, entry):
+        return time.time() - entry['created_at'] > self.ttl_seconds
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._expired(entry):
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry['response']
+
+    def _similar(self, chunk_key, vector):
+        best_key, best_similarity = None, self.similarity_threshold
+        for key, entry in self._entries.items():
+            if entry['chunk_key'] != chunk_key or entry['vector'] is None or self._expired(entry):
+                continue
+            similarity = float(entry['vector'] @ vector)
+            if similarity >= best_similarity:
+                best_key, best_similarity = key, similarity
+        if best_key is None:
+            return None
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key]['response']
+
+    def _store(self, key, response, chunk_key, vector):
+        self._entries[key] = {'response': response, 'chunk_key': chunk_key, 'vector': vector, 'created_at': time.time()}
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+class SQLiteResponseCache(ResponseCache):
+    """
+    On-disk LRU cache with TTL expiry, shared by every worker process using the same file.
+    """
+
+    def __init__(self, path=CACHE_PATH, **kwargs):
+        super().__init__(**kwargs)
+        self.path = Path(path)
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, chunk_key TEXT, vector BLOB, response TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_chunk_key ON responses (chunk_key)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._conn.commit()
+        logging.info(f"Opened response cache at '{self.path}'.")
+
+    def _touch(self, key):
+        self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        self._conn.commit()
+
+    def _lookup(self, key):
+        row = self._conn.execute(
+            "SELECT response FROM responses WHERE key = ? AND created_at > ?",
+            (key, time.time() - self.ttl_seconds)
+        ).fetchone()
+        if row is None:
+            return None
+        self._touch(key)
+        return row[0]
+
+    def _similar(self, chunk_key, vector):
+        rows = self._conn.execute(
+            "SELECT key, vector, response FROM responses WHERE chunk_key = ? AND vector IS NOT NULL AND created_at > ?",
+            (chunk_key, time.time() - self.ttl_seconds)
+        ).fetchall()
+        best, best_similarity = None, self.similarity_threshold
+        for key, blob, response in rows:
+            similarity = float(np.frombuffer(blob, dtype=np.float32) @ vector)
+            if similarity >= best_similarity:
+                best, best_similarity = (key, response), similarity
+        if best is None:
+            return None
+        self._touch(best[0])
+        return best[1]
+
+    def _store(self, key, response, chunk_key, vector):
+        now = time.time()
+        blob = vector.astype(np.float32).tobytes() if vector is not None else None
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses (key, chunk_key, vector, response, created_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (key, chunk_key, blob, response, now, now)
+        )
+        # Evict expired entries, then the least recently used beyond the size limit
+        self._conn.execute("DELETE FROM responses WHERE created_at <= ?", (now - self.ttl_seconds,))
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+        self._conn.commit()
+
+def get_response_cache(backend=CACHE_BACKEND):
+    """
+    Creates the response cache configured by KAVACH_RESPONSE_CACHE.
+    """
+    if backend == 'sqlite':
+        try:
+            return SQLiteResponseCache()
+        except Exception as e:
+            logging.error(f"Error opening SQLite response cache, falling back to memory: {e}")
+            return MemoryResponseCache()
+    if backend == 'memory':
+        return MemoryResponseCache()
+    return NullResponseCache()
@@ -0,0 +1,256 @@
+import os
+from pathlib import Path
+import logging
+import re
+import joblib
+import numpy as np
+from embedding_handler import get_cross_encoder, get_huggingface_embeddings, DEFAULT_RERANKER_MODEL_NAME
+from pipeline import executor, StageTimer
+from corpus import qualify_page
+from telemetry import configure_logging
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+# Configure logging
+configure_logging()
+
+BM25_FILENAME = 'bm25.joblib'
+
+# Candidates taken from each shard's dense and sparse search before fusion
+DENSE_K = int(os.getenv("KAVACH_DENSE_K", 20))
+SPARSE_K = int(os.getenv("KAVACH_SPARSE_K", 20))
+# Fused candidates passed to the cross-encoder, and chunks finally sent to the LLM
+RERANK_POOL = int(os.getenv("KAVACH_RERANK_POOL", 30))
+CONTEXT_CHUNKS = int(os.getenv("KAVACH_CONTEXT_CHUNKS", 5))
+# Cross-encoder model name, or 'none' to keep the fused order
+RERANKER_MODEL = os.getenv("KAVACH_RERANKER", DEFAULT_RERANKER_MODEL_NAME)
+# Reciprocal rank fusion constant
+RRF_K = 60
+
+# Keeps identifiers such as clause numbers (4.2.1), tag names (RFID-12) and codes (SoS) as single tokens
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+
+def preload_models():
+    """
+    Loads the query embedding and re-ranking models, e.g. on a background thread at startup.
+    """
+    get_huggingface_embeddings()
+    if RERANKER_MODEL.lower() != 'none':
+        get_cross_encoder(RERANKER_MODEL)
+
+def tokenize(text):
+    return _TOKEN_PATTERN.findall(text.lower())
+
+class BM25Index:
+    """
+    Okapi BM25 over the chunks of one vector store, stored as an inverted index keyed by docstore ID.
+    """
+
+    def __init__(self, ids, postings, doc_lengths, k1=1.5, b=0.75):
+        self.ids = ids
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.avg_length = float(doc_lengths.mean()) if len(doc_lengths) and doc_lengths.any() else 1.0
+        self.k1 = k1
+        self.b = b
+
+    @classmethod
+    def build(cls, ids, texts):
+        term_docs = {}
+        doc_lengths = np.zeros(len(texts), dtype=np.float32)
+        for position, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths[position] = len(tokens)
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for token, count in counts.items():
+                term_docs.setdefault(token, ([], []))
+                term_docs[token][0].append(position)
+                term_docs[token][1].append(count)
+        postings = {
+            term: (np.asarray(positions, dtype=np.int32), np.asarray(counts, dtype=np.float32))
+            for term, (positions, counts) in term_docs.items()
+        }
+        return cls(list(ids), postings, doc_lengths)
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore):
+        ids = list(vectorstore.index_to_docstore_id.values())
+        return cls.build(ids, [vectorstore.docstore.search(docstore_id).page_content for docstore_id in ids])
+
+    def search(self, query, k):
+        """
+        Returns up to k (docstore_id, score) pairs with a positive BM25 score, best first.
+        """
+        if not self.ids:
+            return []
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        num_docs = len(self.ids)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            positions, tf = posting
+            idf = np.log(1 + (num_docs - len(positions) + 0.5) / (len(positions) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[positions] / self.avg_length)
+            scores[positions] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        k = min(k, num_docs)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+    def save(self, path):
+        joblib.dump({'ids': self.ids, 'postings': self.postings, 'doc_lengths': self.doc_lengths}, str(path))
+
+    @classmethod
+    def load(cls, path):
+        data = joblib.load(str(path))
+        return cls(data['ids'], data['postings'], data['doc_lengths'])
+
+def save_bm25_index(vectorstore, vectorstore_path):
+    """
+    Rebuilds the BM25 index from the vector store's docstore and saves it beside the FAISS files.
+    """
+    bm25 = BM25Index.from_vectorstore(vectorstore)
+    bm25.save(Path(vectorstore_path) / BM25_FILENAME)
+    logging.info(f"Saved BM25 index over {len(bm25.ids)} chunk(s) to '{vectorstore_path}'.")
+    return bm25
+
+def load_bm25_index(vectorstore, vectorstore_path):
+    """
+    Loads the saved BM25 index, building it first for vector stores saved before it existed.
+    """
+    bm25_file = Path(vectorstore_path) / BM25_FILENAME
+    if not bm25_file.exists():
+        return save_bm25_index(vectorstore, vectorstore_path)
+    return BM25Index.load(bm25_file)
+
+def _chunk_key(shard, doc):
+    """
+    Identifies a chunk by its qualified page and its start offset in the page text, so chunks with the
+    same text on different pages stay separate. Stores built before offsets were recorded fall back to the text.
+    """
+    page_id = qualify_page(doc.metadata.get('doc_id', shard.doc_id), doc.metadata.get('page'))
+    return page_id, doc.metadata.get('start_index', doc.page_content)
+
+def _keyed(shard, docs):
+    return [(_chunk_key(shard, doc), doc) for doc in docs]
+
+def _sparse_candidates(shard, query):
+    if shard.bm25 is None:
+        return []
+    sparse = []
+    for docstore_id, _ in shard.bm25.search(query, SPARSE_K):
+        doc = shard.vectorstore.docstore.search(docstore_id)
+        doc.metadata.setdefault('doc_id', shard.doc_id)
+        sparse.append(doc)
+    return _keyed(shard, sparse)
+
+def _shard_candidates(shard, query, query_embedding, timer):
+    """
+    Returns the shard's dense and sparse candidate lists, each a ranked list of (key, Document).
+    """
+    # Both searches run inside the caller's 'retrieve' stage
+    with timer.stage('faiss_search', nested=True):
+        dense = _keyed(shard, [doc for doc, _ in shard.search(query_embedding, DENSE_K)])
+    with timer.stage('bm25_search', nested=True):
+        sparse = _sparse_candidates(shard, query)
+    return dense, sparse
+
+def _fuse(ranked_lists):
+    """
+    Merges ranked lists of (key, Document) with reciprocal rank fusion, best first.
+    """
+    scores = {}
+    docs = {}
+    for ranked in ranked_lists:
+        for rank, (key, doc) in enumerate(ranked):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+            docs[key] = doc
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+def hybrid_candidates(corpus, query, query_embedding, timer=None):
+    """
+    Fuses dense and BM25 results from every shard with reciprocal rank fusion.
+    """
+    timer = timer or StageTimer()
+    futures = [executor.submit(_shard_candidates, shard, query, query_embedding, timer) for shard in corpus.shards.values()]
+    return _fuse(ranked for future in futures for ranked in future.result())
+
+def hybrid_candidates_batch(corpus, queries, query_matrix, timer=None):
+    """
+    Like hybrid_candidates for many queries, with one batched FAISS search per shard.
+    """
+    timer = timer or StageTimer()
+
+    def search_batch(shard):
+        with timer.stage('faiss_search', nested=True):
+            return shard.search_batch(query_matrix, DENSE_K)
+
+    dense_futures = [(shard, executor.submit(search_batch, shard)) for shard in corpus.shards.values()]
+    ranked_lists = [[] for _ in queries]
+    for shard, future in dense_futures:
+        for position, results in enumerate(future.result()):
+            ranked_lists[position].append(_keyed(shard, [doc for doc, _ in results]))
+            with timer.stage('bm25_search', nested=True):
+                ranked_lists[position].append(_sparse_candidates(shard, queries[position]))
+    return [_fuse(ranked) for ranked in ranked_lists]
+
+def rerank_batch(queries, candidate_lists, top_n):
+    """
+    Re-ranks each query's candidates with a single cross-encoder call over every (query, chunk) pair.
+    """
+    if RERANKER_MODEL.lower() == 'none':
+        return [candidates[:top_n] for candidates in candidate_lists]
+    pairs = [
+        (query, doc.page_content)
+        for query, candidates in zip(queries, candidate_lists) if len(candidates) > 1
+        for doc in candidates
+    ]
+    scores = get_cross_encoder(RERANKER_MODEL).predict(pairs) if pairs else []
+    reranked = []
+    offset = 0
+    for candidates in candidate_lists:
+        if len(candidates) <= 1:
+            reranked.append(candidates[:top_n])
+            continue
+        order = np.argsort(-np.asarray(scores[offset:offset + len(candidates)]))
+        offset += len(candidates)
+        reranked.append([candidates[i] for i in order[:top_n]])
+    return reranked
+
+def rerank(query, candidates, top_n):
+    """
+    Orders candidates by cross-encoder relevance to the query and returns the best `top_n`.
+    """
+    return rerank_batch([query], [candidates], top_n)[0]
+
+def retrieve(corpus, query, query_embedding, top_n=None, timer=None):
+    """
+    Hybrid BM25 + dense retrieval over the corpus, re-ranked by a cross-encoder. Returns the best `top_n` chunks.
+    """
+    top_n = top_n or CONTEXT_CHUNKS
+    timer = timer or StageTimer()
+    with timer.stage('retrieve'):
+        candidates = hybrid_candidates(corpus, query, query_embedding, timer)[:RERANK_POOL]
+    with timer.stage('rerank'):
+        relevant_docs = rerank(query, candidates, top_n)
+    logging.info(f"Re-ranked {len(candidates)} candidate(s) down to {len(relevant_docs)} chunk(s).")
+    return relevant_docs
+
+def retrieve_batch(corpus, queries, query_matrix, top_n=None, timer=None):
+    """
+    retrieve() for many queries at once; `query_matrix` holds one query embedding per row.
+    Returns one list of chunks per query, in input order.
+    """
+    top_n = top_n or CONTEXT_CHUNKS
+    timer = timer or StageTimer()
+    with timer.stage('retrieve'):
+        candidate_lists = [candidates[:RERANK_POOL] for candidates in hybrid_candidates_batch(corpus, queries, query_matrix, timer)]
+    with timer.stage('rerank'):
+        relevant_docs = rerank_batch(queries, candidate_lists, top_n)
+    logging.info(f"Retrieved context for a batch of {len(queries)} queries.")
+    return relevant_docs
@@ -0,0 +1,166 @@
+"""
+Bounded conversation history for a chat session.
+
+The last KAVACH_HISTORY_WINDOW turns are kept verbatim; older turns are folded into a running summary
+in the background, so each new turn costs the same however long the session gets. A follow-up question
+can also be condensed, with the summary and the last KAVACH_CONDENSE_TURNS turns, into a standalone
+question for retrieval.
+
+Settings:
+    KAVACH_HISTORY_WINDOW          turns kept and shown in full (default 10)
+    KAVACH_HISTORY_SUMMARY_CHARS   upper bound on the summary of older turns (default 1200)
+    KAVACH_CONDENSE_TURNS          recent turns used to rewrite follow-ups as standalone queries; 0 disables
+"""
+import os
+from pathlib import Path
+import logging
+from collections import deque
+from pipeline import executor
+from telemetry import configure_logging, metrics
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+# Configure logging
+configure_logging()
+
+HISTORY_WINDOW = int(os.getenv("KAVACH_HISTORY_WINDOW", 10))
+SUMMARY_MAX_CHARS = int(os.getenv("KAVACH_HISTORY_SUMMARY_CHARS", 1200))
+CONDENSE_TURNS = int(os.getenv("KAVACH_CONDENSE_TURNS", 0))
+# Each answer is cut to this length in summary and condensing prompts, keeping their size bounded
+TURN_ANSWER_CHARS = 600
+
+SUMMARY_PROMPT = """You maintain a short summary of a conversation between a user and an assistant that answers questions about the Kavach railway safety guidelines.
+Update the summary with the new turns. Keep the topics, systems and pages discussed and any facts the user may refer back to. Use at most {max_chars} characters.
+
+Summary so far:
+{summary}
+
+New turns:
+{turns}
+
+Updated summary:"""
+
+CONDENSE_PROMPT = """Given the conversation below about the Kavach railway safety guidelines, rewrite the follow-up question as a single standalone question that can be understood without the conversation.
+If it is already standalone, return it unchanged. Return only the question.
+
+Earlier conversation (summary):
+{summary}
+
+Recent turns:
+{turns}
+
+Follow-up question: {query}
+Standalone question:"""
+
+def _format_turns(turns):
+    lines = []
+    for turn in turns:
+        answer = turn['answer_english']
+        if len(answer) > TURN_ANSWER_CHARS:
+            answer = answer[:TURN_ANSWER_CHARS].rsplit(" ", 1)[0] + " ..."
+        lines.append(f"User: {turn['query_english']}\nAssistant: {answer}")
+    return "\n\n".join(lines)
+
+def _trim_summary(summary, max_chars=SUMMARY_MAX_CHARS):
+    """
+    Keeps the most recent part of the summary, cut at a line break where possible.
+    """
+    if len(summary) <= max_chars:
+        return summary
+    tail = summary[-max_chars:]
+    return tail.split("\n", 1)[1] if "\n" in tail else tail
+
+def extractive_summary(summary, turns):
+    """
+    Summary used without an LLM, or when summarizing fails: the earlier questions, most recent last.
+    """
+    lines = [summary] if summary else ["Earlier questions:"]
+    lines.extend(f"- {turn['query_english']}" for turn in turns)
+    return _trim_summary("\n".join(lines))
+
+class SessionHistory:
+    """
+    The recent turns of one session plus a summary of the older ones. A turn is a dict with the
+    displayed 'query' and 'answer', their English 'query_english' and 'answer_english', and the
+    'pages', 'highlights' and 'images' of the answer.
+
+    `llm` is a callable from prompt to text used for summaries and condensed queries; without one,
+    older turns are summarized as a list of their questions and follow-ups are not rewritten.
+    """
+
+    def __init__(self, window=HISTORY_WINDOW, llm=None):
+        self.window = max(1, window)
+        self.llm = llm
+        self.turns = deque()
+        self.summary = ""
+        # Turns that left the window; the summary may still be catching up with the latest of them
+        self.earlier_turns = 0
+        self._unsummarized = []
+        self._summary_future = None
+
+    def __len__(self):
+        return self.earlier_turns + len(self.turns)
+
+    def add_turn(self, turn):
+        """
+        Appends a turn, moving turns beyond the window to the summary.
+        """
+        self.turns.append(turn)
+        while len(self.turns) > self.window:
+            self._unsummarized.append(self.turns.popleft())
+            self.earlier_turns += 1
+        self._refresh_summary()
+
+    def _summarize(self, summary, turns):
+        if self.llm is None:
+            return extractive_summary(summary, turns)
+        try:
+            prompt = SUMMARY_PROMPT.format(max_chars=SUMMARY_MAX_CHARS, summary=summary or "(none)", turns=_format_turns(turns))
+            return _trim_summary(self.llm(prompt).strip())
+        except Exception as e:
+            logging.error(f"Error summarizing conversation history: {e}")
+            metrics.increment('kavach_history_summary_errors_total', help_text="Failed conversation summaries.")
+            return extractive_summary(summary, turns)
+
+    def _refresh_summary(self):
+        """
+        Applies a finished summary and starts folding in the turns evicted since. At most one summary
+        runs per session, and it never blocks the caller.
+        """
+        if self._summary_future is not None:
+            if not self._summary_future.done():
+                return
+            self.summary = self._summary_future.result()
+            self._summary_future = None
+        if self._unsummarized:
+            turns, self._unsummarized = self._unsummarized, []
+            summary = self.summary
+            self._summary_future = executor.submit(self._summarize, summary, turns)
+
+    def summary_text(self):
+        """
+        Returns the latest summary of the turns outside the window, or "" if there are none yet.
+        """
+        self._refresh_summary()
+        return self.summary
+
+    def condense(self, query_english, turns=CONDENSE_TURNS):
+        """
+        Returns the follow-up rewritten as a standalone question using the summary and the last `turns`
+        turns, or the query unchanged if condensing is off, there is no history or it fails.
+        """
+        if turns <= 0 or self.llm is None or not self.turns:
+            return query_english
+        recent = list(self.turns)[-turns:]
+        prompt = CONDENSE_PROMPT.format(summary=self.summary_text() or "(none)", turns=_format_turns(recent), query=query_english)
+        try:
+            lines = self.llm(prompt).strip().splitlines()
+        except Exception as e:
+            logging.error(f"Error condensing follow-up question: {e}")
+            return query_english
+        standalone = lines[0].strip() if lines else ""
+        if not standalone:
+            return query_english
+        logging.info(f"Condensed follow-up '{query_english}' to '{standalone}'.")
+        return standalone
@@ -0,0 +1,92 @@
+"""
+Profiles app startup: how long each step takes, how much memory it adds, and which heavy
+libraries it pulls in. Run it in a fresh process, with or without a saved index:
+
+    python startup_profile.py
+    python startup_profile.py --query "What is the role of RFID tags in Kavach?" --output startup.json
+
+Steps, in the order the app performs them:
+    import_app      importing the modules main.py needs before it can render
+    load_corpus     create_or_load_corpus(), i.e. loading (or building) every vector store and image index
+    embed_model     loading the query embedding model
+    reranker        loading the cross-encoder re-ranker
+    first_query     answering one query with the offline Gemini stub (only with --query)
+"""
+import os
+from pathlib import Path
+import argparse
+import importlib
+import json
+import sys
+import time
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+# Modules whose import alone costs seconds or hundreds of MB; each should load only when needed
+HEAVY_MODULES = ['torch', 'sentence_transformers', 'easyocr', 'google.generativeai', 'googletrans', 'faiss']
+
+def _profile_step(steps, name, fn):
+    from telemetry import process_rss_bytes
+    rss_before = process_rss_bytes()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    rss_after = process_rss_bytes()
+    steps.append({
+        'step': name,
+        'seconds': seconds,
+        'rss_mb': rss_after / 1e6 if rss_after is not None else None,
+        'rss_delta_mb': (rss_after - rss_before) / 1e6 if rss_before is not None and rss_after is not None else None,
+        'heavy_modules': [module for module in HEAVY_MODULES if module in sys.modules],
+    })
+    return result
+
+def _import_app():
+    for module in ('telemetry', 'pipeline', 'corpus', 'page_renderer', 'embeddings', 'chatbot'):
+        importlib.import_module(module)
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile Kavach app startup.")
+    parser.add_argument('--query', help="Also time one offline query end to end")
+    parser.add_argument('--output', help="Write the profile as JSON to this file")
+    args = parser.parse_args()
+
+    # The first query runs against the offline stub, so no API key or network is needed
+    os.environ.setdefault("GOOGLE_GEMINI_PRO_API_KEY", "offline-profile")
+    os.environ.setdefault("KAVACH_RESPONSE_CACHE", "none")
+
+    process_start = time.perf_counter()
+    steps = []
+    _profile_step(steps, 'import_app', _import_app)
+
+    from embeddings import create_or_load_corpus
+    from embedding_handler import get_huggingface_embeddings, get_embedding_stats
+    from retrieval import RERANKER_MODEL
+    corpus = _profile_step(steps, 'load_corpus', create_or_load_corpus)
+    ready_seconds = time.perf_counter() - process_start
+
+    _profile_step(steps, 'embed_model', get_huggingface_embeddings)
+    if RERANKER_MODEL.lower() != 'none':
+        from embedding_handler import get_cross_encoder
+        _profile_step(steps, 'reranker', lambda: get_cross_encoder(RERANKER_MODEL))
+
+    if args.query:
+        from chatbot import get_kavach_decision
+        from offline_stubs import StubGeminiModel, install_gemini_stub
+        install_gemini_stub(StubGeminiModel(first_token_seconds=0, chunk_seconds=0))
+        _profile_step(steps, 'first_query', lambda: get_kavach_decision(corpus, args.query))
+
+    print(f"{'step':<14} {'seconds':>8} {'RSS MB':>8} {'+MB':>8}  heavy modules loaded")
+    for step in steps:
+        rss = f"{step['rss_mb']:>8.0f}" if step['rss_mb'] is not None else f"{'-':>8}"
+        delta = f"{step['rss_delta_mb']:>8.0f}" if step['rss_delta_mb'] is not None else f"{'-':>8}"
+        print(f"{step['step']:<14} {step['seconds']:>8.2f} {rss} {delta}  {', '.join(step['heavy_modules']) or '-'}")
+    print(f"\nReady to render after {ready_seconds:.2f}s (imports and corpus load; models load in the background).")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'ready_seconds': ready_seconds, 'steps': steps, 'models': get_embedding_stats()}, f, indent=2)
+
+if __name__ == '__main__':
+    main()
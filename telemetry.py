@@ -0,0 +1,192 @@
+"""
+Shared logging configuration, metrics registry and trace export.
+
+Every module calls configure_logging() instead of its own logging.basicConfig, so all records go
+to one file tagged with their module. Counters and latency histograms are kept in process and
+rendered in the Prometheus text format; completed query traces can also be appended to a JSON
+lines file.
+
+Settings:
+    KAVACH_LOG_FILE       log file shared by every module (default kavach.log)
+    KAVACH_LOG_LEVEL      logging level (default INFO)
+    KAVACH_TRACE_FILE     JSON lines file each completed query trace is appended to; unset disables
+    KAVACH_METRICS_PORT   port for a /metrics endpoint in processes without their own HTTP server
+"""
+import os
+from pathlib import Path
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+LOG_FILE = Path(os.getenv("KAVACH_LOG_FILE", BASE_DIR / 'kavach.log'))
+LOG_LEVEL = os.getenv("KAVACH_LOG_LEVEL", "INFO").upper()
+TRACE_FILE = os.getenv("KAVACH_TRACE_FILE", "")
+METRICS_PORT = int(os.getenv("KAVACH_METRICS_PORT", 0))
+
+# Histogram buckets in seconds, from a cache hit to a slow LLM call
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def configure_logging():
+    """
+    Sends every module's log records to the shared log file. Later calls are no-ops.
+    """
+    logging.basicConfig(
+        filename=LOG_FILE,
+        filemode='a',
+        format='%(asctime)s - %(levelname)s - %(module)s - %(message)s',
+        level=LOG_LEVEL
+    )
+
+def process_rss_bytes():
+    """
+    Returns the resident set size of this process in bytes, or None where /proc is unavailable.
+    """
+    statm = Path('/proc/self/statm')
+    if not statm.exists():
+        return None
+    try:
+        resident_pages = int(statm.read_text().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except Exception:
+        return None
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and latency histograms, keyed by metric name and labels.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.histograms = {}
+        self.help = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1, help_text=None, **labels):
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + value
+            if help_text:
+                self.help.setdefault(name, help_text)
+
+    def observe(self, name, seconds, help_text=None, **labels):
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            key = _label_key(labels)
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = {'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0.0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['count'] += 1
+            histogram['sum'] += seconds
+            if help_text:
+                self.help.setdefault(name, help_text)
+
+    def snapshot(self):
+        """
+        Returns {'counters': {name: {labels: value}}, 'histograms': {name: {labels: {'count', 'sum'}}}}.
+        """
+        with self._lock:
+            return {
+                'counters': {
+                    name: {_format_labels(key): value for key, value in series.items()}
+                    for name, series in self.counters.items()
+                },
+                'histograms': {
+                    name: {_format_labels(key): {'count': h['count'], 'sum': h['sum']} for key, h in series.items()}
+                    for name, series in self.histograms.items()
+                },
+            }
+
+    def render_prometheus(self):
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {value}")
+            for name, series in sorted(self.histograms.items()):
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(series.items()):
+                    for bound, count in zip(self.buckets, histogram['buckets']):
+                        lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {histogram['count']}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram['sum']}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+_trace_lock = threading.Lock()
+
+def export_trace(record):
+    """
+    Appends a completed query trace to KAVACH_TRACE_FILE, if set.
+    """
+    if not TRACE_FILE:
+        return
+    line = json.dumps(record, default=str)
+    with _trace_lock:
+        with open(TRACE_FILE, 'a') as f:
+            f.write(line + "\n")
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+def start_metrics_server(port=METRICS_PORT):
+    """
+    Serves /metrics on a background thread, once per process. Does nothing if `port` is 0.
+    Streamlit re-runs its script on every interaction, so repeat calls must be harmless.
+    """
+    global _metrics_server
+    with _metrics_server_lock:
+        if _metrics_server is not None or not port:
+            return _metrics_server
+        try:
+            _metrics_server = ThreadingHTTPServer(('0.0.0.0', port), _MetricsHandler)
+        except OSError as e:
+            logging.error(f"Could not start the metrics endpoint on port {port}: {e}")
+            return None
+        threading.Thread(target=_metrics_server.serve_forever, name='kavach-metrics', daemon=True).start()
+        logging.info(f"Serving Prometheus metrics on port {port} at /metrics.")
+        return _metrics_server
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# The app modules live in the repository root and write logs and caches there on import
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+_scratch = tempfile.mkdtemp(prefix='kavach-tests-')
+os.environ.setdefault("KAVACH_LOG_FILE", os.path.join(_scratch, 'kavach.log'))
+os.environ.setdefault("KAVACH_RESPONSE_CACHE_PATH", os.path.join(_scratch, 'response_cache.sqlite3'))
+os.environ.setdefault("KAVACH_TRANSLATION_CACHE_PATH", os.path.join(_scratch, 'translation_cache.sqlite3'))
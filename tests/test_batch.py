@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+from langchain.docstore.document import Document
+import chatbot
+from api_server import QueryService
+from corpus import Corpus
+
+class FakeCorpus(Corpus):
+    def __init__(self):
+        super().__init__([])
+
+    def score_images_batch(self, query_matrix, page_ids_per_query, threshold=0.22):
+        return [[] for _ in page_ids_per_query]
+
+def _chunk(page):
+    return Document(page_content=f"Text of page {page}.", metadata={'doc_id': 'kavach', 'page': page, 'start_index': 0})
+
+def _fail_batch(*args, **kwargs):
+    raise RuntimeError("batched search failed")
+
+def _retrieve(corpus, query, query_embedding, timer=None):
+    if query == 'bad':
+        raise RuntimeError("search failed")
+    return [] if query == 'nothing' else [_chunk(len(query))]
+
+def _patch(monkeypatch):
+    embeddings = SimpleNamespace(embed_documents=lambda texts: [[1.0, 0.0] for _ in texts])
+    monkeypatch.setattr(chatbot, 'get_huggingface_embeddings', lambda: embeddings)
+    monkeypatch.setattr(chatbot, 'retrieve_batch', _fail_batch)
+    monkeypatch.setattr(chatbot, 'retrieve', _retrieve)
+    monkeypatch.setattr(chatbot, 'generate_kavach_response', lambda prompt, **kwargs: "<b>Answer</b>")
+
+def test_batch_reports_each_failed_query_on_its_own(monkeypatch):
+    _patch(monkeypatch)
+    results = {position: rest for position, *rest in chatbot.get_kavach_decision_batch(FakeCorpus(), ['good', 'bad', 'nothing'])}
+
+    assert results[0] == ["Answer", ['kavach:4'], [], {}]
+    assert results[1][0].startswith("Error processing your request: search failed")
+    assert results[1][1:] == [[], [], {}]
+    assert results[2] == [chatbot.NO_RESULTS_MESSAGE, [], [], {}]
+
+def test_batch_searches_all_queries_in_one_batched_pass(monkeypatch):
+    _patch(monkeypatch)
+    calls = []
+
+    def retrieve_batch(corpus, queries, query_matrix, timer=None):
+        calls.append(list(queries))
+        return [_retrieve(corpus, query, row) for query, row in zip(queries, query_matrix)]
+
+    def no_single_retrieval(*args, **kwargs):
+        raise AssertionError("queries were retrieved one at a time")
+
+    monkeypatch.setattr(chatbot, 'retrieve_batch', retrieve_batch)
+    monkeypatch.setattr(chatbot, 'retrieve', no_single_retrieval)
+    service = QueryService(FakeCorpus(), batch_workers=2)
+    results = service.answer_batch(['good', 'nothing', 'fine'])
+
+    assert calls == [['good', 'nothing', 'fine']]
+    assert [result['query'] for result in results] == ['good', 'nothing', 'fine']
+    assert [result['pages'] for result in results] == [['kavach:4'], [], ['kavach:4']]
+    assert results[1]['answer'] == chatbot.NO_RESULTS_MESSAGE
+
+def test_api_batch_falls_back_to_single_queries_in_request_order(monkeypatch):
+    _patch(monkeypatch)
+    service = QueryService(FakeCorpus(), batch_workers=2)
+    results = service.answer_batch(['good', 'bad'])
+
+    assert [result['query'] for result in results] == ['good', 'bad']
+    assert results[0]['answer'] == "Answer" and results[0]['pages'] == ['kavach:4']
+    assert results[1]['answer'].startswith("Error processing your request")
+    assert service.in_flight == 0 and service.served == 2
@@ -0,0 +1,29 @@
+import os
+from types import SimpleNamespace
+from corpus import Corpus, CorpusShard, parse_page_id, qualify_page
+
+def _shard(tmp_path, doc_id='kavach', ntotal=3):
+    (tmp_path / 'index.faiss').write_bytes(b"index")
+    vectorstore = SimpleNamespace(index=SimpleNamespace(ntotal=ntotal))
+    return CorpusShard({'id': doc_id, 'vectorstore': str(tmp_path)}, vectorstore, None, None)
+
+def test_page_ids_round_trip():
+    assert parse_page_id(qualify_page('gr-2020', 12)) == ('gr-2020', 12)
+
+def test_index_version_is_read_once_per_load(tmp_path):
+    shard = _shard(tmp_path)
+    version = shard.index_version
+    assert version[0] == 3
+
+    # The version is read when the shard is built, so queries never stat the file
+    index_file = tmp_path / 'index.faiss'
+    os.utime(index_file, ns=(index_file.stat().st_atime_ns, index_file.stat().st_mtime_ns + 10**9))
+    assert shard.index_version == version
+    assert Corpus([shard]).index_version == (('kavach', version),)
+
+    # A reloaded shard sees the saved index's new state
+    reloaded = CorpusShard(shard.document, shard.vectorstore, None, None)
+    assert reloaded.index_version != version
+
+def test_shard_without_vectorstore_has_no_version():
+    assert CorpusShard({'id': 'kavach', 'vectorstore': 'unused'}, None, None, None).index_version is None
@@ -0,0 +1,43 @@
+import numpy as np
+import faiss
+from langchain.embeddings.base import Embeddings
+from langchain.vectorstores import FAISS
+import embeddings
+from embeddings import _update_changed_pages
+from index_spec import MIN_VECTORS_FOR_APPROXIMATE, apply_index_spec, apply_search_params
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic 16-dimensional vectors derived from the text.
+    """
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return np.random.default_rng(abs(hash(text)) % 2**32).standard_normal(16).tolist()
+
+def test_shrinking_an_ivf_store_returns_the_flat_spec_it_was_rebuilt_to(monkeypatch):
+    monkeypatch.setattr(embeddings, 'build_page_layout', lambda *args, **kwargs: None)
+    # Two pages: page 1 holds most of the vectors, so removing it leaves too few for IVF
+    texts = [f"chunk {i} of page 1" for i in range(MIN_VECTORS_FOR_APPROXIMATE)] + [f"chunk {i} of page 2" for i in range(50)]
+    metadatas = [{'page': 1 if i < MIN_VECTORS_FOR_APPROXIMATE else 2, 'doc_id': 'kavach'} for i in range(len(texts))]
+    vectorstore = FAISS.from_texts(texts, HashEmbeddings(), metadatas=metadatas)
+    resolved_spec = apply_index_spec(vectorstore, 'ivf-flat')
+    assert resolved_spec['factory'].startswith('IVF')
+
+    page_texts = {2: "Page two text."}
+    updated, new_spec = _update_changed_pages(
+        vectorstore, None, None, page_texts, {'2': 'same'}, {'1': 'old', '2': 'same'}, resolved_spec, 'unused', 'kavach'
+    )
+
+    assert updated == 1
+    assert new_spec == {'name': 'ivf-flat', 'factory': 'Flat', 'search': {}}
+    assert isinstance(vectorstore.index, faiss.IndexFlat)
+    assert vectorstore.index.ntotal == len(vectorstore.index_to_docstore_id) == 50
+    # The saved spec must be usable on the index the next time the store is loaded
+    apply_search_params(vectorstore.index, new_spec)
+
+def test_unchanged_pages_keep_the_spec():
+    spec = {'name': 'flat', 'factory': 'Flat', 'search': {}}
+    assert _update_changed_pages(None, None, None, {}, {'1': 'a'}, {'1': 'a'}, spec, 'unused', 'kavach') == (0, spec)
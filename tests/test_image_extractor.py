@@ -0,0 +1,67 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+import fitz
+import image_extractor
+from image_extractor import extract_images
+
+class InlineExecutor(ThreadPoolExecutor):
+    """
+    Runs OCR on threads of the test process, so the patched OCR function is the one called.
+    """
+
+    def __init__(self, max_workers=None, mp_context=None, initializer=None):
+        super().__init__(max_workers=max_workers)
+
+def _write_pdf(pdf_path):
+    doc = fitz.open()
+    for color in [(255, 0, 0), (0, 0, 255)]:
+        pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 8, 8), False)
+        pixmap.set_rect(pixmap.irect, color)
+        doc.new_page().insert_image(fitz.Rect(50, 50, 150, 150), stream=pixmap.tobytes('png'))
+    doc.save(str(pdf_path))
+
+def test_ocr_errors_leave_the_page_unhashed_and_are_retried(tmp_path, monkeypatch):
+    pdf_path = tmp_path / 'guide.pdf'
+    _write_pdf(pdf_path)
+    metadata_file = tmp_path / 'image_metadata.json'
+    ocr_calls = []
+
+    def failing_ocr(image_path):
+        ocr_calls.append(image_path)
+        if 'page_2_' in image_path:
+            raise RuntimeError("EasyOCR failed")
+        return "Brake unit"
+
+    monkeypatch.setattr(image_extractor, 'ProcessPoolExecutor', InlineExecutor)
+    monkeypatch.setattr(image_extractor, 'embed_texts', lambda texts: [[1.0, 0.0] for _ in texts])
+    monkeypatch.setattr(image_extractor, 'read_image_text', failing_ocr)
+    store = extract_images(pdf_path, tmp_path / 'images', metadata_file=metadata_file, max_workers=1)
+
+    assert len(store) == 2 and store.embedded_count == 1
+    hashes = json.loads(metadata_file.with_suffix('.hashes.json').read_text())
+    assert set(hashes) == {'1'}
+    assert not metadata_file.with_suffix('.fingerprint.json').exists()
+    journaled = metadata_file.with_suffix('.journal.jsonl').read_text()
+    assert 'page_1_img_1' in journaled and 'page_2_img_1' not in journaled
+
+    # The next run redoes only the failed page, then records every hash and drops the journal
+    ocr_calls.clear()
+    monkeypatch.setattr(image_extractor, 'read_image_text', lambda image_path: ocr_calls.append(image_path) or "Signal")
+    store = extract_images(pdf_path, tmp_path / 'images', metadata_file=metadata_file, max_workers=1)
+
+    assert [path.rsplit('/', 1)[1] for path in ocr_calls] == ['page_2_img_1.png']
+    assert store.embedded_count == 2
+    assert set(json.loads(metadata_file.with_suffix('.hashes.json').read_text())) == {'1', '2'}
+    assert not metadata_file.with_suffix('.journal.jsonl').exists()
+
+def test_images_without_text_are_kept_without_a_retry(tmp_path, monkeypatch):
+    pdf_path = tmp_path / 'guide.pdf'
+    _write_pdf(pdf_path)
+    metadata_file = tmp_path / 'image_metadata.json'
+    monkeypatch.setattr(image_extractor, 'ProcessPoolExecutor', InlineExecutor)
+    monkeypatch.setattr(image_extractor, 'embed_texts', lambda texts: [[1.0, 0.0] for _ in texts])
+    monkeypatch.setattr(image_extractor, 'read_image_text', lambda image_path: "")
+    store = extract_images(pdf_path, tmp_path / 'images', metadata_file=metadata_file, max_workers=1)
+
+    assert len(store) == 2 and store.embedded_count == 0
+    assert set(json.loads(metadata_file.with_suffix('.hashes.json').read_text())) == {'1', '2'}
@@ -0,0 +1,58 @@
+import numpy as np
+from image_store import ImageStore, _PageRanges, write_image_store
+
+def _records(tmp_path):
+    return [
+        {'page': 5, 'path': str(tmp_path / 'page_5_img_1.png'), 'ocr_text': "", 'vector': None},
+        {'page': 2, 'path': str(tmp_path / 'page_2_img_1.png'), 'ocr_text': "Brake unit", 'vector': [3.0, 4.0]},
+        {'page': 5, 'path': str(tmp_path / 'page_5_img_2.png'), 'ocr_text': "Signal aspect", 'vector': [0.0, 2.0]},
+        {'page': 2, 'path': str(tmp_path / 'page_2_img_2.png'), 'ocr_text': "RFID tag विवरण", 'vector': [1.0, 0.0]},
+    ]
+
+def test_round_trip_sorts_by_page_and_normalizes_vectors(tmp_path):
+    store_file = tmp_path / 'image_metadata.store'
+    write_image_store(store_file, _records(tmp_path))
+    store = ImageStore(store_file)
+
+    assert len(store) == 4 and store.dim == 2 and store.embedded_count == 3
+    records = list(store.records())
+    assert [(record['page'], record['path']) for record in records] == [
+        (2, str(tmp_path / 'page_2_img_1.png')),
+        (2, str(tmp_path / 'page_2_img_2.png')),
+        # Embedded images come first within a page
+        (5, str(tmp_path / 'page_5_img_2.png')),
+        (5, str(tmp_path / 'page_5_img_1.png')),
+    ]
+    assert records[1]['ocr_text'] == "RFID tag विवरण"
+    np.testing.assert_allclose(records[0]['vector'], [0.6, 0.8], rtol=1e-6)
+    assert records[3]['vector'] is None
+    assert [record['page'] for record in store.records(pages=['5'])] == [5, 5]
+    assert store.page_images()['5'][1] == {'path': str(tmp_path / 'page_5_img_1.png'), 'ocr_text': ""}
+
+def test_page_ranges_cover_only_embedded_images(tmp_path):
+    store_file = tmp_path / 'image_metadata.store'
+    records = _records(tmp_path) + [{'page': 9, 'path': str(tmp_path / 'page_9_img_1.png'), 'ocr_text': "", 'vector': None}]
+    write_image_store(store_file, records)
+    page_ranges = _PageRanges(ImageStore(store_file))
+
+    assert page_ranges.get('2') == [0, 2]
+    assert page_ranges.get(5) == [2, 3]
+    assert page_ranges.get('9') is None
+    assert page_ranges.get('7', default=[]) == []
+
+def test_image_index_scores_against_the_mapped_vectors(tmp_path):
+    store_file = tmp_path / 'image_metadata.store'
+    write_image_store(store_file, _records(tmp_path))
+    image_index = ImageStore(store_file).image_index()
+
+    assert image_index.relevant_images([1.0, 0.0], [2, 5], threshold=0.5) == [str(tmp_path / 'page_2_img_1.png'), str(tmp_path / 'page_2_img_2.png')]
+    assert image_index.relevant_images_batch(np.asarray([[0.0, 1.0], [1.0, 0.0]]), [[5], [5]], threshold=0.5) == [
+        [str(tmp_path / 'page_5_img_2.png')], []
+    ]
+
+def test_empty_store(tmp_path):
+    store_file = tmp_path / 'image_metadata.store'
+    write_image_store(store_file, [])
+    store = ImageStore(store_file)
+    assert len(store) == 0 and list(store.records()) == []
+    assert store.image_index().relevant_images([1.0, 0.0], [1]) == []
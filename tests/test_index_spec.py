@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip('faiss')
+from index_spec import apply_index_spec, resolve_spec, supports_removal, to_flat, build_index
+
+class FakeVectorStore:
+    """
+    Mirrors how LangChain's FAISS store deletes: remove_ids by position, then renumber the docstore mapping by position.
+    """
+
+    def __init__(self, index, ids):
+        self.index = index
+        self.index_to_docstore_id = dict(enumerate(ids))
+
+    def delete(self, ids):
+        positions = {position for position, docstore_id in self.index_to_docstore_id.items() if docstore_id in set(ids)}
+        self.index.remove_ids(np.asarray(sorted(positions), dtype=np.int64))
+        remaining = [docstore_id for position, docstore_id in sorted(self.index_to_docstore_id.items()) if position not in positions]
+        self.index_to_docstore_id = dict(enumerate(remaining))
+
+    def add(self, vectors, ids):
+        start = self.index.ntotal
+        self.index.add(vectors)
+        self.index_to_docstore_id.update({start + i: docstore_id for i, docstore_id in enumerate(ids)})
+
+def _vectors(n, d=32, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, d)).astype(np.float32)
+
+@pytest.mark.parametrize('spec', ['flat', 'ivf-flat', 'hnsw', 'ivf-pq'])
+def test_only_flat_supports_removal(spec):
+    resolved = resolve_spec(spec, 2000, 32)
+    assert supports_removal(resolved) == (resolved['factory'] == 'Flat')
+
+def test_ivf_update_keeps_docstore_mapping():
+    vectors = _vectors(2000)
+    resolved = resolve_spec('ivf-flat', len(vectors), vectors.shape[1])
+    store = FakeVectorStore(build_index(vectors, resolved), [f"chunk-{i}" for i in range(len(vectors))])
+    docstore_vectors = {f"chunk-{i}": vector for i, vector in enumerate(vectors)}
+
+    # The same path as embeddings._update_changed_pages for an index that cannot remove in place
+    stale_ids = [f"chunk-{i}" for i in range(10)]
+    assert not supports_removal(resolved)
+    to_flat(store)
+    store.delete(stale_ids)
+    added = _vectors(10, seed=1)
+    store.add(added, [f"new-{i}" for i in range(10)])
+    docstore_vectors.update({f"new-{i}": vector for i, vector in enumerate(added)})
+    apply_index_spec(store, 'ivf-flat')
+
+    assert store.index.ntotal == len(store.index_to_docstore_id) == 2000
+    store.index.nprobe = store.index.nlist  # exhaustive probing, so any miss is a mapping error
+    for docstore_id in ['chunk-10', 'chunk-1990', 'chunk-1999', 'new-0', 'new-9']:
+        _, labels = store.index.search(docstore_vectors[docstore_id][None, :], 1)
+        assert store.index_to_docstore_id[int(labels[0][0])] == docstore_id
@@ -0,0 +1,60 @@
+import os
+import fitz
+import numpy as np
+from langchain.embeddings.base import Embeddings
+import ingest
+from ingest import add_chunks_in_batches, load_pdf_fingerprint, pdf_fingerprint, read_page_texts, save_pdf_fingerprint
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.batches = []
+
+    def embed_documents(self, texts):
+        self.batches.append(len(texts))
+        return [np.random.default_rng(len(text)).standard_normal(8).tolist() for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+def _write_pdf(pdf_path, page_count, blank=()):
+    doc = fitz.open()
+    for page_num in range(1, page_count + 1):
+        page = doc.new_page()
+        if page_num not in blank:
+            page.insert_text((72, 72), f"Text of page {page_num}")
+    doc.save(str(pdf_path))
+
+def test_page_texts_are_complete_and_in_order_across_task_ranges(tmp_path, monkeypatch):
+    pdf_path = tmp_path / 'guide.pdf'
+    _write_pdf(pdf_path, 10, blank={6})
+    monkeypatch.setattr(ingest, 'PAGES_PER_TASK', 3)
+
+    parts = list(ingest.iter_page_texts(pdf_path, 10, max_workers=2))
+    assert len(parts) == 4
+
+    page_texts = read_page_texts(pdf_path, 10, max_workers=2)
+    assert list(page_texts) == [1, 2, 3, 4, 5, 7, 8, 9, 10]
+    assert all(page_texts[page].strip() == f"Text of page {page}" for page in page_texts)
+
+def test_chunks_are_embedded_and_added_in_fixed_size_batches():
+    embeddings = CountingEmbeddings()
+    chunks = ({'text': f"chunk {i}", 'page': i} for i in range(10))
+    vectorstore = add_chunks_in_batches(None, chunks, embeddings, lambda chunk: {'page': chunk['page']}, batch_size=4)
+
+    assert embeddings.batches == [4, 4, 2]
+    assert vectorstore.index.ntotal == len(vectorstore.index_to_docstore_id) == 10
+    assert add_chunks_in_batches(None, iter([]), embeddings, dict, batch_size=4) is None
+
+def test_pdf_fingerprint_round_trip_and_change(tmp_path):
+    pdf_path = tmp_path / 'guide.pdf'
+    _write_pdf(pdf_path, 1)
+    fingerprint_file = tmp_path / 'pdf_fingerprint.json'
+    assert load_pdf_fingerprint(fingerprint_file) is None
+
+    fingerprint = pdf_fingerprint(pdf_path)
+    save_pdf_fingerprint(fingerprint_file, fingerprint)
+    assert load_pdf_fingerprint(fingerprint_file) == fingerprint
+
+    stat = pdf_path.stat()
+    os.utime(pdf_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert pdf_fingerprint(pdf_path) != fingerprint
@@ -0,0 +1,20 @@
+import time
+from pipeline import StageTimer
+
+def test_cumulative_stage_adds_up_repeated_entries():
+    timer = StageTimer()
+    for _ in range(3):
+        with timer.stage('sanitize', nested=True, cumulative=True):
+            time.sleep(0.01)
+        time.sleep(0.02)
+    seconds = timer.durations()['sanitize']
+    assert 0.03 <= seconds < 0.06
+
+def test_nested_stages_are_not_summed_twice():
+    timer = StageTimer()
+    with timer.stage('generate'):
+        with timer.stage('sanitize', nested=True):
+            time.sleep(0.02)
+    report = timer.report()
+    assert set(report['stages']) == {'generate', 'sanitize'}
+    assert report['summed_seconds'] == report['stages']['generate']
@@ -0,0 +1,36 @@
+from langchain.docstore.document import Document
+from prompt_builder import build_context, estimate_tokens
+
+PAGE_TEXT = "Kavach applies brakes automatically when the loco pilot fails to act on a danger signal ahead."
+
+def _chunk(start, end, page=1, doc_id='kavach', with_offset=True):
+    metadata = {'doc_id': doc_id, 'page': page}
+    if with_offset:
+        metadata['start_index'] = start
+    return Document(page_content=PAGE_TEXT[start:end], metadata=metadata)
+
+def test_overlapping_chunks_on_a_page_merge_into_one_section():
+    context, stats = build_context([_chunk(40, len(PAGE_TEXT)), _chunk(0, 60)], token_budget=1000)
+    assert context == f"[Source: kavach, page 1]\n{PAGE_TEXT}"
+    assert stats['chunks'] == 2 and stats['sections'] == 1
+
+def test_chunks_without_offsets_are_deduplicated_by_content():
+    context, stats = build_context([_chunk(0, len(PAGE_TEXT), with_offset=False), _chunk(10, 50, with_offset=False)], token_budget=1000)
+    assert context.count("applies brakes") == 1
+    assert stats['sections'] == 1
+
+def test_sections_are_ordered_by_page_and_most_relevant_kept_within_budget():
+    long_text = "word " * 400
+    docs = [
+        Document(page_content="Most relevant, on page 7.", metadata={'doc_id': 'kavach', 'page': 7, 'start_index': 0}),
+        Document(page_content=long_text, metadata={'doc_id': 'kavach', 'page': 2, 'start_index': 0}),
+        Document(page_content="Least relevant, on page 1.", metadata={'doc_id': 'kavach', 'page': 1, 'start_index': 0}),
+    ]
+    context, stats = build_context(docs, token_budget=100)
+
+    # Page 7 fits whole, page 2 is cut to the rest of the budget and page 1 no longer fits
+    assert context.index("page 2]") < context.index("page 7]")
+    assert "page 1]" not in context
+    assert stats['sections'] == 2
+    assert stats['dropped_tokens'] > 0
+    assert estimate_tokens(context) <= 100 + 20  # the source labels are outside the budget
@@ -0,0 +1,30 @@
+from types import SimpleNamespace
+from langchain.docstore.document import Document
+from retrieval import BM25Index, _fuse, _keyed, tokenize
+
+def test_tokenize_keeps_identifiers_whole():
+    assert tokenize("Clause 4.2.1: RFID-12 tags, SoS/SR mode") == ['clause', '4.2.1', 'rfid-12', 'tags', 'sos/sr', 'mode']
+
+def test_bm25_ranks_rarer_and_denser_matches_first():
+    bm25 = BM25Index.build(['a', 'b', 'c'], [
+        "brake test procedure for the loco",
+        "brake brake interface unit",
+        "station kavach unit",
+    ])
+    results = bm25.search("brake interface", k=3)
+    assert [docstore_id for docstore_id, _ in results] == ['b', 'a']
+    assert results[0][1] > results[1][1] > 0
+
+def test_bm25_returns_nothing_without_matching_terms():
+    assert BM25Index.build(['a'], ["brake test"]).search("signal", k=5) == []
+    assert BM25Index.build([], []).search("brake", k=5) == []
+
+def test_fusion_keeps_identical_text_on_different_pages_apart():
+    shard = SimpleNamespace(doc_id='kavach')
+    page_3 = Document(page_content="Refer to Annexure A.", metadata={'doc_id': 'kavach', 'page': 3, 'start_index': 0})
+    page_9 = Document(page_content="Refer to Annexure A.", metadata={'doc_id': 'kavach', 'page': 9, 'start_index': 0})
+    other = Document(page_content="Loco unit", metadata={'doc_id': 'kavach', 'page': 3, 'start_index': 400})
+
+    fused = _fuse([_keyed(shard, [page_3, other]), _keyed(shard, [page_9, page_3])])
+    # The chunk found by both searches ranks first; page 9's copy is a separate candidate
+    assert fused == [page_3, page_9, other]
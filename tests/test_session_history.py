@@ -0,0 +1,58 @@
+from session_history import SessionHistory, _trim_summary, extractive_summary
+
+def _turn(number):
+    return {
+        'query': f"Question {number}?", 'answer': f"Answer {number}.",
+        'query_english': f"Question {number}?", 'answer_english': f"Answer {number}.",
+        'pages': [], 'highlights': {}, 'images': [],
+    }
+
+def _settled(history):
+    # Summaries run in the background; wait for the one in flight, then fold in anything left
+    while history._summary_future is not None:
+        history._summary_future.result()
+        history.summary_text()
+    return history.summary_text()
+
+def test_window_keeps_recent_turns_and_summarizes_the_rest():
+    history = SessionHistory(window=2)
+    for number in range(1, 6):
+        history.add_turn(_turn(number))
+
+    assert len(history) == 5 and history.earlier_turns == 3
+    assert [turn['query'] for turn in history.turns] == ["Question 4?", "Question 5?"]
+    assert _settled(history) == "Earlier questions:\n- Question 1?\n- Question 2?\n- Question 3?"
+
+def test_llm_summary_is_used_and_failures_fall_back_to_the_questions():
+    prompts = []
+
+    def llm(prompt):
+        prompts.append(prompt)
+        return "  Discussed question 1.  "
+
+    history = SessionHistory(window=1, llm=llm)
+    history.add_turn(_turn(1))
+    history.add_turn(_turn(2))
+    assert _settled(history) == "Discussed question 1."
+    assert "User: Question 1?" in prompts[0]
+
+    def broken(prompt):
+        raise RuntimeError("quota")
+
+    history = SessionHistory(window=1, llm=broken)
+    history.add_turn(_turn(1))
+    history.add_turn(_turn(2))
+    assert _settled(history) == "Earlier questions:\n- Question 1?"
+
+def test_summary_is_bounded_from_the_oldest_end():
+    assert _trim_summary("first line\nsecond line\nthird", max_chars=15) == "third"
+    turns = [_turn(number) for number in range(500)]
+    assert len(extractive_summary("", turns)) <= 1200
+    assert extractive_summary("", turns).endswith("- Question 499?")
+
+def test_condense_rewrites_follow_ups_only_when_enabled():
+    history = SessionHistory(window=3, llm=lambda prompt: "What does Kavach do at a red signal?\nextra")
+    assert history.condense("And at red?", turns=1) == "And at red?"  # no history yet
+    history.add_turn(_turn(1))
+    assert history.condense("And at red?", turns=1) == "What does Kavach do at a red signal?"
+    assert history.condense("And at red?", turns=0) == "And at red?"
@@ -0,0 +1,48 @@
+import itertools
+import translation
+from translation import TranslationCache, TranslationService, detect_language
+
+class CountingBackend:
+    def __init__(self):
+        self.calls = []
+
+    def translate_batch(self, texts, dest, src='auto'):
+        self.calls.append(list(texts))
+        return [f"{dest}:{text}" for text in texts]
+
+def _tick(monkeypatch):
+    # Distinct access times, so recency is well defined however fast the test runs
+    clock = itertools.count(1)
+    monkeypatch.setattr(translation.time, 'time', lambda: float(next(clock)))
+
+def test_cache_evicts_least_recently_used(monkeypatch):
+    _tick(monkeypatch)
+    cache = TranslationCache(path=None, max_entries=2)
+    cache.set_many('hi', {'a': "A"})
+    cache.set_many('hi', {'b': "B"})
+    assert cache.get_many(['a']) == {'a': "A"}  # 'a' is now more recent than 'b'
+    cache.set_many('hi', {'c': "C"})
+
+    assert cache.get_many(['a', 'b', 'c']) == {'a': "A", 'c': "C"}
+    assert cache.stats() == {'entries': 2, 'max_entries': 2}
+
+def test_zero_size_cache_stores_nothing():
+    cache = TranslationCache(path=None, max_entries=0)
+    cache.set_many('hi', {'a': "A"})
+    assert cache.get_many(['a']) == {}
+
+def test_service_sends_only_uncached_strings_once(monkeypatch):
+    _tick(monkeypatch)
+    backend = CountingBackend()
+    service = TranslationService(backend, TranslationCache(path=None, max_entries=10))
+
+    assert service.translate_many(["Brake", "Signal", "Brake", " "], 'hi') == ["hi:Brake", "hi:Signal", "hi:Brake", " "]
+    assert service.translate_many(["Signal", "Loco"], 'hi') == ["hi:Signal", "hi:Loco"]
+    assert backend.calls == [["Brake", "Signal"], ["Loco"]]
+
+def test_text_already_in_the_target_script_is_not_translated():
+    backend = CountingBackend()
+    service = TranslationService(backend, TranslationCache(path=None, max_entries=10))
+    assert detect_language("कवच प्रणाली") == 'hi'
+    assert service.translate("कवच प्रणाली", 'hi') == "कवच प्रणाली"
+    assert backend.calls == []
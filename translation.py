@@ -0,0 +1,303 @@
+"""
+Translation with a persistent cache, batching and pluggable backends.
+
+Every translated string is cached under (source, target language, text), so repeated phrases and
+answers are translated once. Several strings for the same target language go to the backend in
+one call, and only the ones missing from the cache are sent.
+
+Settings:
+    KAVACH_TRANSLATION_BACKEND            'googletrans' (default), 'local' (an offline NLLB model via
+                                          transformers), 'stub' (offline_stubs.StubTranslator) or 'none'
+    KAVACH_TRANSLATION_MODEL              model used by the local backend
+    KAVACH_TRANSLATION_CACHE_PATH         SQLite file for the cache; empty keeps it in memory
+    KAVACH_TRANSLATION_CACHE_MAX_ENTRIES  cached strings kept, least recently used evicted first; 0 disables
+"""
+import os
+from pathlib import Path
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+from telemetry import configure_logging, metrics
+
+# Set Base Directory
+BASE_DIR = Path(__file__).parent
+
+# Configure logging
+configure_logging()
+
+TRANSLATION_BACKEND = os.getenv("KAVACH_TRANSLATION_BACKEND", "googletrans")
+TRANSLATION_MODEL = os.getenv("KAVACH_TRANSLATION_MODEL", "facebook/nllb-200-distilled-600M")
+TRANSLATION_CACHE_PATH = os.getenv("KAVACH_TRANSLATION_CACHE_PATH", str(BASE_DIR / 'translation_cache.sqlite3'))
+TRANSLATION_CACHE_MAX_ENTRIES = int(os.getenv("KAVACH_TRANSLATION_CACHE_MAX_ENTRIES", 20000))
+
+# Unicode blocks of the scripts the UI offers; anything else is treated as English
+SCRIPT_RANGES = {
+    'hi': (0x0900, 0x097F),  # Devanagari
+    'ta': (0x0B80, 0x0BFF),
+    'te': (0x0C00, 0x0C7F),
+    'kn': (0x0C80, 0x0CFF),
+}
+# FLORES-200 codes used by NLLB models
+NLLB_CODES = {'en': 'eng_Latn', 'hi': 'hin_Deva', 'ta': 'tam_Taml', 'te': 'tel_Telu', 'kn': 'kan_Knda'}
+
+# A sentence ends at terminal punctuation followed by whitespace, or at a line break
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?।:])[ \t]+|\n+')
+
+def detect_language(text):
+    """
+    Returns the language whose script most of the letters in `text` are written in, or 'en'.
+    """
+    counts = dict.fromkeys(SCRIPT_RANGES, 0)
+    for char in text:
+        code = ord(char)
+        for language, (low, high) in SCRIPT_RANGES.items():
+            if low <= code <= high:
+                counts[language] += 1
+                break
+    language, count = max(counts.items(), key=lambda item: item[1])
+    letters = sum(1 for char in text if char.isalpha())
+    return language if letters and count * 2 >= letters else 'en'
+
+class GoogleTransBackend:
+    """
+    The googletrans client; a list of strings is translated in one request.
+    """
+
+    def __init__(self):
+        from googletrans import Translator
+        self._translator = Translator()
+
+    def translate_batch(self, texts, dest, src='auto'):
+        return [result.text for result in self._translator.translate(list(texts), dest=dest, src=src)]
+
+class LocalBackend:
+    """
+    An NLLB translation model run locally through transformers, for deployments without network access.
+    The model needs the source language, so 'auto' is resolved from the script of each string.
+    """
+
+    def __init__(self, model_name=TRANSLATION_MODEL):
+        from transformers import pipeline
+        self._pipeline = pipeline('translation', model=model_name)
+        self._lock = threading.Lock()
+        logging.info(f"Loaded local translation model '{model_name}'.")
+
+    def translate_batch(self, texts, dest, src='auto'):
+        by_source = {}
+        for position, text in enumerate(texts):
+            by_source.setdefault(detect_language(text) if src == 'auto' else src, []).append(position)
+
+        translations = list(texts)
+        for source, positions in by_source.items():
+            if source == dest:
+                continue
+            with self._lock:
+                results = self._pipeline(
+                    [texts[position] for position in positions],
+                    src_lang=NLLB_CODES[source],
+                    tgt_lang=NLLB_CODES[dest],
+                    max_length=1024
+                )
+            for position, result in zip(positions, results):
+                translations[position] = result['translation_text']
+        return translations
+
+class StubBackend:
+    """
+    offline_stubs.StubTranslator behind the backend interface, for benchmarks and offline runs.
+    """
+
+    def __init__(self, translator=None):
+        from offline_stubs import StubTranslator
+        self._translator = translator or StubTranslator()
+
+    def translate_batch(self, texts, dest, src='auto'):
+        return [result.text for result in self._translator.translate(list(texts), dest=dest, src=src)]
+
+class NullBackend:
+    """
+    Leaves text untranslated; used when translation is disabled.
+    """
+
+    def translate_batch(self, texts, dest, src='auto'):
+        return list(texts)
+
+TRANSLATION_BACKENDS = {
+    'googletrans': GoogleTransBackend,
+    'local': LocalBackend,
+    'stub': StubBackend,
+    'none': NullBackend,
+}
+
+def _count_lookup(result, count=1):
+    metrics.increment('kavach_cache_lookups_total', count, help_text="Cache lookups by cache and result.", cache='translation', result=result)
+
+class TranslationCache:
+    """
+    LRU cache of translations in SQLite, on disk so it survives restarts and is shared by worker processes.
+    """
+
+    def __init__(self, path=TRANSLATION_CACHE_PATH, max_entries=TRANSLATION_CACHE_MAX_ENTRIES):
+        self.path = path or ':memory:'
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            "key TEXT PRIMARY KEY, dest TEXT NOT NULL, translation TEXT NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS translations_accessed_at ON translations (accessed_at)")
+        self._conn.commit()
+        logging.info(f"Opened translation cache at '{self.path}'.")
+
+    @staticmethod
+    def key(text, dest, src):
+        return hashlib.sha256(f"{src}\n{dest}\n{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, keys):
+        """
+        Returns {key: translation} for the keys that are cached.
+        """
+        if self.max_entries <= 0 or not keys:
+            return {}
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._conn.execute(f"SELECT key, translation FROM translations WHERE key IN ({placeholders})", list(keys)).fetchall()
+            if rows:
+                self._conn.execute(
+                    f"UPDATE translations SET accessed_at = ? WHERE key IN ({','.join('?' * len(rows))})",
+                    [time.time()] + [key for key, _ in rows]
+                )
+                self._conn.commit()
+        return dict(rows)
+
+    def set_many(self, dest, translations):
+        """
+        Stores {key: translation}, then evicts the least recently used entries beyond the size limit.
+        """
+        if self.max_entries <= 0 or not translations:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO translations (key, dest, translation, accessed_at) VALUES (?, ?, ?, ?)",
+                [(key, dest, translation, now) for key, translation in translations.items()]
+            )
+            self._conn.execute(
+                "DELETE FROM translations WHERE key IN (SELECT key FROM translations ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        return {'entries': entries, 'max_entries': self.max_entries}
+
+class TranslationService:
+    """
+    Translates strings through the cache, sending only the misses to the backend, in one call per target language.
+    """
+
+    def __init__(self, backend, cache):
+        self.backend = backend
+        self.cache = cache
+
+    def translate_many(self, texts, dest, src='auto'):
+        """
+        Returns the translations of `texts` into `dest`, in order. Blank strings, and strings already
+        written in the script of an Indic target language, are returned as they are.
+        """
+        translations = list(texts)
+        pending = {}
+        for position, text in enumerate(texts):
+            # Indic scripts identify their language; Latin text may be romanized, so it is always translated
+            if text.strip() and not (dest in SCRIPT_RANGES and detect_language(text) == dest):
+                pending.setdefault(TranslationCache.key(text, dest, src), []).append(position)
+        if not pending:
+            return translations
+
+        cached = self.cache.get_many(list(pending))
+        misses = [key for key in pending if key not in cached]
+        if len(misses) < len(pending):
+            _count_lookup('hit', len(pending) - len(misses))
+        if misses:
+            _count_lookup('miss', len(misses))
+            start = time.perf_counter()
+            results = self.backend.translate_batch([texts[pending[key][0]] for key in misses], dest=dest, src=src)
+            metrics.observe('kavach_translation_seconds', time.perf_counter() - start, help_text="Time spent in the translation backend per batch.")
+            fresh = dict(zip(misses, results))
+            self.cache.set_many(dest, fresh)
+            cached.update(fresh)
+
+        for key, positions in pending.items():
+            for position in positions:
+                translations[position] = cached[key]
+        return translations
+
+    def translate(self, text, dest, src='auto'):
+        return self.translate_many([text], dest, src)[0]
+
+def get_translation_service(backend=TRANSLATION_BACKEND):
+    """
+    Creates the translation service configured by KAVACH_TRANSLATION_BACKEND. The backend is loaded here,
+    so call this lazily; an unusable cache file falls back to an in-memory cache.
+    """
+    if backend not in TRANSLATION_BACKENDS:
+        raise ValueError(f"Unknown translation backend '{backend}'. Choose one of {', '.join(TRANSLATION_BACKENDS)}.")
+    try:
+        cache = TranslationCache()
+    except Exception as e:
+        logging.error(f"Error opening translation cache, falling back to memory: {e}")
+        cache = TranslationCache(path=None)
+    return TranslationService(TRANSLATION_BACKENDS[backend](), cache)
+
+class StreamingTranslation:
+    """
+    Translates a streamed answer sentence by sentence while it is still being generated. Each call to
+    feed() sends the sentences completed since the last call as one batch on `submit`; finish() sends
+    the rest and joins the translated sentences with their original separators.
+    """
+
+    def __init__(self, service, dest, submit):
+        self.service = service
+        self.dest = dest
+        self.submit = submit
+        self._consumed = ""
+        self._parts = []
+
+    def _send(self, segments):
+        sentences = [sentence for sentence, _ in segments]
+        self._parts.append((self.submit(self.service.translate_many, sentences, self.dest), [separator for _, separator in segments]))
+
+    def feed(self, text):
+        """
+        Takes the answer so far. If it no longer extends what was already sent, translation restarts.
+        """
+        if not text.startswith(self._consumed):
+            self._consumed, self._parts = "", []
+        segments = []
+        position = len(self._consumed)
+        for match in SENTENCE_BOUNDARY.finditer(text, position):
+            segments.append((text[position:match.start()], match.group()))
+            position = match.end()
+        if segments:
+            self._send(segments)
+            self._consumed = text[:position]
+
+    def finish(self, text):
+        """
+        Returns the translation of the complete answer `text`.
+        """
+        self.feed(text)
+        if len(text) > len(self._consumed):
+            self._send([(text[len(self._consumed):], "")])
+        translated = []
+        for future, separators in self._parts:
+            for sentence, separator in zip(future.result(), separators):
+                translated.append(sentence + separator)
+        return "".join(translated)
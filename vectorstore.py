@@ -2,25 +2,20 @@ import os
 from pathlib import Path
 import joblib
 from joblib import load
-from langchain.embeddings import HuggingFaceEmbeddings
 from langchain.vectorstores import FAISS
 from image_extractor import extract_images
+from embedding_handler import LazyEmbeddings
 import logging
+from telemetry import configure_logging
 
 # Set Base Directory
 BASE_DIR = Path(__file__).parent
 
-# Initialize HuggingFace Embeddings
-embeddings = HuggingFaceEmbeddings(model_name='sentence-transformers/all-MiniLM-L6-v2')
+# Shared HuggingFace Embeddings, loaded on first use
+embeddings = LazyEmbeddings()
 
 # Configure logging
-log_file = BASE_DIR / 'vectorstore.log'
-logging.basicConfig(
-    filename=log_file,
-    filemode='a',
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+configure_logging()
 
 def create_or_load_vectorstore(pdf_path, vectorstore_path):
     pdf_path = Path(pdf_path)
@@ -40,7 +35,7 @@ def create_or_load_vectorstore(pdf_path, vectorstore_path):
         else:
             # Extract text and images from the PDF
             logging.info(f"Extracting text and images from '{pdf_path}'...")
-            page_images = extract_images(pdf_path, images_dir, metadata_file=metadata_file)
+            page_images = extract_images(pdf_path, images_dir, metadata_file=metadata_file).page_images()
 
             # Create new vector store
             texts = [image['ocr_text'] for page in page_images.values() for image in page if image['ocr_text']]